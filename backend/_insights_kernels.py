@@ -0,0 +1,53 @@
+"""
+Scalar-loop class-insights kernels for analytics.py, written in the numba nopython subset.
+
+Same arrangement as _irt_kernels: analytics.py prefers the ahead-of-time
+``_insights_kernels_aot`` extension (no JIT warmup on the first class-insights
+request after a cold start), then numba.njit at import time, then NumPy.
+
+Build the extension from backend/ (numba is only needed at build time):
+    python _insights_kernels.py
+"""
+
+import os
+
+# name -> numba signature for the AOT build
+EXPORTS = {
+    "classify_students": "UniTuple(i8, 3)(f4[:], f8[:], i8[:], i8[:])",
+}
+
+
+def classify_students(velocities, predicted, beginner_counts, out_idx):
+    """
+    Velocity buckets and intervention candidates in two compare-and-count loops.
+    Writes the indices of students needing intervention to the front of out_idx
+    (sized like predicted) and returns (improving, declining, number written);
+    a predicted score of 0 means "no prediction".
+    """
+    improving = 0
+    declining = 0
+    for i in range(velocities.shape[0]):
+        v = velocities[i]
+        if v > 0.01:
+            improving += 1
+        elif v < -0.01:
+            declining += 1
+
+    k = 0
+    for i in range(predicted.shape[0]):
+        p = predicted[i]
+        if beginner_counts[i] >= 2 or (p != 0 and p < 50):
+            out_idx[k] = i
+            k += 1
+    return improving, declining, k
+
+
+if __name__ == "__main__":
+    from numba.pycc import CC  # type: ignore[import-not-found]
+
+    cc = CC("_insights_kernels_aot")
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+    cc.verbose = True
+    for _name, _signature in EXPORTS.items():
+        cc.export(_name, _signature)(globals()[_name])
+    cc.compile()
@@ -0,0 +1,93 @@
+"""
+Scalar-loop IRT kernels for analytics.py, written in the numba nopython subset.
+
+analytics.py uses them in one of two ways:
+- ahead-of-time compiled into the ``_irt_kernels_aot`` extension, which avoids
+  JIT warmup on the first competency request after a cold start;
+- numba.njit-compiled at import time when numba is installed but the extension
+  has not been built.
+Without numba, analytics.py keeps its NumPy implementation.
+
+Build the extension from backend/ (numba is only needed at build time):
+    python _irt_kernels.py
+"""
+
+import math
+import os
+
+import numpy as np  # type: ignore[import-not-found]
+
+# name -> numba signature for the AOT build
+EXPORTS = {
+    "irt_3pl_probs": "f8[:](f8, f8[:], f8[:], f8[:])",
+    "theta_nll": "f8(f8, f8[:], f8[:], f8[:], b1[:])",
+    "theta_newton": "f8(f8[:], f8[:], f8[:], b1[:], f8, f8, i8, f8)",
+}
+
+
+def irt_3pl_probs(theta, a, b, c):
+    """3PL probability for one theta against arrays of item parameters."""
+    n = a.shape[0]
+    out = np.empty(n)
+    for i in range(n):
+        z = a[i] * (theta - b[i])
+        z = -20.0 if z < -20.0 else (20.0 if z > 20.0 else z)
+        out[i] = c[i] + (1.0 - c[i]) / (1.0 + math.exp(-z))
+    return out
+
+
+def theta_nll(theta, a, b, c, y):
+    """Negative 3PL log-likelihood of the responses y at ability theta."""
+    total = 0.0
+    for i in range(a.shape[0]):
+        z = a[i] * (theta - b[i])
+        z = -20.0 if z < -20.0 else (20.0 if z > 20.0 else z)
+        p = c[i] + (1.0 - c[i]) / (1.0 + math.exp(-z))
+        p = 1e-10 if p < 1e-10 else (1.0 - 1e-10 if p > 1.0 - 1e-10 else p)
+        total += math.log(p) if y[i] else math.log1p(-p)
+    return -total
+
+
+def theta_newton(a, b, c, y, low, high, max_iter, tol):
+    """
+    Newton-Raphson theta MLE, same steps as analytics._estimate_theta_newton.
+    Returns NaN when it has not converged so the caller can fall back to Brent.
+    """
+    theta = 0.0
+    for _ in range(max_iter):
+        grad = 0.0
+        hess = 0.0
+        info = 0.0
+        for i in range(a.shape[0]):
+            z = a[i] * (theta - b[i])
+            z = -20.0 if z < -20.0 else (20.0 if z > 20.0 else z)
+            p = c[i] + (1.0 - c[i]) / (1.0 + math.exp(-z))
+            p = 1e-10 if p < 1e-10 else (1.0 - 1e-10 if p > 1.0 - 1e-10 else p)
+            dp = a[i] * (p - c[i]) * (1.0 - p) / (1.0 - c[i])
+            residual = (1.0 if y[i] else 0.0) - p
+            grad += residual * dp / (p * (1.0 - p))
+            hess += a[i] * dp * (residual * c[i] / (p * p) - (p - c[i]) / p) / (1.0 - c[i])
+            info += dp * dp / (p * (1.0 - p))
+        if hess < 0.0:
+            step = -grad / hess
+        elif info > 0.0:
+            step = grad / info
+        else:
+            return math.nan
+
+        next_theta = min(max(theta + step, low), high)
+        if abs(next_theta - theta) < tol:
+            return next_theta
+        theta = next_theta
+    return math.nan
+
+
+if __name__ == "__main__":
+    from numba.pycc import CC  # type: ignore[import-not-found]
+
+    cc = CC("_irt_kernels_aot")
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+    cc.verbose = True
+    for _name, _signature in EXPORTS.items():
+        cc.export(_name, _signature)(globals()[_name])
+    cc.compile()
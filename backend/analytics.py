@@ -12,30 +12,51 @@ Provides:
 
 import os
 import math
+import asyncio
+import hashlib
+import json
+import heapq
 import time
 import random
 import logging
 import traceback
 import re
-from typing import List, Optional, Dict, Any, Tuple, Literal
+from typing import List, Optional, Dict, Any, Tuple, Literal, Mapping, Type, TypeVar, Callable
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from operator import attrgetter
+from types import MappingProxyType
 
 import numpy as np  # type: ignore[import-not-found]
+import pandas as pd  # type: ignore[import-not-found]
 from scipy.optimize import minimize_scalar  # type: ignore[import-not-found]
-from sklearn.linear_model import LinearRegression  # type: ignore[import-not-found]
+from scipy.special import expit  # type: ignore[import-not-found]
 from sklearn.ensemble import RandomForestClassifier  # type: ignore[import-not-found]
 from sklearn.model_selection import train_test_split  # type: ignore[import-not-found]
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report  # type: ignore[import-not-found]
 from pydantic import BaseModel, Field
 
+import _insights_kernels
+import _irt_kernels
+
 # Optional heavy dependencies — guarded imports
 xgb: Any = None
 shap: Any = None
 joblib: Any = None
+numba: Any = None
+_irt_kernels_aot: Any = None
+_insights_kernels_aot: Any = None
+ort: Any = None
+convert_sklearn: Any = None
+FloatTensorType: Any = None
+onnxmltools: Any = None
+onnxmltools_types: Any = None
 firebase_admin: Any = None
 credentials: Any = None
 firestore: Any = None
+redis_async: Any = None
 
 try:
     import xgboost as xgb  # type: ignore[import-not-found,no-redef]
@@ -55,6 +76,47 @@ try:
 except ImportError:
     HAS_JOBLIB = False
 
+try:
+    import onnxruntime as ort  # type: ignore[import-not-found,no-redef]
+    HAS_ONNXRUNTIME = True
+except ImportError:
+    HAS_ONNXRUNTIME = False
+
+try:
+    from skl2onnx import convert_sklearn  # type: ignore[import-not-found,no-redef]
+    from skl2onnx.common.data_types import FloatTensorType  # type: ignore[import-not-found,no-redef]
+    HAS_SKL2ONNX = True
+except ImportError:
+    HAS_SKL2ONNX = False
+
+try:
+    # XGBoost has no skl2onnx converter; onnxmltools provides one
+    import onnxmltools  # type: ignore[import-not-found,no-redef]
+    from onnxmltools.convert.common import data_types as onnxmltools_types  # type: ignore[import-not-found,no-redef]
+    HAS_ONNXMLTOOLS = True
+except ImportError:
+    HAS_ONNXMLTOOLS = False
+
+try:
+    import numba  # type: ignore[import-not-found,no-redef]
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+try:
+    # Built ahead of time by `python _irt_kernels.py`; skips numba JIT warmup entirely
+    import _irt_kernels_aot  # type: ignore[import-not-found,no-redef]
+    HAS_IRT_AOT = True
+except ImportError:
+    HAS_IRT_AOT = False
+
+try:
+    # Built ahead of time by `python _insights_kernels.py`
+    import _insights_kernels_aot  # type: ignore[import-not-found,no-redef]
+    HAS_INSIGHTS_AOT = True
+except ImportError:
+    HAS_INSIGHTS_AOT = False
+
 try:
     import firebase_admin  # type: ignore[import-not-found,no-redef]
     from firebase_admin import credentials, firestore  # type: ignore[import-not-found,no-redef,assignment]
@@ -62,6 +124,12 @@ try:
 except ImportError:
     HAS_FIREBASE = False
 
+try:
+    import redis.asyncio as redis_async  # type: ignore[import-not-found,no-redef]
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
 logger = logging.getLogger("mathpulse.analytics")
 
 
@@ -98,8 +166,31 @@ def _canonicalize_topic_label(value: str) -> str:
 # ─── Configuration ─────────────────────────────────────────────
 
 RISK_MODEL_PATH = "models/risk_classifier.joblib"
+RISK_ONNX_MODEL_PATH = "models/risk_classifier.onnx"
 IRT_DIFFICULTY_CACHE_TTL = 3600  # 1 hour
+# Shared result cache across workers; unset keeps the caches in-process only
+ANALYTICS_CACHE_REDIS_URL = os.getenv("ANALYTICS_CACHE_REDIS_URL", "").strip() or None
+ANALYTICS_CACHE_REDIS_PREFIX = "mathpulse:analytics:"
+ANALYTICS_CACHE_REDIS_TIMEOUT = 0.25  # seconds; the cache fails open on a slow Redis
+ANALYTICS_CACHE_MAX_ENTRIES = 2048  # per in-process cache, oldest entries evicted first
 MIN_QUIZ_ATTEMPTS_FOR_COMPETENCY = 3
+QUIZ_HISTORY_FETCH_LIMIT = 5000  # per collection
+# Only the fields the competency / IRT / summary code reads are pulled from Firestore
+QUIZ_HISTORY_FIELDS = [
+    "topicId", "topic", "questionId", "score", "total", "attempts", "correct",
+    "timeTaken", "timeSpent", "completedAt", "timestamp", "date",
+]
+XP_ACTIVITY_FETCH_LIMIT = 10_000
+RISK_TRAINING_FETCH_LIMIT = 500
+# Student profile fields read when building risk-model training rows
+RISK_TRAINING_FIELDS = [
+    "engagementScore", "avgQuizScore", "attendance", "assignmentCompletion", "xpGrowthRate",
+    "timeOnPlatform", "consecutiveAbsences", "daysSinceLastActivity", "riskLevel",
+]
+CLASS_INSIGHTS_MAX_STUDENTS = 50
+CLASS_INSIGHTS_CONCURRENCY = 16  # concurrent get_student_summary calls per class
+# Validate internally built responses (tests / debugging); otherwise they skip pydantic validation
+ANALYTICS_VALIDATE_RESPONSES = os.getenv("ANALYTICS_VALIDATE_RESPONSES", "").strip().lower() in {"1", "true", "yes"}
 LEARNING_VELOCITY_WINDOW_DAYS = 30
 COMPETENCY_THRESHOLDS = {
     "beginner": (0, 40),
@@ -142,8 +233,40 @@ TOPIC_PREREQUISITES: Dict[str, List[str]] = {
 }
 
 
+def _build_prereq_bits(graph: Dict[str, List[str]]) -> Tuple[Tuple[str, ...], Dict[str, int], np.ndarray]:
+    """Index every topic in the prerequisite graph and build a read-only (T, T) adjacency matrix."""
+    topics = tuple(sorted({*graph, *(p for prereqs in graph.values() for p in prereqs)}))
+    index = {t: i for i, t in enumerate(topics)}
+    bits = np.zeros((len(topics), len(topics)), dtype=bool)  # bits[topic, prerequisite]
+    for topic, prereqs in graph.items():
+        bits[index[topic], [index[p] for p in prereqs]] = True
+    bits.flags.writeable = False
+    return topics, index, bits
+
+
+_PREREQ_TOPICS, _PREREQ_TOPIC_INDEX, _PREREQ_BITS = _build_prereq_bits(TOPIC_PREREQUISITES)
+_PREREQ_COUNTS = _PREREQ_BITS.sum(axis=1)
+# Read-only view handed to callers instead of copying the graph on every request
+_TOPIC_PREREQUISITES_VIEW: Mapping[str, Tuple[str, ...]] = MappingProxyType(
+    {topic: tuple(prereqs) for topic, prereqs in TOPIC_PREREQUISITES.items()}
+)
+
+
 # ─── Pydantic Models ──────────────────────────────────────────
 
+_ModelT = TypeVar("_ModelT", bound=BaseModel)
+
+
+def _build_response(model: Type[_ModelT], **fields: Any) -> _ModelT:
+    """
+    Build a response from fields this module computed itself. model_construct skips
+    validation; ANALYTICS_VALIDATE_RESPONSES restores it to catch schema drift.
+    """
+    if ANALYTICS_VALIDATE_RESPONSES:
+        return model(**fields)
+    return model.model_construct(**fields)
+
+
 class CompetencyAnalysisRequest(BaseModel):
     studentId: str
     topicId: Optional[str] = None
@@ -194,6 +317,8 @@ class EnhancedRiskPrediction(BaseModel):
     riskLevel: str
     confidence: float
     probabilities: Dict[str, float]
+    # ml_model: per-student SHAP impacts for High/Medium predictions; Low predictions
+    # (generic recommendations) get the model's global feature importances instead
     contributingFactors: List[Dict[str, Any]]
     recommendations: List[str]
     modelUsed: str  # "ml_model" | "rule_based" | "zero_shot"
@@ -345,42 +470,139 @@ class RefreshCacheResponse(BaseModel):
 
 # ─── In-Memory Caches ─────────────────────────────────────────
 
-_competency_cache: Dict[str, Tuple[float, Any]] = {}
-_class_stats_cache: Dict[str, Tuple[float, Any]] = {}
-_difficulty_cache: Dict[str, Tuple[float, Any]] = {}
+class _TTLCache(dict):
+    """
+    In-process result cache (key -> (timestamp, value)), backed by Redis when
+    ANALYTICS_CACHE_REDIS_URL is set; `namespace` prefixes its Redis keys.
+    """
+
+    def __init__(self, namespace: str, ttl: int):
+        super().__init__()
+        self.namespace = namespace
+        self.ttl = ttl
+
+
+_competency_cache: Dict[str, Tuple[float, Any]] = _TTLCache("competency", IRT_DIFFICULTY_CACHE_TTL)
+_class_stats_cache: Dict[str, Tuple[float, Any]] = _TTLCache("class_stats", IRT_DIFFICULTY_CACHE_TTL)
+_difficulty_cache: Dict[str, Tuple[float, Any]] = _TTLCache("difficulty", IRT_DIFFICULTY_CACHE_TTL)
+# Model objects stay per-process; workers already share the trained model files on disk
 _risk_model_cache: Dict[str, Any] = {}
+# id(model) -> (model, TreeExplainer); the model is kept so a recycled id never matches
+_shap_explainer_cache: Dict[int, Tuple[Any, Any]] = {}
+
+
+@lru_cache(maxsize=1)
+def _redis_client() -> Any:
+    """Process-wide async Redis client for the shared analytics cache, or None when not configured."""
+    if not (HAS_REDIS and ANALYTICS_CACHE_REDIS_URL):
+        return None
+    try:
+        return redis_async.from_url(
+            ANALYTICS_CACHE_REDIS_URL,
+            socket_timeout=ANALYTICS_CACHE_REDIS_TIMEOUT,
+            socket_connect_timeout=ANALYTICS_CACHE_REDIS_TIMEOUT,
+        )
+    except Exception as e:
+        logger.warning(f"Analytics Redis cache disabled: {e}")
+        return None
+
+
+def _redis_key(cache: Dict[str, Tuple[float, Any]], key: str) -> Optional[str]:
+    namespace = getattr(cache, "namespace", None)
+    return f"{ANALYTICS_CACHE_REDIS_PREFIX}{namespace}:{key}" if namespace else None
 
 
-def _cache_get(cache: Dict[str, Tuple[float, Any]], key: str, ttl: int) -> Optional[Any]:
-    """Get from cache if not expired."""
+def _cache_store_local(cache: Dict[str, Tuple[float, Any]], key: str, value: Any, stored_at: float) -> None:
+    """Insert into the local cache, evicting the oldest past ANALYTICS_CACHE_MAX_ENTRIES."""
+    cache.pop(key, None)  # re-insert so dict order stays oldest-first
+    cache[key] = (stored_at, value)
+    while len(cache) > ANALYTICS_CACHE_MAX_ENTRIES:
+        del cache[next(iter(cache))]
+
+
+async def _cache_get(
+    cache: Dict[str, Tuple[float, Any]],
+    key: str,
+    ttl: int,
+    model: Optional[Type[BaseModel]] = None,
+) -> Optional[Any]:
+    """
+    Get from cache if not expired, falling back to the shared Redis cache. Redis holds
+    JSON; `model` rebuilds the response model from it (plain JSON values otherwise).
+    """
     if key in cache:
         ts, val = cache[key]
         if time.time() - ts < ttl:
             return val
         del cache[key]
-    return None
 
+    client = _redis_client()
+    redis_key = _redis_key(cache, key)
+    if client is None or redis_key is None:
+        return None
+    try:
+        raw = await client.get(redis_key)
+        if raw is None:
+            return None
+        val = model.model_validate_json(raw) if model is not None else json.loads(raw)
+        remaining = await client.ttl(redis_key)
+    except Exception as e:
+        logger.warning(f"Analytics Redis cache get failed for {redis_key}: {e}")
+        return None
+    # Keep the shared entry's remaining lifetime instead of restarting the local TTL
+    full_ttl = getattr(cache, "ttl", ttl)
+    if isinstance(remaining, int) and 0 < remaining < full_ttl:
+        stored_at = time.time() - (full_ttl - remaining)
+    else:
+        stored_at = time.time()
+    _cache_store_local(cache, key, val, stored_at)
+    return val
 
-def _cache_set(cache: Dict[str, Tuple[float, Any]], key: str, value: Any):
-    """Set a cache entry with current timestamp."""
-    cache[key] = (time.time(), value)
 
+async def _cache_set(cache: Dict[str, Tuple[float, Any]], key: str, value: Any):
+    """Set a cache entry with current timestamp and share it through Redis as JSON."""
+    _cache_store_local(cache, key, value, time.time())
 
-# ─── Firebase Helpers ──────────────────────────────────────────
+    client = _redis_client()
+    redis_key = _redis_key(cache, key)
+    if client is None or redis_key is None:
+        return
+    try:
+        payload = value.model_dump_json() if isinstance(value, BaseModel) else json.dumps(value)
+        await client.set(redis_key, payload, ex=getattr(cache, "ttl", IRT_DIFFICULTY_CACHE_TTL))
+    except Exception as e:
+        logger.warning(f"Analytics Redis cache set failed for {redis_key}: {e}")
 
-_firestore_db = None
 
+async def _redis_cache_clear() -> int:
+    """Delete every shared analytics cache key (SCAN, not KEYS); returns the number removed."""
+    client = _redis_client()
+    if client is None:
+        return 0
+    removed = 0
+    try:
+        batch: List[Any] = []
+        async for redis_key in client.scan_iter(match=f"{ANALYTICS_CACHE_REDIS_PREFIX}*", count=500):
+            batch.append(redis_key)
+            if len(batch) >= 500:
+                removed += await client.delete(*batch)
+                batch = []
+        if batch:
+            removed += await client.delete(*batch)
+    except Exception as e:
+        logger.warning(f"Analytics Redis cache clear failed: {e}")
+    return removed
 
-def _get_firestore_db():
-    """Get or initialise Firestore client."""
-    global _firestore_db
-    if _firestore_db is not None:
-        return _firestore_db
 
-    if not HAS_FIREBASE:
-        logger.warning("firebase-admin not installed; Firestore operations will use mock data")
-        return None
+# ─── Firebase Helpers ──────────────────────────────────────────
 
+@lru_cache(maxsize=1)
+def _firestore_client() -> Any:
+    """
+    Initialise Firebase once and return the process-wide Firestore client.
+    The client's gRPC channel is shared by every request and worker thread.
+    Failures raise and are not cached, so the next call retries initialisation.
+    """
     try:
         # Check if already initialised
         firebase_admin.get_app()
@@ -392,14 +614,35 @@ def _get_firestore_db():
             firebase_admin.initialize_app(cred)
         else:
             # Try default credentials (e.g., GCP environment)
-            try:
-                firebase_admin.initialize_app()
-            except Exception as e:
-                logger.warning(f"Could not initialise Firebase: {e}")
-                return None
+            firebase_admin.initialize_app()
 
-    _firestore_db = firestore.client()
-    return _firestore_db
+    return firestore.client()
+
+
+def _get_firestore_db():
+    """Get or initialise Firestore client."""
+    if not HAS_FIREBASE:
+        logger.warning("firebase-admin not installed; Firestore operations will use mock data")
+        return None
+
+    try:
+        return _firestore_client()
+    except Exception as e:
+        logger.warning(f"Could not initialise Firebase: {e}")
+        return None
+
+
+def _collect_docs(query: Any, source: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Drain a blocking Firestore query stream into dicts (run via asyncio.to_thread)."""
+    rows = []
+    for doc in query.stream():
+        data = doc.to_dict()
+        if data:
+            data["id"] = doc.id
+            if source:
+                data["source"] = source
+            rows.append(data)
+    return rows
 
 
 async def fetch_student_quiz_history(student_id: str) -> List[Dict[str, Any]]:
@@ -411,26 +654,28 @@ async def fetch_student_quiz_history(student_id: str) -> List[Dict[str, Any]]:
 
     try:
         # Query progress collection for the student
-        progress_ref = db.collection("progress").where("userId", "==", student_id)
-        docs = progress_ref.stream()
-        history = []
-        for doc in docs:
-            data = doc.to_dict()
-            if data:
-                data["id"] = doc.id
-                history.append(data)
+        progress_ref = (
+            db.collection("progress")
+            .where("userId", "==", student_id)
+            .select(QUIZ_HISTORY_FIELDS)
+            .limit(QUIZ_HISTORY_FETCH_LIMIT)
+        )
 
         # Also check quizAttempts subcollection if it exists
-        quiz_ref = db.collection("quizAttempts").where("studentId", "==", student_id).order_by(
-            "completedAt", direction=firestore.Query.DESCENDING
+        quiz_ref = (
+            db.collection("quizAttempts")
+            .where("studentId", "==", student_id)
+            .order_by("completedAt", direction=firestore.Query.DESCENDING)
+            .select(QUIZ_HISTORY_FIELDS)
+            .limit(QUIZ_HISTORY_FETCH_LIMIT)
+        )
+
+        # The two queries are independent; overlap their round trips
+        history, quiz_docs = await asyncio.gather(
+            asyncio.to_thread(_collect_docs, progress_ref),
+            asyncio.to_thread(_collect_docs, quiz_ref, "quizAttempts"),
         )
-        quiz_docs = quiz_ref.stream()
-        for doc in quiz_docs:
-            data = doc.to_dict()
-            if data:
-                data["id"] = doc.id
-                data["source"] = "quizAttempts"
-                history.append(data)
+        history.extend(quiz_docs)
 
         logger.info(f"Fetched {len(history)} quiz history records for student {student_id}")
         return history
@@ -456,38 +701,37 @@ async def fetch_student_engagement_metrics(student_id: str, days: int = 30) -> D
         cutoff = datetime.utcnow() - timedelta(days=days)
 
         # Fetch XP activities as engagement proxy
-        xp_ref = db.collection("xpActivities").where(
-            "userId", "==", student_id
-        ).where("timestamp", ">=", cutoff)
-        xp_docs = xp_ref.stream()
-
-        daily_activity: Dict[str, int] = {}
-        hourly_activity: Dict[int, int] = defaultdict(int)
-        total_xp = 0
-        activity_count = 0
-
-        for doc in xp_docs:
-            data = doc.to_dict()
-            if data:
-                activity_count += 1
-                total_xp += data.get("xpAmount", 0)
-                ts = data.get("timestamp")
-                if ts:
-                    if hasattr(ts, "seconds"):
-                        dt = datetime.utcfromtimestamp(ts.seconds)
-                    elif isinstance(ts, datetime):
-                        dt = ts
-                    else:
-                        continue
-                    day_key = dt.strftime("%Y-%m-%d")
-                    daily_activity[day_key] = daily_activity.get(day_key, 0) + 1
-                    hourly_activity[dt.hour] += 1
+        xp_ref = (
+            db.collection("xpActivities")
+            .where("userId", "==", student_id)
+            .where("timestamp", ">=", cutoff)
+            .order_by("timestamp", direction=firestore.Query.DESCENDING)
+            .select(["xpAmount", "timestamp"])
+            .limit(XP_ACTIVITY_FETCH_LIMIT)
+        )
+        xp_docs = await asyncio.to_thread(_collect_docs, xp_ref)
+
+        activity_count = len(xp_docs)
+        total_xp = sum(data.get("xpAmount", 0) for data in xp_docs)
+
+        stamps = []
+        for data in xp_docs:
+            ts: Any = data.get("timestamp")
+            if hasattr(ts, "seconds"):
+                stamps.append(datetime.utcfromtimestamp(ts.seconds))
+            elif isinstance(ts, datetime):
+                stamps.append(ts)
+
+        daily_activity = dict(Counter(dt.strftime("%Y-%m-%d") for dt in stamps))
+        # Hours are 0-23: count them in a fixed 24-slot array instead of hashing each one
+        hour_bins = np.bincount(np.fromiter((dt.hour for dt in stamps), dtype=np.intp, count=len(stamps)), minlength=24)
+        hourly_activity = {int(h): int(hour_bins[h]) for h in np.flatnonzero(hour_bins)}
 
         return {
             "totalXP": total_xp,
             "activityCount": activity_count,
             "dailyActivity": daily_activity,
-            "hourlyActivity": dict(hourly_activity),
+            "hourlyActivity": hourly_activity,
             "activeDays": len(daily_activity),
             "avgActivitiesPerDay": round(activity_count / max(len(daily_activity), 1), 2),
         }
@@ -497,9 +741,9 @@ async def fetch_student_engagement_metrics(student_id: str, days: int = 30) -> D
         return {"totalXP": 0, "activityCount": 0, "dailyActivity": {}, "hourlyActivity": {}}
 
 
-def fetch_topic_dependencies() -> Dict[str, List[str]]:
-    """Return the topic prerequisite graph."""
-    return TOPIC_PREREQUISITES.copy()
+def fetch_topic_dependencies() -> Mapping[str, Tuple[str, ...]]:
+    """Return the topic prerequisite graph (read-only)."""
+    return _TOPIC_PREREQUISITES_VIEW
 
 
 async def store_competency_analysis(student_id: str, analysis: Dict[str, Any]):
@@ -549,10 +793,97 @@ def _irt_3pl_probability(theta: float, a: float, b: float, c: float = 0.25) -> f
     c: guessing parameter
     """
     exponent = -a * (theta - b)
-    exponent = max(-20, min(20, exponent))  # numerical stability
+    exponent = -20.0 if exponent < -20.0 else (20.0 if exponent > 20.0 else exponent)  # numerical stability
     return c + (1 - c) / (1 + math.exp(exponent))
 
 
+def _irt_3pl_array(theta: Any, a: Any, b: Any, c: Any) -> np.ndarray:
+    """
+    Element-wise 3PL probability over arrays of item parameters.
+    A scalar theta broadcasts against length-N a/b/c arrays.
+    """
+    z = np.clip(np.multiply(a, np.subtract(theta, b)), -20, 20)  # numerical stability
+    return c + (1 - c) * expit(z)
+
+
+if HAS_IRT_AOT:
+    # Same 3PL loop, ahead-of-time compiled; callers pass 1-D float64 item arrays
+    _irt_3pl_array = _irt_kernels_aot.irt_3pl_probs
+elif HAS_NUMBA:
+    # cache=True persists the compiled kernels to disk so only the first process pays JIT warmup.
+    # target="cpu": callers pass one quiz's worth of items, far below where thread dispatch pays off
+    _irt_3pl_array = numba.vectorize(
+        ["float64(float64, float64, float64, float64)"],
+        target="cpu",
+        fastmath=True,
+        cache=True,
+    )(_irt_3pl_probability)
+
+
+# Compiled theta kernels: the AOT extension when built, else a numba JIT of the same
+# _irt_kernels source, else None and the NumPy implementations below are used
+_theta_newton_kernel: Any = None
+_theta_nll_kernel: Any = None
+if HAS_IRT_AOT:
+    _theta_newton_kernel = _irt_kernels_aot.theta_newton
+    _theta_nll_kernel = _irt_kernels_aot.theta_nll
+elif HAS_NUMBA:
+    # No fastmath: theta_newton signals non-convergence with NaN
+    _theta_newton_kernel = numba.njit(cache=True)(_irt_kernels.theta_newton)
+    _theta_nll_kernel = numba.njit(cache=True)(_irt_kernels.theta_nll)
+
+
+THETA_BOUNDS = (-4.0, 4.0)
+THETA_NEWTON_MAX_ITER = 8
+THETA_NEWTON_TOL = 1e-6
+
+
+def _estimate_theta_newton(
+    a_arr: np.ndarray,
+    b_arr: np.ndarray,
+    c_arr: np.ndarray,
+    y_arr: np.ndarray,
+) -> Optional[float]:
+    """
+    Newton-Raphson MLE for theta using closed-form 3PL derivatives.
+    dP/dθ   = a·(P - c)·(1 - P) / (1 - c)
+    dL/dθ   = Σ (y - P)·P' / (P·(1 - P))
+    d²L/dθ² = Σ a·P'·((y - P)·c / P² - (P - c) / P) / (1 - c)
+    Falls back to a Fisher-scoring step where the likelihood is not locally concave.
+    Returns None when the iteration has not converged within the step budget.
+    """
+    low, high = THETA_BOUNDS
+    if _theta_newton_kernel is not None:
+        theta = _theta_newton_kernel(
+            a_arr, b_arr, c_arr, y_arr, low, high, THETA_NEWTON_MAX_ITER, THETA_NEWTON_TOL
+        )
+        return None if math.isnan(theta) else theta
+
+    theta = 0.0
+    for _ in range(THETA_NEWTON_MAX_ITER):
+        p = _irt_3pl_array(theta, a_arr, b_arr, c_arr)
+        np.clip(p, 1e-10, 1 - 1e-10, out=p)
+
+        dp = a_arr * (p - c_arr) * (1 - p) / (1 - c_arr)
+        residual = y_arr - p
+        grad = float((residual * dp / (p * (1 - p))).sum())
+        hess = float((a_arr * dp * (residual * c_arr / (p * p) - (p - c_arr) / p) / (1 - c_arr)).sum())
+        if hess < 0:
+            step = -grad / hess
+        else:
+            info = float((dp * dp / (p * (1 - p))).sum())
+            if not info > 0:
+                return None
+            step = grad / info
+
+        # Clipping to the bounds also settles all-correct / all-wrong histories
+        next_theta = min(max(theta + step, low), high)
+        if abs(next_theta - theta) < THETA_NEWTON_TOL:
+            return next_theta
+        theta = next_theta
+    return None
+
+
 def _estimate_theta(responses: List[Dict[str, Any]], difficulty_params: Dict[str, Dict[str, float]]) -> float:
     """
     Estimate student ability (theta) using Maximum Likelihood Estimation.
@@ -562,20 +893,37 @@ def _estimate_theta(responses: List[Dict[str, Any]], difficulty_params: Dict[str
     if not responses:
         return 0.0
 
+    # Extract item parameters once so each optimizer step is a vector op
+    n = len(responses)
+    default_params = {"a": 1.0, "b": 0.0, "c": 0.25}
+    params = [difficulty_params.get(r.get("questionId", ""), default_params) for r in responses]
+    a_arr = np.fromiter((p["a"] for p in params), dtype=np.float64, count=n)
+    b_arr = np.fromiter((p["b"] for p in params), dtype=np.float64, count=n)
+    c_arr = np.fromiter((p.get("c", 0.25) for p in params), dtype=np.float64, count=n)
+    y_arr = np.fromiter((bool(r.get("correct", False)) for r in responses), dtype=bool, count=n)
+
+    return _estimate_theta_arrays(a_arr, b_arr, c_arr, y_arr)
+
+
+def _estimate_theta_arrays(
+    a_arr: np.ndarray,
+    b_arr: np.ndarray,
+    c_arr: np.ndarray,
+    y_arr: np.ndarray,
+) -> float:
+    """Theta MLE over pre-extracted item parameter / response arrays."""
+    theta = _estimate_theta_newton(a_arr, b_arr, c_arr, y_arr)
+    if theta is not None:
+        return round(theta, 3)
+
     def neg_log_likelihood(theta: float) -> float:
-        ll = 0.0
-        for r in responses:
-            qid = r.get("questionId", "")
-            params = difficulty_params.get(qid, {"a": 1.0, "b": 0.0, "c": 0.25})
-            p = _irt_3pl_probability(theta, params["a"], params["b"], params.get("c", 0.25))
-            p = max(1e-10, min(1 - 1e-10, p))  # avoid log(0)
-            if r.get("correct", False):
-                ll += math.log(p)
-            else:
-                ll += math.log(1 - p)
-        return -ll
+        if _theta_nll_kernel is not None:
+            return _theta_nll_kernel(theta, a_arr, b_arr, c_arr, y_arr)
+        p = _irt_3pl_array(theta, a_arr, b_arr, c_arr)
+        np.clip(p, 1e-10, 1 - 1e-10, out=p)  # avoid log(0)
+        return -float(np.where(y_arr, np.log(p), np.log1p(-p)).sum())
 
-    result = minimize_scalar(neg_log_likelihood, bounds=(-4, 4), method="bounded")
+    result = minimize_scalar(neg_log_likelihood, bounds=THETA_BOUNDS, method="bounded")
     return round(result.x, 3)
 
 
@@ -588,60 +936,176 @@ def _calculate_learning_velocity(scores_over_time: List[Tuple[float, float]]) ->
     if len(scores_over_time) < 2:
         return 0.0
 
-    times = np.array([t for t, _ in scores_over_time]).reshape(-1, 1)
-    scores = np.array([s for _, s in scores_over_time])
+    n = len(scores_over_time)
+    times = np.fromiter((t for t, _ in scores_over_time), dtype=np.float64, count=n)
+    scores = np.fromiter((s for _, s in scores_over_time), dtype=np.float64, count=n)
 
     # Exponential decay weights (more recent = higher weight)
     max_time = times.max()
     decay_rate = 0.05
-    weights = np.exp(-decay_rate * (max_time - times.flatten()))
-    weights = weights / weights.sum()
-
-    # Weighted linear regression
-    model = LinearRegression()
-    model.fit(times, scores, sample_weight=weights)
+    weights = np.exp(-decay_rate * (max_time - times))
+    weights /= weights.sum()
+
+    # Closed-form weighted least-squares slope; centring keeps large day values stable
+    dt = times - (weights * times).sum()
+    ds = scores - (weights * scores).sum()
+    denom = (weights * dt * dt).sum()
+    if denom <= 0:
+        return 0.0
 
-    return round(float(model.coef_[0]), 4)
+    return round(float((weights * dt * ds).sum() / denom), 4)
 
 
 def _calculate_efficiency_score(
-    student_times: List[float],
-    student_accuracies: List[bool],
+    student_times: np.ndarray,
+    student_accuracies: np.ndarray,
     class_avg_time: float,
-    attempt_counts: List[int],
+    attempt_counts: np.ndarray,
 ) -> float:
     """
     Efficiency = (class_avg_time / student_time) * accuracy_multiplier * 100
     Penalise multiple attempts.
     """
-    if not student_times or class_avg_time <= 0:
+    if len(student_times) == 0 or class_avg_time <= 0:
         return 50.0
 
-    efficiencies = []
-    for t, correct, attempts in zip(student_times, student_accuracies, attempt_counts):
-        if t <= 0:
-            t = 1.0
-        time_ratio = class_avg_time / t
-        accuracy_mult = 1.0 if correct else 0.3
-        attempt_penalty = 1.0 / max(attempts, 1)
-        eff = time_ratio * accuracy_mult * attempt_penalty * 100
-        efficiencies.append(min(eff, 150))  # cap at 150 to avoid outliers
-
-    raw = sum(efficiencies) / len(efficiencies)
+    n = min(len(student_times), len(student_accuracies), len(attempt_counts))
+    if n == 0:
+        return 50.0
+
+    t = np.asarray(student_times[:n], dtype=np.float64)
+    t = np.where(t <= 0, 1.0, t)
+    accuracy_mult = np.where(np.asarray(student_accuracies[:n], dtype=bool), 1.0, 0.3)
+    attempts = np.maximum(np.asarray(attempt_counts[:n], dtype=np.float64), 1.0)
+
+    eff = (class_avg_time / t) * accuracy_mult * (100.0 / attempts)
+    np.minimum(eff, 150.0, out=eff)  # cap at 150 to avoid outliers
+
+    raw = float(eff.mean())
     return round(min(max(raw, 0), 100), 2)
 
 
-def _get_competency_level(score: float) -> str:
-    """Map a score (0-100) to competency level."""
+def _classify_competency(score: float) -> str:
+    """Threshold walk over COMPETENCY_THRESHOLDS; used to build the level lookup table."""
     for level, (low, high) in COMPETENCY_THRESHOLDS.items():
         if low <= score < high:
             return level
     return "advanced" if score >= 85 else "beginner"
 
 
+# Thresholds are whole numbers, so int(score) always lands in the same bucket
+_COMPETENCY_LEVEL_LUT = np.array([_classify_competency(i) for i in range(101)], dtype=object)
+
+
+def _get_competency_level(score: float) -> str:
+    """Map a score (0-100) to competency level."""
+    if not score >= 0:  # negative or NaN
+        return "beginner"
+    return _COMPETENCY_LEVEL_LUT[int(min(score, 100))]
+
+
 # ─── Competency Assessment System ─────────────────────────────
 
 
+def _timestamp_to_day(ts: Any) -> float:
+    """Convert an epoch / Firestore / datetime / ISO timestamp to days; NaN when absent."""
+    if not ts:
+        return math.nan
+    if isinstance(ts, (int, float)):
+        return ts / 86400
+    if hasattr(ts, "seconds"):
+        return ts.seconds / 86400
+    if isinstance(ts, datetime):
+        return ts.timestamp() / 86400
+    if isinstance(ts, str):
+        try:
+            return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp() / 86400
+        except Exception:
+            return time.time() / 86400
+    return time.time() / 86400
+
+
+# Typed row layout for normalised quiz history; the topic width is sized per call
+QUIZ_ROW_FIELDS = [
+    ("score", np.float64),
+    ("total", np.float64),
+    ("attempts", np.float64),
+    ("time_spent", np.float64),
+    ("day", np.float64),
+    ("irt_correct", np.bool_),
+]
+
+
+def _iso_strings_to_days(values: List[str]) -> np.ndarray:
+    """
+    Parse ISO-8601 strings to epoch days in one vectorised call.
+    Unparseable values fall back to "now", matching _timestamp_to_day.
+    """
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors="coerce", format="ISO8601")
+    micros = parsed.to_numpy(dtype="datetime64[us]").astype(np.int64)
+    days = micros / 86_400_000_000
+    days[parsed.isna().to_numpy()] = time.time() / 86400
+    return days
+
+
+def _quiz_history_rows(
+    quiz_history: List[Dict[str, Any]],
+    topic_filter: Optional[str] = None,
+) -> np.ndarray:
+    """
+    Normalise quiz history dicts into one structured NumPy array (fields: topic +
+    QUIZ_ROW_FIELDS). Each row is probed once here so downstream per-topic stats are
+    pure array ops.
+    """
+    wanted_topic = _canonicalize_topic_label(topic_filter) if topic_filter else None
+
+    records: List[Tuple[Any, ...]] = []
+    str_ts_rows: List[int] = []
+    str_ts: List[str] = []
+    topic_width = 1
+
+    for entry in quiz_history:
+        topic = _canonicalize_topic_label(str(entry.get("topicId") or entry.get("topic") or "Unknown"))
+        if wanted_topic and topic != wanted_topic:
+            continue
+
+        score = entry.get("score", 0) or 0
+        total = entry.get("total", 1) or 0
+        correct = entry.get("correct", False)
+        if isinstance(correct, (int, float)):
+            correct = correct > 0.5
+        if not isinstance(correct, bool) and total > 0:
+            correct = (score / total) >= 0.5
+
+        time_spent = entry.get("timeTaken") or entry.get("timeSpent") or 60
+        topic_width = max(topic_width, len(topic))
+
+        ts = entry.get("completedAt") or entry.get("timestamp") or entry.get("date")
+        if isinstance(ts, str):
+            # Strings are parsed in one batch below
+            str_ts_rows.append(len(records))
+            str_ts.append(ts)
+            day = math.nan
+        else:
+            day = _timestamp_to_day(ts)
+
+        records.append((
+            topic,
+            score,
+            total,
+            entry.get("attempts", 1) or 1,
+            time_spent,
+            day,
+            bool(correct),
+        ))
+
+    dtype = np.dtype([("topic", f"U{topic_width}")] + QUIZ_ROW_FIELDS)
+    rows = np.array(records, dtype=dtype)
+    if str_ts:
+        rows["day"][str_ts_rows] = _iso_strings_to_days(str_ts)
+    return rows
+
+
 async def compute_competency_analysis(
     student_id: str,
     quiz_history: List[Dict[str, Any]],
@@ -659,113 +1123,86 @@ async def compute_competency_analysis(
             thetaEstimate=None,
         )
 
-    # Group by topic
-    topic_data: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-    for entry in quiz_history:
-        topic = _canonicalize_topic_label(str(entry.get("topicId") or entry.get("topic") or "Unknown"))
-        if topic_filter and topic != _canonicalize_topic_label(topic_filter):
-            continue
-        topic_data[topic].append(entry)
+    # Cheap fingerprint of the history: size plus most recent completion timestamp
+    last_completed = max(
+        str(e.get("completedAt") or e.get("timestamp") or e.get("date") or "") for e in quiz_history
+    )
+    cache_key = "competency_" + hashlib.blake2b(
+        f"{student_id}|{topic_filter}|{len(quiz_history)}|{last_completed}".encode(),
+        digest_size=16,
+    ).hexdigest()
+    cached = await _cache_get(_competency_cache, cache_key, IRT_DIFFICULTY_CACHE_TTL, CompetencyAnalysisResponse)
+    if cached:
+        return cached
+
+    rows = _quiz_history_rows(quiz_history, topic_filter)
+    n_rows = len(rows)
 
-    if not topic_data:
+    if n_rows == 0:
         return CompetencyAnalysisResponse(
             studentId=student_id,
             status="insufficient_data",
             analyses=[],
         )
 
-    # Build difficulty params from class-wide success rates
-    difficulty_params: Dict[str, Dict[str, float]] = {}
-    all_responses_for_irt: List[Dict[str, Any]] = []
-
-    for topic, entries in topic_data.items():
-        for entry in entries:
-            qid = entry.get("questionId", entry.get("id", f"{topic}_{len(all_responses_for_irt)}"))
-            correct = entry.get("correct", False)
-            if isinstance(correct, (int, float)):
-                correct = correct > 0.5
-            score = entry.get("score", 0)
-            total = entry.get("total", 1)
-            if not isinstance(correct, bool) and total > 0:
-                correct = (score / total) >= 0.5
-
-            all_responses_for_irt.append({"questionId": qid, "correct": correct})
-
-            # Estimate difficulty from success rate across the dataset
-            if qid not in difficulty_params:
-                difficulty_params[qid] = {"a": 1.0, "b": 0.0, "c": 0.25}
-
-    # Estimate theta
-    theta = _estimate_theta(all_responses_for_irt, difficulty_params)
+    # Estimate theta; difficulty params default to a=1, b=0, c=0.25 until calibrated
+    theta = _estimate_theta_arrays(
+        np.ones(n_rows),
+        np.zeros(n_rows),
+        np.full(n_rows, 0.25),
+        rows["irt_correct"],
+    )
 
-    # Per-topic analysis
+    # Group rows by topic once; per-topic counts and sums come from bincount
+    pct_all = rows["score"] / np.maximum(rows["total"], 1) * 100
+    correct_all = pct_all >= 50
+    topics, first_idx, inv, total_counts = np.unique(
+        rows["topic"], return_index=True, return_inverse=True, return_counts=True
+    )
+    n_topics = len(topics)
+    correct_counts = np.bincount(inv, weights=correct_all, minlength=n_topics)
+    first_attempt_counts = np.bincount(inv, weights=correct_all & (rows["attempts"] <= 1), minlength=n_topics)
+    time_sums = np.bincount(inv, weights=rows["time_spent"], minlength=n_topics)
+    # Stable sort keeps each topic's rows contiguous and in history order
+    grouped = np.argsort(inv, kind="stable")
+    group_starts = np.concatenate(([0], np.cumsum(total_counts)[:-1]))
+
+    # Per-topic analysis, topics in order of first appearance
     analyses: List[CompetencyAnalysis] = []
 
-    for topic, entries in topic_data.items():
+    for g in np.argsort(first_idx):
+        topic = str(topics[g])
         topic_name = topic.replace("_", " ").title()
+        idx = grouped[group_starts[g]:group_starts[g] + total_counts[g]]
+        total_count = int(total_counts[g])
 
         # Accuracy
-        correct_count = 0
-        total_count = 0
-        first_attempt_correct = 0
-        first_attempt_total = 0
-        times: List[float] = []
-        accuracies: List[bool] = []
-        attempt_counts: List[int] = []
-        scores_over_time: List[Tuple[float, float]] = []
-
-        for entry in entries:
-            total_count += 1
-            score = entry.get("score", 0)
-            total = max(entry.get("total", 1), 1)
-            pct = (score / total) * 100
-            correct = pct >= 50
-            if correct:
-                correct_count += 1
-
-            attempts = entry.get("attempts", 1)
-            if attempts <= 1 and correct:
-                first_attempt_correct += 1
-            first_attempt_total += 1
-
-            time_spent = entry.get("timeTaken") or entry.get("timeSpent") or 60
-            times.append(float(time_spent))
-            accuracies.append(correct)
-            attempt_counts.append(max(attempts, 1))
-
-            # Timestamp for velocity
-            ts = entry.get("completedAt") or entry.get("timestamp") or entry.get("date")
-            if ts:
-                if isinstance(ts, (int, float)):
-                    day_val = ts / 86400
-                elif hasattr(ts, "seconds"):
-                    day_val = ts.seconds / 86400
-                elif isinstance(ts, datetime):
-                    day_val = ts.timestamp() / 86400
-                elif isinstance(ts, str):
-                    try:
-                        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                        day_val = dt.timestamp() / 86400
-                    except Exception:
-                        day_val = time.time() / 86400
-                else:
-                    day_val = time.time() / 86400
-                scores_over_time.append((day_val, pct))
+        pct = pct_all[idx]
+        correct = correct_all[idx]
+        attempts = rows["attempts"][idx]
+        times = rows["time_spent"][idx]
+        correct_count = int(correct_counts[g])
+        first_attempt_correct = int(first_attempt_counts[g])
+
+        # Timestamps for velocity
+        days = rows["day"][idx]
+        has_day = ~np.isnan(days)
+        scores_over_time = list(zip(days[has_day].tolist(), pct[has_day].tolist()))
 
         avg_accuracy = (correct_count / max(total_count, 1)) * 100
-        mastery_pct = (first_attempt_correct / max(first_attempt_total, 1)) * 100
+        mastery_pct = (first_attempt_correct / max(total_count, 1)) * 100
 
         # Class average time (use all entries as proxy)
-        class_avg_time = float(np.mean(times)) if times else 60.0
+        class_avg_time = float(time_sums[g]) / max(total_count, 1)
 
-        efficiency = _calculate_efficiency_score(times, accuracies, class_avg_time, attempt_counts)
+        efficiency = _calculate_efficiency_score(times, correct, class_avg_time, np.maximum(attempts, 1))
         velocity = _calculate_learning_velocity(scores_over_time)
         competency_level = _get_competency_level(avg_accuracy)
 
         # Last attempt date
         last_date = None
         if scores_over_time:
-            last_ts = max(t for t, _ in scores_over_time)
+            last_ts = float(days[has_day].max())
             last_date = datetime.utcfromtimestamp(last_ts * 86400).isoformat()
 
         analyses.append(CompetencyAnalysis(
@@ -790,7 +1227,7 @@ async def compute_competency_analysis(
     else:
         overall = None
 
-    return CompetencyAnalysisResponse(
+    result = CompetencyAnalysisResponse(
         studentId=student_id,
         status="success",
         analyses=analyses,
@@ -798,26 +1235,33 @@ async def compute_competency_analysis(
         thetaEstimate=theta,
     )
 
+    await _cache_set(_competency_cache, cache_key, result)
+    return result
+
 
 # ─── Enhanced Risk Prediction ─────────────────────────────────
 
 
 def _build_risk_features(data: EnhancedRiskRequest) -> np.ndarray:
-    """Build feature vector for risk prediction."""
-    features = [
-        data.engagementScore,
-        data.avgQuizScore,
-        data.attendance,
-        data.assignmentCompletion,
-        0,  # streak removed
-        data.xpGrowthRate or 0.0,
-        data.timeOnPlatform or 0.0,
-        data.engagementTrend7d or 0.0,
-        data.quizScoreVariance or 0.0,
-        data.consecutiveAbsences or 0,
-        data.daysSinceLastActivity or 0,
-    ]
-    return np.array(features).reshape(1, -1)
+    """
+    Build feature vector for risk prediction.
+    Fills a fresh (1, 11) float32 row in place — the dtype ONNX Runtime and the
+    tree models consume — so no intermediate list or float64 copy is allocated.
+    """
+    features = np.empty((1, len(RISK_FEATURE_NAMES)), dtype=np.float32)
+    row = features[0]
+    row[0] = data.engagementScore
+    row[1] = data.avgQuizScore
+    row[2] = data.attendance
+    row[3] = data.assignmentCompletion
+    row[4] = 0  # streak removed
+    row[5] = data.xpGrowthRate or 0.0
+    row[6] = data.timeOnPlatform or 0.0
+    row[7] = data.engagementTrend7d or 0.0
+    row[8] = data.quizScoreVariance or 0.0
+    row[9] = data.consecutiveAbsences or 0
+    row[10] = data.daysSinceLastActivity or 0
+    return features
 
 
 RISK_FEATURE_NAMES = [
@@ -833,10 +1277,94 @@ RISK_FEATURE_NAMES = [
     "consecutiveAbsences",
     "daysSinceLastActivity",
 ]
+RISK_FEATURE_INDEX: Mapping[str, int] = MappingProxyType({name: i for i, name in enumerate(RISK_FEATURE_NAMES)})
+
+# (column, profile field, default) for risk-model training rows read from user documents;
+# streak, engagementTrend7d and quizScoreVariance are not stored there and stay 0
+_RISK_TRAINING_COLUMNS = tuple(
+    (RISK_FEATURE_INDEX[field], field, default)
+    for field, default in (
+        ("engagementScore", 50),
+        ("avgQuizScore", 50),
+        ("attendance", 80),
+        ("assignmentCompletion", 60),
+        ("xpGrowthRate", 0),
+        ("timeOnPlatform", 0),
+        ("consecutiveAbsences", 0),
+        ("daysSinceLastActivity", 0),
+    )
+)
+
+
+class _OnnxRiskModel:
+    """predict / predict_proba adapter over an ONNX Runtime session for the risk classifier."""
+
+    def __init__(self, session: Any):
+        self._session = session
+        self._input_name = session.get_inputs()[0].name
+        self._source_model: Any = None
+
+    def _run(self, features: np.ndarray) -> List[np.ndarray]:
+        return self._session.run(None, {self._input_name: np.asarray(features, dtype=np.float32)})
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return self._run(features)[0]
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        return self._run(features)[1]
+
+    def predict_with_proba(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Labels and class probabilities from a single session run."""
+        label, proba = self._run(features)[:2]
+        return label, proba
+
+    @property
+    def source_model(self) -> Any:
+        """Original fitted estimator, loaded lazily for SHAP / feature-importance explanations."""
+        if self._source_model is None:
+            self._source_model = joblib.load(RISK_MODEL_PATH, mmap_mode="r")
+        return self._source_model
+
+    @property
+    def feature_importances_(self) -> np.ndarray:
+        return self.source_model.feature_importances_
+
+
+def _export_risk_model_onnx(model: Any) -> bool:
+    """
+    Convert a fitted risk classifier to ONNX so inference can run on ONNX Runtime.
+    Both model types export to a single TreeEnsembleClassifier node. There are no
+    MatMul/Gemm weights, so INT8 dynamic quantization does not apply to them.
+    """
+    n_features = len(RISK_FEATURE_NAMES)
+    try:
+        if HAS_XGBOOST and isinstance(model, xgb.XGBClassifier):
+            if not HAS_ONNXMLTOOLS:
+                return False
+            onnx_model = onnxmltools.convert_xgboost(
+                model,
+                initial_types=[("X", onnxmltools_types.FloatTensorType([None, n_features]))],
+            )
+        elif HAS_SKL2ONNX:
+            onnx_model = convert_sklearn(
+                model,
+                initial_types=[("X", FloatTensorType([None, n_features]))],
+                options={id(model): {"zipmap": False}},
+            )
+        else:
+            return False
+
+        with open(RISK_ONNX_MODEL_PATH, "wb") as f:
+            f.write(onnx_model.SerializeToString())
+        logger.info(f"Risk model exported to {RISK_ONNX_MODEL_PATH}")
+        return True
+    except Exception as e:
+        logger.warning(f"ONNX export of risk model failed: {e}")
+        return False
 
 
 def _load_risk_model():
-    """Load trained risk model from disk."""
+    """Load trained risk model from disk, preferring the ONNX Runtime export."""
     if not HAS_JOBLIB:
         return None
 
@@ -845,9 +1373,20 @@ def _load_risk_model():
     if cached is not None:
         return cached
 
+    if HAS_ONNXRUNTIME and os.path.exists(RISK_ONNX_MODEL_PATH) and os.path.exists(RISK_MODEL_PATH):
+        try:
+            session = ort.InferenceSession(RISK_ONNX_MODEL_PATH, providers=["CPUExecutionProvider"])
+            model = _OnnxRiskModel(session)
+            _risk_model_cache[cache_key] = model
+            logger.info("Loaded ONNX risk model from disk")
+            return model
+        except Exception as e:
+            logger.warning(f"Error loading ONNX risk model; falling back to joblib: {e}")
+
     if os.path.exists(RISK_MODEL_PATH):
         try:
-            model = joblib.load(RISK_MODEL_PATH)
+            # mmap_mode lets worker processes share the model's array pages
+            model = joblib.load(RISK_MODEL_PATH, mmap_mode="r")
             _risk_model_cache[cache_key] = model
             logger.info("Loaded trained risk model from disk")
             return model
@@ -856,6 +1395,53 @@ def _load_risk_model():
     return None
 
 
+# Static per-level outputs; pydantic copies these into each response, so sharing is safe
+RULE_RISK_LEVEL_PROBS = MappingProxyType({
+    "Low": MappingProxyType({"High": 0.05, "Medium": 0.15, "Low": 0.80}),
+    "Medium": MappingProxyType({"High": 0.15, "Medium": 0.55, "Low": 0.30}),
+    "High": MappingProxyType({"High": 0.70, "Medium": 0.20, "Low": 0.10}),
+})
+
+RULE_RISK_RECOMMENDATIONS = MappingProxyType({
+    "High": (
+        "Schedule immediate one-on-one check-in with student",
+        "Set up tutoring sessions for weak subjects",
+        "Contact parent/guardian about academic concerns",
+        "Create a structured study plan with daily goals",
+    ),
+    "Medium": (
+        "Monitor progress closely over next 2 weeks",
+        "Encourage participation in study groups",
+        "Assign additional practice exercises for weak areas",
+    ),
+    "Low": (
+        "Continue current learning approach",
+        "Challenge with advanced material when ready",
+    ),
+})
+
+ML_RISK_RECOMMENDATIONS = MappingProxyType({
+    "High": (
+        "Immediate intervention recommended — schedule one-on-one session",
+        "Review recent quiz performance for specific skill gaps",
+        "Contact parent/guardian about academic concerns",
+        "Create personalised remediation plan",
+    ),
+    "Medium": (
+        "Monitor student progress more frequently",
+        "Assign targeted practice for weak areas",
+        "Encourage peer study groups",
+    ),
+    "Low": (
+        "Student is performing well — maintain current pace",
+        "Consider enrichment activities for advanced topics",
+    ),
+})
+
+# Risk levels whose ML predictions get per-student SHAP explanations
+SHAP_RISK_LEVELS = frozenset({"High", "Medium"})
+
+
 def _rule_based_risk(data: EnhancedRiskRequest) -> EnhancedRiskPrediction:
     """Fallback rule-based risk prediction when no ML model is available."""
     score = (
@@ -879,13 +1465,11 @@ def _rule_based_risk(data: EnhancedRiskRequest) -> EnhancedRiskPrediction:
 
     if score >= 70:
         risk_level = "Low"
-        probs = {"High": 0.05, "Medium": 0.15, "Low": 0.80}
     elif score >= 45:
         risk_level = "Medium"
-        probs = {"High": 0.15, "Medium": 0.55, "Low": 0.30}
     else:
         risk_level = "High"
-        probs = {"High": 0.70, "Medium": 0.20, "Low": 0.10}
+    probs = RULE_RISK_LEVEL_PROBS[risk_level]
 
     factors = []
     if data.avgQuizScore < 50:
@@ -901,32 +1485,12 @@ def _rule_based_risk(data: EnhancedRiskRequest) -> EnhancedRiskPrediction:
     if not factors:
         factors.append({"feature": "overall", "impact": 0.0, "detail": "No major risk factors identified"})
 
-    recommendations = []
-    if risk_level == "High":
-        recommendations = [
-            "Schedule immediate one-on-one check-in with student",
-            "Set up tutoring sessions for weak subjects",
-            "Contact parent/guardian about academic concerns",
-            "Create a structured study plan with daily goals",
-        ]
-    elif risk_level == "Medium":
-        recommendations = [
-            "Monitor progress closely over next 2 weeks",
-            "Encourage participation in study groups",
-            "Assign additional practice exercises for weak areas",
-        ]
-    else:
-        recommendations = [
-            "Continue current learning approach",
-            "Challenge with advanced material when ready",
-        ]
-
     return EnhancedRiskPrediction(
         riskLevel=risk_level,
         confidence=round(max(probs.values()), 3),
-        probabilities=probs,
+        probabilities=dict(probs),
         contributingFactors=factors[:3],
-        recommendations=recommendations,
+        recommendations=list(RULE_RISK_RECOMMENDATIONS[risk_level]),
         modelUsed="rule_based",
         risk_level=_to_strict_risk_level(risk_level),
         risk_score=round(float(probs.get("High", 0.0)), 4),
@@ -934,6 +1498,65 @@ def _rule_based_risk(data: EnhancedRiskRequest) -> EnhancedRiskPrediction:
     )
 
 
+RULE_RISK_LEVELS = np.array(["Low", "Medium", "High"])
+# Rows follow RULE_RISK_LEVELS; columns are P(High), P(Medium), P(Low)
+RULE_RISK_PROBS = np.array([
+    [RULE_RISK_LEVEL_PROBS[level][k] for k in ("High", "Medium", "Low")] for level in RULE_RISK_LEVELS
+])
+
+
+def _rule_based_risk_batch(
+    engagement: Any,
+    avg_quiz: Any,
+    attendance: Any,
+    assignment_completion: Any,
+    consecutive_absences: Any,
+    days_since_last_activity: Any,
+    engagement_trend: Any,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Branchless, whole-class version of the _rule_based_risk scoring rules.
+    Returns (scores, risk_levels, probabilities) with probabilities shaped (N, 3).
+    """
+    score = (
+        np.asarray(engagement, dtype=np.float64) * 0.25
+        + np.asarray(avg_quiz, dtype=np.float64) * 0.30
+        + np.asarray(attendance, dtype=np.float64) * 0.25
+        + np.asarray(assignment_completion, dtype=np.float64) * 0.20
+    )
+    score -= 10 * (np.asarray(consecutive_absences) >= 3)
+    score -= 10 * (np.asarray(days_since_last_activity) >= 7)
+    score += 5 * (np.asarray(engagement_trend) > 0)
+    np.clip(score, 0, 100, out=score)
+
+    level_idx = 2 - (score >= 45) - (score >= 70)
+    return score, RULE_RISK_LEVELS[level_idx], RULE_RISK_PROBS[level_idx]
+
+
+def _top_k_indices(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest values, largest first (ties keep feature order)."""
+    k = min(k, len(values))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    # O(n) selection of the k-th largest; ties at the cut-off go to the lowest indices
+    kth = -np.partition(-values, k - 1)[k - 1]
+    above = np.flatnonzero(values > kth)
+    top = np.concatenate((above, np.flatnonzero(values == kth)[:k - len(above)]))
+    return top[np.lexsort((top, -values[top]))]
+
+
+def _get_shap_explainer(model: Any) -> Any:
+    """Return the TreeExplainer for the loaded risk model, building it once per model."""
+    tree_model = getattr(model, "source_model", model)
+    cached = _shap_explainer_cache.get(id(tree_model))
+    if cached is not None and cached[0] is tree_model:
+        return cached[1]
+    explainer = shap.TreeExplainer(tree_model)
+    _shap_explainer_cache.clear()
+    _shap_explainer_cache[id(tree_model)] = (tree_model, explainer)
+    return explainer
+
+
 async def predict_risk_enhanced(data: EnhancedRiskRequest) -> EnhancedRiskPrediction:
     """Enhanced risk prediction using trained ML model with SHAP explanations."""
     model = _load_risk_model()
@@ -946,9 +1569,13 @@ async def predict_risk_enhanced(data: EnhancedRiskRequest) -> EnhancedRiskPredic
         features = _build_risk_features(data)
         label_map = {0: "High", 1: "Medium", 2: "Low"}
 
-        # Predict
-        prediction = model.predict(features)[0]
-        probabilities_raw = model.predict_proba(features)[0]
+        # Predict; features is already a C-contiguous float32 row, shared with SHAP below
+        if isinstance(model, _OnnxRiskModel):
+            labels, proba = model.predict_with_proba(features)
+        else:
+            labels, proba = model.predict(features), model.predict_proba(features)
+        prediction = labels[0]
+        probabilities_raw = proba[0]
         risk_level = label_map.get(int(prediction), "Medium")
 
         probs = {}
@@ -960,26 +1587,20 @@ async def predict_risk_enhanced(data: EnhancedRiskRequest) -> EnhancedRiskPredic
 
         confidence = round(float(max(probabilities_raw)), 4)
 
-        # SHAP explanations
+        # SHAP explanations, only where the factors are surfaced to teachers
         factors = []
-        if HAS_SHAP:
+        if HAS_SHAP and risk_level in SHAP_RISK_LEVELS:
             try:
-                explainer = shap.TreeExplainer(model)
-                shap_values = explainer.shap_values(features)
-
-                if isinstance(shap_values, list):
-                    # Multi-class: use SHAP values for predicted class
-                    sv = shap_values[int(prediction)][0]
-                else:
-                    sv = shap_values[0]
+                sv = _get_shap_explainer(model)(features).values[0]
+                if sv.ndim == 2:
+                    # Multi-class: (features, classes); use SHAP values for predicted class
+                    sv = sv[:, int(prediction)]
 
                 # Get top 3 contributing features
-                feature_impacts = list(zip(RISK_FEATURE_NAMES, sv))
-                feature_impacts.sort(key=lambda x: abs(x[1]), reverse=True)
-
-                for fname, impact in feature_impacts[:3]:
-                    idx = RISK_FEATURE_NAMES.index(fname)
-                    fval = features[0][idx]
+                for idx in _top_k_indices(np.abs(sv), 3):
+                    fname = RISK_FEATURE_NAMES[idx]
+                    impact = sv[idx]
+                    fval = features[0, idx]
                     factors.append({
                         "feature": fname,
                         "impact": round(float(impact), 4),
@@ -989,48 +1610,26 @@ async def predict_risk_enhanced(data: EnhancedRiskRequest) -> EnhancedRiskPredic
             except Exception as e:
                 logger.warning(f"SHAP explanation failed: {e}")
                 factors = [{"feature": "model_prediction", "impact": 0.0, "detail": "SHAP unavailable"}]
-        else:
-            # Feature importance fallback
-            if hasattr(model, "feature_importances_"):
-                importances = model.feature_importances_
-                fi = list(zip(RISK_FEATURE_NAMES, importances))
-                fi.sort(key=lambda x: x[1], reverse=True)
-                for fname, imp in fi[:3]:
-                    idx = RISK_FEATURE_NAMES.index(fname)
-                    fval = features[0][idx]
-                    factors.append({
-                        "feature": fname,
-                        "impact": round(float(imp), 4),
-                        "value": round(float(fval), 2),
-                        "detail": f"{fname} = {fval:.1f} (importance: {imp:.3f})",
-                    })
-
-        # Recommendations based on prediction
-        if risk_level == "High":
-            recommendations = [
-                "Immediate intervention recommended — schedule one-on-one session",
-                "Review recent quiz performance for specific skill gaps",
-                "Contact parent/guardian about academic concerns",
-                "Create personalised remediation plan",
-            ]
-        elif risk_level == "Medium":
-            recommendations = [
-                "Monitor student progress more frequently",
-                "Assign targeted practice for weak areas",
-                "Encourage peer study groups",
-            ]
-        else:
-            recommendations = [
-                "Student is performing well — maintain current pace",
-                "Consider enrichment activities for advanced topics",
-            ]
+        elif hasattr(model, "feature_importances_"):
+            # Feature importance fallback (no SHAP, or a Low prediction)
+            importances = np.asarray(model.feature_importances_)
+            for idx in _top_k_indices(importances, 3):
+                fname = RISK_FEATURE_NAMES[idx]
+                imp = importances[idx]
+                fval = features[0, idx]
+                factors.append({
+                    "feature": fname,
+                    "impact": round(float(imp), 4),
+                    "value": round(float(fval), 2),
+                    "detail": f"{fname} = {fval:.1f} (importance: {imp:.3f})",
+                })
 
         return EnhancedRiskPrediction(
             riskLevel=risk_level,
             confidence=confidence,
             probabilities=probs,
             contributingFactors=factors,
-            recommendations=recommendations,
+            recommendations=list(ML_RISK_RECOMMENDATIONS[risk_level]),
             modelUsed="ml_model",
             risk_level=_to_strict_risk_level(risk_level),
             risk_score=round(float(probs.get("High", 0.0)), 4),
@@ -1131,59 +1730,46 @@ async def train_risk_model(force_retrain: bool = False) -> RiskTrainResponse:
             modelPath=RISK_MODEL_PATH,
         )
 
-    # Fetch historical data from Firestore
+    # Fetch historical data from Firestore straight into a preallocated feature matrix
     db = _get_firestore_db()
-    X_data = []
-    y_data = []
+    X = np.zeros((RISK_TRAINING_FETCH_LIMIT, len(RISK_FEATURE_NAMES)), dtype=np.float32)
+    y = np.full(RISK_TRAINING_FETCH_LIMIT, 2, dtype=np.int64)  # default label: Low
+    n_rows = 0
 
     if db is not None:
         try:
-            users_ref = db.collection("users").where("role", "==", "student").limit(500)
-            user_docs = users_ref.stream()
-
-            for doc in user_docs:
-                data = doc.to_dict()
-                if not data:
-                    continue
-
-                features = [
-                    data.get("engagementScore", 50),
-                    data.get("avgQuizScore", 50),
-                    data.get("attendance", 80),
-                    data.get("assignmentCompletion", 60),
-                    0,  # streak removed
-                    data.get("xpGrowthRate", 0),
-                    data.get("timeOnPlatform", 0),
-                    0.0,  # engagementTrend7d
-                    0.0,  # quizScoreVariance
-                    data.get("consecutiveAbsences", 0),
-                    data.get("daysSinceLastActivity", 0),
-                ]
-                X_data.append(features)
+            users_ref = (
+                db.collection("users")
+                .where("role", "==", "student")
+                .select(RISK_TRAINING_FIELDS)
+                .limit(RISK_TRAINING_FETCH_LIMIT)
+            )
+            user_docs = await asyncio.to_thread(_collect_docs, users_ref)
+
+            for data in user_docs[:RISK_TRAINING_FETCH_LIMIT]:
+                row = X[n_rows]
+                for col, field, default in _RISK_TRAINING_COLUMNS:
+                    row[col] = data.get(field, default)
 
                 # Determine label from existing riskLevel or compute it
                 risk = data.get("riskLevel", "")
                 if risk == "High":
-                    y_data.append(0)
+                    y[n_rows] = 0
                 elif risk == "Medium":
-                    y_data.append(1)
-                else:
-                    y_data.append(2)
+                    y[n_rows] = 1
+                n_rows += 1
 
         except Exception as e:
             logger.error(f"Error fetching training data: {e}")
 
+    X, y = X[:n_rows], y[:n_rows]
+
     # If insufficient real data, generate synthetic training data
-    if len(X_data) < 50:
+    if n_rows < 50:
         logger.info("Insufficient Firestore data; generating synthetic training data")
         synth_X, synth_y = _generate_synthetic_risk_data(500)
-        for row in synth_X:
-            X_data.append(list(row))
-        for label in synth_y:
-            y_data.append(int(label))
-
-    X = np.array(X_data)
-    y = np.array(y_data)
+        X = np.concatenate((X, synth_X.astype(np.float32)))
+        y = np.concatenate((y, synth_y))
 
     # Train/test split
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
@@ -1198,7 +1784,9 @@ async def train_risk_model(force_retrain: bool = False) -> RiskTrainResponse:
             num_class=3,
             eval_metric="mlogloss",
             random_state=42,
-            use_label_encoder=False,
+            tree_method="hist",
+            device="cpu",
+            enable_categorical=False,
         )
         logger.info("Training XGBoost risk classifier")
     else:
@@ -1207,6 +1795,7 @@ async def train_risk_model(force_retrain: bool = False) -> RiskTrainResponse:
             max_depth=10,
             random_state=42,
             class_weight="balanced",
+            n_jobs=-1,
         )
         logger.info("Training Random Forest risk classifier")
 
@@ -1223,11 +1812,17 @@ async def train_risk_model(force_retrain: bool = False) -> RiskTrainResponse:
 
     # Save model
     os.makedirs(os.path.dirname(RISK_MODEL_PATH), exist_ok=True)
-    joblib.dump(model, RISK_MODEL_PATH)
+    # Uncompressed so loads can memory-map the tree arrays (joblib cannot mmap compressed files)
+    joblib.dump(model, RISK_MODEL_PATH, protocol=5)
     logger.info(f"Risk model saved to {RISK_MODEL_PATH}")
 
-    # Clear model cache so next prediction loads new model
+    # Drop any stale ONNX export so it can never shadow the freshly trained model
+    if not _export_risk_model_onnx(model) and os.path.exists(RISK_ONNX_MODEL_PATH):
+        os.remove(RISK_ONNX_MODEL_PATH)
+
+    # Clear model and explainer caches so next prediction loads new model
     _risk_model_cache.clear()
+    _shap_explainer_cache.clear()
 
     return RiskTrainResponse(
         status="trained",
@@ -1235,76 +1830,44 @@ async def train_risk_model(force_retrain: bool = False) -> RiskTrainResponse:
         precision=round(prec, 4),
         recall=round(rec, 4),
         f1Score=round(f1, 4),
-        samplesUsed=len(X_data),
+        samplesUsed=len(X),
         modelPath=RISK_MODEL_PATH,
     )
 
 
+# Per-class (mean, std) of each RISK_FEATURE_NAMES column for synthetic training data.
+# Rows are risk classes 0 = High, 1 = Medium, 2 = Low.
+_SYNTHETIC_RISK_MEANS = np.array([
+    # engagement quiz attendance completion streak xp_growth time trend variance absences inactive
+    [30.0, 35.0, 50.0, 35.0, 0.0, -0.5, 2.0, -10.0, 25.0, 4.0, 10.0],
+    [55.0, 60.0, 72.0, 60.0, 0.0, 0.2, 5.0, 0.0, 15.0, 2.0, 3.0],
+    [82.0, 85.0, 93.0, 88.0, 0.0, 1.0, 10.0, 5.0, 8.0, 0.0, 1.0],
+])
+_SYNTHETIC_RISK_STDS = np.array([
+    [15.0, 12.0, 15.0, 15.0, 0.0, 0.3, 1.0, 5.0, 8.0, 2.0, 5.0],
+    [12.0, 10.0, 10.0, 12.0, 0.0, 0.3, 2.0, 8.0, 5.0, 1.0, 3.0],
+    [10.0, 8.0, 5.0, 8.0, 0.0, 0.4, 3.0, 5.0, 3.0, 0.0, 1.0],
+])
+_SYNTHETIC_RISK_CLASS_P = [0.2, 0.3, 0.5]
+_SYNTHETIC_PERCENT_COLS = [
+    RISK_FEATURE_INDEX[f] for f in ("engagementScore", "avgQuizScore", "attendance", "assignmentCompletion")
+]
+_SYNTHETIC_NONNEG_COLS = [RISK_FEATURE_INDEX[f] for f in ("timeOnPlatform", "quizScoreVariance")]
+_SYNTHETIC_COUNT_COLS = [RISK_FEATURE_INDEX[f] for f in ("consecutiveAbsences", "daysSinceLastActivity")]
+
+
 def _generate_synthetic_risk_data(n: int) -> Tuple[np.ndarray, np.ndarray]:
     """Generate synthetic student data for model training."""
-    np.random.seed(42)
-
-    X = []
-    y = []
-
-    for _ in range(n):
-        risk_class = np.random.choice([0, 1, 2], p=[0.2, 0.3, 0.5])
-
-        if risk_class == 0:  # High risk
-            engagement = np.random.normal(30, 15)
-            quiz = np.random.normal(35, 12)
-            attendance = np.random.normal(50, 15)
-            completion = np.random.normal(35, 15)
-            # streak removed
-            xp_growth = np.random.normal(-0.5, 0.3)
-            time_platform = np.random.normal(2, 1)
-            trend = np.random.normal(-10, 5)
-            variance = np.random.normal(25, 8)
-            absences = max(0, int(np.random.normal(4, 2)))
-            days_inactive = max(0, int(np.random.normal(10, 5)))
-        elif risk_class == 1:  # Medium risk
-            engagement = np.random.normal(55, 12)
-            quiz = np.random.normal(60, 10)
-            attendance = np.random.normal(72, 10)
-            completion = np.random.normal(60, 12)
-            # streak removed
-            xp_growth = np.random.normal(0.2, 0.3)
-            time_platform = np.random.normal(5, 2)
-            trend = np.random.normal(0, 8)
-            variance = np.random.normal(15, 5)
-            absences = max(0, int(np.random.normal(2, 1)))
-            days_inactive = max(0, int(np.random.normal(3, 3)))
-        else:  # Low risk
-            engagement = np.random.normal(82, 10)
-            quiz = np.random.normal(85, 8)
-            attendance = np.random.normal(93, 5)
-            completion = np.random.normal(88, 8)
-            # streak removed
-            xp_growth = np.random.normal(1.0, 0.4)
-            time_platform = np.random.normal(10, 3)
-            trend = np.random.normal(5, 5)
-            variance = np.random.normal(8, 3)
-            absences = 0
-            days_inactive = max(0, int(np.random.normal(1, 1)))
-
-        features = [
-            max(0, min(100, engagement)),
-            max(0, min(100, quiz)),
-            max(0, min(100, attendance)),
-            max(0, min(100, completion)),
-            0,  # streak removed
-            xp_growth,
-            max(0, time_platform),
-            trend,
-            max(0, variance),
-            absences,
-            days_inactive,
-        ]
+    rng = np.random.default_rng(42)
 
-        X.append(features)
-        y.append(risk_class)
+    y = rng.choice(3, size=n, p=_SYNTHETIC_RISK_CLASS_P)
+    X = _SYNTHETIC_RISK_MEANS[y] + _SYNTHETIC_RISK_STDS[y] * rng.standard_normal((n, len(RISK_FEATURE_NAMES)))
 
-    return np.array(X), np.array(y)
+    X[:, _SYNTHETIC_PERCENT_COLS] = np.clip(X[:, _SYNTHETIC_PERCENT_COLS], 0, 100)
+    X[:, _SYNTHETIC_NONNEG_COLS] = np.maximum(X[:, _SYNTHETIC_NONNEG_COLS], 0)
+    X[:, _SYNTHETIC_COUNT_COLS] = np.maximum(np.trunc(X[:, _SYNTHETIC_COUNT_COLS]), 0)
+
+    return X, y
 
 
 # ─── Quiz Difficulty Calibration ───────────────────────────────
@@ -1318,9 +1881,9 @@ async def calibrate_question_difficulty(request: CalibrateDifficultyRequest) ->
     if not responses:
         raise ValueError("No student responses provided")
 
-    correct_count = sum(1 for r in responses if r.get("correct", False))
     total = len(responses)
-    success_rate = correct_count / total
+    correct = np.fromiter((bool(r.get("correct", False)) for r in responses), dtype=bool, count=total)
+    success_rate = int(correct.sum()) / total
 
     # Difficulty parameter b = logit(1 - p_correct)
     p = max(0.01, min(0.99, success_rate))  # clamp to avoid infinity
@@ -1328,17 +1891,16 @@ async def calibrate_question_difficulty(request: CalibrateDifficultyRequest) ->
 
     # Discrimination parameter a
     # Split students into high and low performers by time
-    if len(responses) >= 4:
-        times = [r.get("timeSpent", 60) for r in responses]
-        median_time = sorted(times)[len(times) // 2]
+    if total >= 4:
+        times = np.fromiter((r.get("timeSpent", 60) for r in responses), dtype=np.float64, count=total)
+        median_time = np.partition(times, total // 2)[total // 2]  # upper median
 
-        fast_correct = sum(1 for r in responses if r.get("correct") and r.get("timeSpent", 60) <= median_time)
-        fast_total = sum(1 for r in responses if r.get("timeSpent", 60) <= median_time)
-        slow_correct = sum(1 for r in responses if r.get("correct") and r.get("timeSpent", 60) > median_time)
-        slow_total = sum(1 for r in responses if r.get("timeSpent", 60) > median_time)
+        fast = times <= median_time
+        fast_total = int(fast.sum())
+        slow_total = total - fast_total
 
-        p_fast = fast_correct / max(fast_total, 1)
-        p_slow = slow_correct / max(slow_total, 1)
+        p_fast = int((correct & fast).sum()) / max(fast_total, 1)
+        p_slow = int((correct & ~fast).sum()) / max(slow_total, 1)
 
         # Higher discrimination if fast students do much better
         a = round(max(0.3, min(3.0, (p_fast - p_slow) * 3 + 1.0)), 3)
@@ -1368,7 +1930,7 @@ async def calibrate_question_difficulty(request: CalibrateDifficultyRequest) ->
     await store_question_difficulty(request.questionId, params)
 
     # Cache it
-    _cache_set(_difficulty_cache, request.questionId, params)
+    await _cache_set(_difficulty_cache, request.questionId, params)
 
     return CalibrateDifficultyResponse(
         questionId=request.questionId,
@@ -1381,6 +1943,16 @@ async def calibrate_question_difficulty(request: CalibrateDifficultyRequest) ->
     )
 
 
+def _entry_is_correct(entry: Dict[str, Any]) -> bool:
+    """Correctness of a quiz history entry; falls back to score/total >= 50%."""
+    correct = entry.get("correct", False)
+    if isinstance(correct, (int, float)):
+        correct = correct > 0.5
+    if not isinstance(correct, bool):
+        correct = (entry.get("score", 0) / max(entry.get("total", 1), 1)) >= 0.5
+    return correct
+
+
 async def select_adaptive_quiz(request: AdaptiveQuizRequest) -> AdaptiveQuizResponse:
     """
     Select questions adaptively based on student ability and IRT parameters.
@@ -1396,22 +1968,14 @@ async def select_adaptive_quiz(request: AdaptiveQuizRequest) -> AdaptiveQuizResp
     ]
 
     if topic_entries:
-        responses_for_irt = []
-        difficulty_params = {}
-        for i, entry in enumerate(topic_entries):
-            qid = entry.get("questionId", f"q_{i}")
-            correct = entry.get("correct", False)
-            if isinstance(correct, (int, float)):
-                correct = correct > 0.5
-            score = entry.get("score", 0)
-            total = max(entry.get("total", 1), 1)
-            if not isinstance(correct, bool):
-                correct = (score / total) >= 0.5
-
-            responses_for_irt.append({"questionId": qid, "correct": correct})
-            difficulty_params[qid] = {"a": 1.0, "b": 0.0, "c": 0.25}
-
-        theta = _estimate_theta(responses_for_irt, difficulty_params)
+        n_entries = len(topic_entries)
+        correct_arr = np.fromiter(
+            (_entry_is_correct(entry) for entry in topic_entries), dtype=bool, count=n_entries
+        )
+        # Difficulty params default to a=1, b=0, c=0.25 until calibrated
+        theta = _estimate_theta_arrays(
+            np.ones(n_entries), np.zeros(n_entries), np.full(n_entries, 0.25), correct_arr
+        )
     else:
         theta = 0.0  # Default ability
 
@@ -1432,6 +1996,8 @@ async def select_adaptive_quiz(request: AdaptiveQuizRequest) -> AdaptiveQuizResp
     selected: List[AdaptiveQuizSelection] = []
     current_theta = theta
     difficulty_counts = {"easy": 0, "medium": 0, "hard": 0}
+    b_values: List[float] = []
+    labels: List[str] = []
 
     # Calculate target counts per difficulty
     target_counts = {
@@ -1473,14 +2039,18 @@ async def select_adaptive_quiz(request: AdaptiveQuizRequest) -> AdaptiveQuizResp
                 b = max(b, 1.0)
 
         difficulty_counts[diff_label] += 1
+        b_values.append(b)
+        labels.append(diff_label)
 
-        # Calculate predicted success probability
-        predicted_p = _irt_3pl_probability(current_theta, a=1.0, b=b, c=0.25)
+    # Predicted success probabilities for every selected question in one pass
+    b_arr = np.asarray(b_values, dtype=np.float64)
+    predicted = _irt_3pl_array(float(current_theta), np.ones_like(b_arr), b_arr, np.full_like(b_arr, 0.25))
 
+    for i, (b, diff_label, predicted_p) in enumerate(zip(b_values, labels, predicted)):
         selected.append(AdaptiveQuizSelection(
             questionId=f"{request.topicId}_q{i+1}",
             estimatedDifficulty=round(b, 3),
-            predictedSuccessProbability=round(predicted_p, 3),
+            predictedSuccessProbability=round(float(predicted_p), 3),
             difficultyLabel=diff_label,
         ))
 
@@ -1500,12 +2070,30 @@ async def select_adaptive_quiz(request: AdaptiveQuizRequest) -> AdaptiveQuizResp
 # ─── Topic Recommendation Engine ──────────────────────────────
 
 
-async def recommend_topics(request: TopicRecommendationRequest) -> TopicRecommendationResponse:
+def _days_since_attempt(analyses: List[CompetencyAnalysis]) -> Dict[str, int]:
+    """Whole days since each topic's lastAttemptDate, parsed in one batch; unparseable dates are omitted."""
+    dated = [a for a in analyses if a.lastAttemptDate]
+    if not dated:
+        return {}
+    parsed = pd.to_datetime(
+        pd.Series([a.lastAttemptDate for a in dated], dtype=object),
+        utc=True, errors="coerce", format="ISO8601",
+    )
+    days = (pd.Timestamp.now(tz="UTC") - parsed) // pd.Timedelta(days=1)
+    return {a.topicId: int(d) for a, d in zip(dated, days) if not pd.isna(d)}
+
+
+async def recommend_topics(
+    request: TopicRecommendationRequest,
+    quiz_history: Optional[List[Dict[str, Any]]] = None,
+) -> TopicRecommendationResponse:
     """
     Recommend topics based on competency gaps, prerequisites, and peer data.
+    Callers that already fetched the student's quiz history can pass it to skip the re-read.
     """
     student_id = request.studentId
-    quiz_history = await fetch_student_quiz_history(student_id)
+    if quiz_history is None:
+        quiz_history = await fetch_student_quiz_history(student_id)
 
     if not quiz_history:
         # Cold start: recommend foundational topics
@@ -1552,25 +2140,29 @@ async def recommend_topics(request: TopicRecommendationRequest) -> TopicRecommen
     for a in comp_result.analyses:
         topic_competencies[a.topicId] = a
 
-    # Score each topic
-    all_topics = set()
-    for a in comp_result.analyses:
-        all_topics.add(a.topicId)
-    for topic, prereqs in dependencies.items():
-        all_topics.add(topic)
-        all_topics.update(prereqs)
+    # Score each topic: everything attempted plus the (import-time) graph catalog, minus
+    # topics already mastered
+    mastered = {t for t, c in topic_competencies.items() if c.competencyLevel == "advanced"}
+    candidate_topics = (topic_competencies.keys() | _PREREQ_TOPIC_INDEX.keys()) - mastered
+
+    # Prerequisite stats for every graph topic in one pass; unattempted prerequisites count as 0%
+    graph_accuracy = np.zeros(len(_PREREQ_TOPICS))
+    for topic_id, a in topic_competencies.items():
+        idx = _PREREQ_TOPIC_INDEX.get(topic_id)
+        if idx is not None:
+            graph_accuracy[idx] = a.averageAccuracy
+    prereq_avgs = (_PREREQ_BITS @ graph_accuracy) / np.maximum(_PREREQ_COUNTS, 1)
+    prereqs_met_mask: np.ndarray = ~(_PREREQ_BITS & (graph_accuracy < 50)).any(axis=1)
+
+    days_since_map = _days_since_attempt(comp_result.analyses)
 
     scored_topics: List[TopicRecommendation] = []
 
-    for topic in all_topics:
+    for topic in candidate_topics:
         comp = topic_competencies.get(topic)
         current_level = comp.competencyLevel if comp else "not_attempted"
         current_score = comp.averageAccuracy if comp else 0
 
-        # Skip topics already mastered
-        if current_level == "advanced":
-            continue
-
         # 1. Weakness score (higher for weaker topics)
         if current_level == "not_attempted":
             weakness_score = 70
@@ -1582,31 +2174,17 @@ async def recommend_topics(request: TopicRecommendationRequest) -> TopicRecommen
             weakness_score = 40 - current_score * 0.3
 
         # 2. Prerequisite score (higher if prerequisites are met)
-        prereqs = dependencies.get(topic, [])
+        prereqs = dependencies.get(topic, ())
         if prereqs:
-            prereq_scores = []
-            for p in prereqs:
-                p_comp = topic_competencies.get(p)
-                if p_comp:
-                    prereq_scores.append(p_comp.averageAccuracy)
-                else:
-                    prereq_scores.append(0)
-            prereq_avg = sum(prereq_scores) / len(prereq_scores) if prereq_scores else 0
-            prereqs_met = all(s >= 50 for s in prereq_scores)
+            t_idx = _PREREQ_TOPIC_INDEX[topic]
+            prereq_avg = float(prereq_avgs[t_idx])
+            prereqs_met = bool(prereqs_met_mask[t_idx])
         else:
             prereq_avg = 100  # No prereqs needed
             prereqs_met = True
 
         # 3. Recency score (boost recently attempted topics)
-        if comp and comp.lastAttemptDate:
-            try:
-                last_dt = datetime.fromisoformat(comp.lastAttemptDate.replace("Z", "+00:00"))
-                days_since = (datetime.utcnow() - last_dt.replace(tzinfo=None)).days
-            except Exception:
-                days_since = 30
-        else:
-            days_since = 30
-
+        days_since = days_since_map.get(topic, 30)
         recency_score = min(days_since, 60)  # cap at 60
 
         # 4. Combined score
@@ -1663,12 +2241,12 @@ async def recommend_topics(request: TopicRecommendationRequest) -> TopicRecommen
             currentCompetency=current_level,
         ))
 
-    # Sort by score descending
-    scored_topics.sort(key=lambda t: t.recommendationScore, reverse=True)
+    # Top-N by score descending (heap select; ties keep candidate order, like a stable sort)
+    top_topics = heapq.nlargest(request.numRecommendations, scored_topics, key=attrgetter("recommendationScore"))
 
     return TopicRecommendationResponse(
         studentId=student_id,
-        recommendations=scored_topics[:request.numRecommendations],
+        recommendations=top_topics,
         status="success",
     )
 
@@ -1679,12 +2257,14 @@ async def recommend_topics(request: TopicRecommendationRequest) -> TopicRecommen
 async def get_student_summary(student_id: str) -> StudentSummaryResponse:
     """Aggregate all ML metrics for a single student."""
     # Check cache
-    cached = _cache_get(_competency_cache, f"summary_{student_id}", IRT_DIFFICULTY_CACHE_TTL)
+    cached = await _cache_get(_competency_cache, f"summary_{student_id}", IRT_DIFFICULTY_CACHE_TTL, StudentSummaryResponse)
     if cached:
         return cached
 
-    quiz_history = await fetch_student_quiz_history(student_id)
-    engagement = await fetch_student_engagement_metrics(student_id)
+    quiz_history, engagement = await asyncio.gather(
+        fetch_student_quiz_history(student_id),
+        fetch_student_engagement_metrics(student_id),
+    )
 
     # Competency analysis
     comp_result = await compute_competency_analysis(student_id, quiz_history)
@@ -1713,7 +2293,7 @@ async def get_student_summary(student_id: str) -> StudentSummaryResponse:
     # Topic recommendations
     try:
         rec_req = TopicRecommendationRequest(studentId=student_id, numRecommendations=5)
-        rec_result = await recommend_topics(rec_req)
+        rec_result = await recommend_topics(rec_req, quiz_history)
         recommended = [
             {
                 "topicId": r.topicId,
@@ -1731,19 +2311,13 @@ async def get_student_summary(student_id: str) -> StudentSummaryResponse:
     # Predicted next quiz score (simple linear extrapolation)
     predicted_score = None
     if quiz_history and len(quiz_history) >= 3:
-        recent_scores = []
-        for entry in quiz_history[-10:]:
-            score = entry.get("score", 0)
-            total = max(entry.get("total", 1), 1)
-            recent_scores.append((score / total) * 100)
-        if len(recent_scores) >= 3:
-            x = np.arange(len(recent_scores)).reshape(-1, 1)
-            y = np.array(recent_scores)
-            model = LinearRegression()
-            model.fit(x, y)
-            next_idx = np.array([[len(recent_scores)]], dtype=float)
-            next_pred = float(model.predict(next_idx)[0])
-            predicted_score = round(float(max(0.0, min(100.0, next_pred))), 1)
+        recent = quiz_history[-10:]
+        scores = np.fromiter((e.get("score", 0) for e in recent), dtype=np.float64, count=len(recent))
+        totals = np.fromiter((max(e.get("total", 1), 1) for e in recent), dtype=np.float64, count=len(recent))
+        recent_scores = scores / totals * 100
+        slope, intercept = np.polyfit(np.arange(len(recent_scores)), recent_scores, 1)
+        next_pred = slope * len(recent_scores) + intercept
+        predicted_score = round(float(np.clip(next_pred, 0.0, 100.0)), 1)
 
     # Engagement patterns
     engagement_patterns = {
@@ -1767,14 +2341,59 @@ async def get_student_summary(student_id: str) -> StudentSummaryResponse:
     )
 
     # Cache the result
-    _cache_set(_competency_cache, f"summary_{student_id}", result)
+    await _cache_set(_competency_cache, f"summary_{student_id}", result)
 
     return result
 
 
+def _classify_students(
+    velocities: np.ndarray,
+    predicted: np.ndarray,
+    beginner_counts: np.ndarray,
+) -> Tuple[int, int, int, np.ndarray]:
+    """
+    Velocity buckets and intervention candidates for a class.
+    Returns (improving, declining, plateaued, indices of students needing intervention);
+    a predicted score of 0 means "no prediction".
+    """
+    improving = int(np.count_nonzero(velocities > 0.01))
+    declining = int(np.count_nonzero(velocities < -0.01))
+    needs_help = (beginner_counts >= 2) | ((predicted != 0) & (predicted < 50))
+    return improving, declining, len(velocities) - improving - declining, np.flatnonzero(needs_help)
+
+
+def _classify_with_kernel(kernel: Callable[..., Tuple[int, int, int]]):
+    """Wrap an _insights_kernels.classify_students implementation in the _classify_students signature."""
+    def classify(
+        velocities: np.ndarray,
+        predicted: np.ndarray,
+        beginner_counts: np.ndarray,
+    ) -> Tuple[int, int, int, np.ndarray]:
+        out_idx = np.empty(predicted.shape[0], dtype=np.int64)
+        improving, declining, k = kernel(velocities, predicted, beginner_counts, out_idx)
+        return improving, declining, velocities.shape[0] - improving - declining, out_idx[:k]
+    return classify
+
+
+# Plain-python loop form, kept as the reference the compiled kernels are tested against
+_classify_students_loop = _classify_with_kernel(_insights_kernels.classify_students)
+
+# AOT extension expects float32 velocities, float64 predictions, int64 beginner counts
+# (the dtypes get_class_insights builds); otherwise JIT the same loop source
+if HAS_INSIGHTS_AOT:
+    _classify_students = _classify_with_kernel(_insights_kernels_aot.classify_students)
+elif HAS_NUMBA:
+    # fastmath is safe here: callers pass finite values (missing predictions are 0, not NaN)
+    _classify_students = _classify_with_kernel(
+        numba.njit(cache=True, fastmath=True)(_insights_kernels.classify_students)
+    )
+
+
 async def get_class_insights(request: ClassInsightsRequest) -> ClassInsightsResponse:
     """Aggregate class-wide ML analytics for teacher dashboards."""
-    cached = _cache_get(_class_stats_cache, f"class_{request.teacherId}_{request.classId}", IRT_DIFFICULTY_CACHE_TTL)
+    cached = await _cache_get(
+        _class_stats_cache, f"class_{request.teacherId}_{request.classId}", IRT_DIFFICULTY_CACHE_TTL, ClassInsightsResponse
+    )
     if cached:
         return cached
 
@@ -1802,285 +2421,360 @@ async def get_class_insights(request: ClassInsightsRequest) -> ClassInsightsResp
         # Generate sample data for demo
         return _generate_demo_class_insights(request)
 
-    # Aggregate per-student data
-    risk_dist = {"High": 0, "Medium": 0, "Low": 0}
-    all_velocities: List[float] = []
-    interventions: List[Dict[str, Any]] = []
-    topic_weakness_counts: Dict[str, int] = defaultdict(int)
-    hourly_engagement = defaultdict(int)
+    # Student summaries are I/O bound; fetch them concurrently, bounded by a semaphore
+    sem = asyncio.Semaphore(CLASS_INSIGHTS_CONCURRENCY)
 
-    for sid in student_ids[:50]:  # Limit for performance
-        try:
-            summary = await get_student_summary(sid)
-
-            # Risk
-            if summary.riskAssessment:
-                level = summary.riskAssessment.get("riskLevel", "Medium")
-                risk_dist[level] = risk_dist.get(level, 0) + 1
-
-            # Competencies
-            for topic, count in summary.competencyDistribution.items():
-                if topic in ("beginner", "developing") and count > 0:
-                    # Mark this as a weak area
-                    pass
-
-            # Velocities
-            for vt in summary.learningVelocityTrend:
-                all_velocities.append(vt.get("velocity", 0))
-                if vt.get("velocity", 0) < -0.01:
-                    topic_weakness_counts[vt.get("topic", "Unknown")] += 1
-
-            # Engagement
-            for hour_str, count in summary.engagementPatterns.get("hourlyActivity", {}).items():
-                hourly_engagement[int(hour_str)] += count
-
-            # Intervention needed?
-            total_beginner = summary.competencyDistribution.get("beginner", 0)
-            if total_beginner >= 2 or (summary.predictedNextQuizScore and summary.predictedNextQuizScore < 50):
-                interventions.append({
-                    "studentId": sid,
-                    "reason": "Multiple topics at beginner level" if total_beginner >= 2 else "Predicted score below 50%",
-                    "predictedScore": summary.predictedNextQuizScore,
-                    "recommendedAction": "Schedule one-on-one tutoring session",
-                })
+    async def _summary(sid: str) -> StudentSummaryResponse:
+        async with sem:
+            return await get_student_summary(sid)
 
+    sampled_ids = student_ids[:CLASS_INSIGHTS_MAX_STUDENTS]  # Limit for performance
+    summaries = await asyncio.gather(*(_summary(sid) for sid in sampled_ids), return_exceptions=True)
+
+    topic_weakness_counts: Counter[str] = Counter()
+    hours_buf: List[int] = []
+    hour_counts_buf: List[float] = []
+    ok_ids: List[str] = []
+    ok_summaries: List[StudentSummaryResponse] = []
+    for sid, summary in zip(sampled_ids, summaries):
+        if isinstance(summary, BaseException):
+            logger.warning(f"Error processing student {sid}: {summary}")
+            continue
+        hourly_activity = summary.engagementPatterns.get("hourlyActivity", {})
+        try:
+            hours = [int(hour_str) for hour_str in hourly_activity]
         except Exception as e:
             logger.warning(f"Error processing student {sid}: {e}")
+            continue
+        hours_buf.extend(hours)
+        hour_counts_buf.extend(hourly_activity.values())
+        topic_weakness_counts.update(
+            vt.get("topic", "Unknown") for vt in summary.learningVelocityTrend if vt.get("velocity", 0) < -0.01
+        )
+        ok_ids.append(sid)
+        ok_summaries.append(summary)
+
+    # Struct-of-arrays view of the per-student fields; the aggregates below are array passes
+    n_ok = len(ok_summaries)
+    beginner_counts = np.fromiter(
+        (s.competencyDistribution.get("beginner", 0) for s in ok_summaries), dtype=np.int64, count=n_ok,
+    )
+    predicted_scores = np.fromiter(
+        (s.predictedNextQuizScore or 0.0 for s in ok_summaries), dtype=np.float64, count=n_ok,
+    )
+    # float32 is ample for 4-decimal velocities; the mean still accumulates in float64
+    velocities = np.fromiter(
+        (vt.get("velocity", 0) for s in ok_summaries for vt in s.learningVelocityTrend),
+        dtype=np.float32, count=sum(len(s.learningVelocityTrend) for s in ok_summaries),
+    )
+    risk_levels = np.array(
+        [s.riskAssessment.get("riskLevel", "Medium") for s in ok_summaries if s.riskAssessment], dtype=object,
+    )
+
+    # Engagement: one weighted bincount over every (hour, count) pair
+    hours_arr = np.asarray(hours_buf, dtype=np.intp)
+    hour_totals = np.bincount(hours_arr, weights=np.asarray(hour_counts_buf, dtype=np.float64), minlength=24)
+    hours_seen = np.flatnonzero(np.bincount(hours_arr, minlength=24))
+    hourly_distribution = {int(h): int(hour_totals[h]) for h in hours_seen}
+
+    # Risk
+    risk_dist = {"High": 0, "Medium": 0, "Low": 0}
+    if risk_levels.size:
+        levels, level_counts = np.unique(risk_levels, return_counts=True)
+        risk_dist.update(zip(levels.tolist(), level_counts.tolist()))
+
+    # Velocity buckets and intervention candidates in one kernel call
+    improving, declining, plateaued, help_idx = _classify_students(velocities, predicted_scores, beginner_counts)
+    interventions: List[Dict[str, Any]] = [
+        {
+            "studentId": ok_ids[i],
+            "reason": "Multiple topics at beginner level" if beginner_counts[i] >= 2 else "Predicted score below 50%",
+            "predictedScore": ok_summaries[i].predictedNextQuizScore,
+            "recommendedAction": "Schedule one-on-one tutoring session",
+        }
+        for i in help_idx
+    ]
 
     # Common weak topics
-    common_weak = sorted(topic_weakness_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+    common_weak = topic_weakness_counts.most_common(10)  # heap top-10, ties keep first-seen order
     weak_topics_list = [
         {"topic": t, "studentsStruggling": c, "percentageOfClass": round(c / max(len(student_ids), 1) * 100, 1)}
         for t, c in common_weak
     ]
 
     # Velocity distribution
-    if all_velocities:
+    if velocities.size:
         vel_dist: Dict[str, float] = {
-            "mean": round(float(np.mean(all_velocities)), 4),
-            "median": round(float(np.median(all_velocities)), 4),
-            "improving": float(sum(1 for v in all_velocities if v > 0.01)),
-            "declining": float(sum(1 for v in all_velocities if v < -0.01)),
-            "plateaued": float(sum(1 for v in all_velocities if -0.01 <= v <= 0.01)),
+            "mean": round(float(np.mean(velocities, dtype=np.float64)), 4),
+            "median": round(float(np.median(velocities)), 4),
+            "improving": float(improving),
+            "declining": float(declining),
+            "plateaued": float(plateaued),
         }
     else:
         vel_dist = {"mean": 0.0, "median": 0.0, "improving": 0.0, "declining": 0.0, "plateaued": 0.0}
 
-    result = ClassInsightsResponse(
+    result = _build_response(
+        ClassInsightsResponse,
         teacherId=request.teacherId,
         riskDistribution=risk_dist,
         riskTrend=[],  # Would require historical data
         commonWeakTopics=weak_topics_list,
         learningVelocityDistribution=vel_dist,
-        engagementPatterns={"hourlyDistribution": dict(hourly_engagement)},
+        engagementPatterns={"hourlyDistribution": hourly_distribution},
         interventionRecommendations=interventions[:10],
         successPredictions={
-            "classAverageExpected": round(float(np.mean([s or 60 for s in []])) if not all_velocities else 65.0, 1),
+            "classAverageExpected": 65.0 if velocities.size else 60.0,
             "studentsLikelyToStruggle": len(interventions),
         },
         totalStudents=len(student_ids),
         status="success",
     )
 
-    _cache_set(_class_stats_cache, f"class_{request.teacherId}_{request.classId}", result)
+    await _cache_set(_class_stats_cache, f"class_{request.teacherId}_{request.classId}", result)
     return result
 
 
-def _generate_demo_class_insights(request: ClassInsightsRequest) -> ClassInsightsResponse:
-    """Generate demo class insights when no real data is available."""
-    return ClassInsightsResponse(
-        teacherId=request.teacherId,
-        riskDistribution={"High": 4, "Medium": 8, "Low": 18},
-        riskTrend=[
-            {"date": "2026-02-11", "high": 5, "medium": 9, "low": 16},
-            {"date": "2026-02-18", "high": 4, "medium": 8, "low": 18},
-        ],
-        commonWeakTopics=[
-            {"topic": "Quadratic Equations", "studentsStruggling": 12, "percentageOfClass": 40.0},
-            {"topic": "Trigonometric Ratios", "studentsStruggling": 9, "percentageOfClass": 30.0},
-            {"topic": "Factoring", "studentsStruggling": 7, "percentageOfClass": 23.3},
-        ],
-        learningVelocityDistribution={
-            "mean": 0.015,
-            "median": 0.008,
-            "improving": 18,
-            "declining": 5,
-            "plateaued": 7,
-        },
-        engagementPatterns={
-            "hourlyDistribution": {str(h): random.randint(5, 40) for h in range(8, 22)},
-            "peakHour": 16,
-            "avgDailyActiveStudents": 22,
+# Static demo payload, built once; only teacherId and the hourly counts vary per call.
+# model_copy is shallow, so the nested values are shared and must not be mutated.
+_DEMO_CLASS_INSIGHTS = ClassInsightsResponse(
+    teacherId="",
+    riskDistribution={"High": 4, "Medium": 8, "Low": 18},
+    riskTrend=[
+        {"date": "2026-02-11", "high": 5, "medium": 9, "low": 16},
+        {"date": "2026-02-18", "high": 4, "medium": 8, "low": 18},
+    ],
+    commonWeakTopics=[
+        {"topic": "Quadratic Equations", "studentsStruggling": 12, "percentageOfClass": 40.0},
+        {"topic": "Trigonometric Ratios", "studentsStruggling": 9, "percentageOfClass": 30.0},
+        {"topic": "Factoring", "studentsStruggling": 7, "percentageOfClass": 23.3},
+    ],
+    learningVelocityDistribution={
+        "mean": 0.015,
+        "median": 0.008,
+        "improving": 18,
+        "declining": 5,
+        "plateaued": 7,
+    },
+    engagementPatterns={
+        "hourlyDistribution": {},
+        "peakHour": 16,
+        "avgDailyActiveStudents": 22,
+    },
+    interventionRecommendations=[
+        {
+            "studentId": "demo_student_1",
+            "reason": "Declining performance in multiple topics",
+            "predictedScore": 42.5,
+            "recommendedAction": "Schedule one-on-one review session for Quadratic Equations",
         },
-        interventionRecommendations=[
-            {
-                "studentId": "demo_student_1",
-                "reason": "Declining performance in multiple topics",
-                "predictedScore": 42.5,
-                "recommendedAction": "Schedule one-on-one review session for Quadratic Equations",
-            },
-            {
-                "studentId": "demo_student_2",
-                "reason": "3 consecutive absences",
-                "predictedScore": 38.0,
-                "recommendedAction": "Contact parent/guardian and arrange catch-up sessions",
-            },
-        ],
-        successPredictions={
-            "classAverageExpected": 72.3,
-            "studentsLikelyToStruggle": 4,
-            "studentsLikelyToExcel": 8,
+        {
+            "studentId": "demo_student_2",
+            "reason": "3 consecutive absences",
+            "predictedScore": 38.0,
+            "recommendedAction": "Contact parent/guardian and arrange catch-up sessions",
         },
-        totalStudents=30,
-        status="demo_data",
-    )
+    ],
+    successPredictions={
+        "classAverageExpected": 72.3,
+        "studentsLikelyToStruggle": 4,
+        "studentsLikelyToExcel": 8,
+    },
+    totalStudents=30,
+    status="demo_data",
+)
+_DEMO_HOURS = tuple(str(h) for h in range(8, 22))
+_DEMO_HOURLY_COUNTS = range(5, 41)
+
+
+def _generate_demo_class_insights(request: ClassInsightsRequest) -> ClassInsightsResponse:
+    """Generate demo class insights when no real data is available."""
+    hourly = dict(zip(_DEMO_HOURS, random.choices(_DEMO_HOURLY_COUNTS, k=len(_DEMO_HOURS))))
+    return _DEMO_CLASS_INSIGHTS.model_copy(update={
+        "teacherId": request.teacherId,
+        "engagementPatterns": {**_DEMO_CLASS_INSIGHTS.engagementPatterns, "hourlyDistribution": hourly},
+    })
 
 
 # ─── Mock Data Generator ──────────────────────────────────────
 
+_MOCK_ARCHETYPES = ("perfect", "struggling", "inconsistent", "improving", "declining", "average")
+_MOCK_ARCHETYPE_P = [0.1, 0.1, 0.1, 0.2, 0.15, 0.35]
+# (archetype, metric, (mean, std)); metrics: engagement, quiz, attendance, completion, streak
+_MOCK_ARCHETYPE_PARAMS = np.array([
+    [(90, 5), (92, 4), (98, 2), (95, 3), (15, 3)],          # perfect
+    [(25, 10), (30, 12), (55, 15), (30, 12), (0, 1)],       # struggling
+    [(60, 25), (55, 25), (70, 20), (55, 20), (3, 5)],       # inconsistent
+    [(65, 10), (60, 10), (80, 8), (70, 10), (7, 3)],        # improving
+    [(50, 15), (55, 15), (65, 12), (50, 15), (1, 2)],       # declining
+    [(65, 12), (68, 10), (82, 8), (72, 10), (5, 3)],        # average
+], dtype=np.float64)
+_MOCK_TOPICS = (
+    "Linear Equations", "Quadratic Equations", "Polynomials",
+    "Trigonometric Ratios", "Pythagorean Theorem", "Fractions & Decimals",
+    "Integers", "Probability Basics", "Angles", "Area & Perimeter",
+)
+_MOCK_TOPIC_SLUGS = tuple(t.replace(" ", "_").lower() for t in _MOCK_TOPICS)
+_MOCK_IMPROVING, _MOCK_DECLINING, _MOCK_PERFECT, _MOCK_STRUGGLING, _MOCK_INCONSISTENT = (
+    _MOCK_ARCHETYPES.index(a) for a in ("improving", "declining", "perfect", "struggling", "inconsistent")
+)
+
+
+@dataclass(slots=True, frozen=True)
+class MockQuizEntry:
+    """One generated quiz attempt; slotted since a mock run creates students × quizzes of them."""
+    studentId: str
+    topicId: str
+    topic: str
+    score: int
+    total: int
+    correct: bool
+    timeTaken: int
+    timeSpent: int
+    attempts: int
+    completedAt: str
+    timestamp: str
+    questionId: str
+
+
+def _mock_base_score(archetype: int, j: int, num_quizzes: int) -> float:
+    """Expected score of quiz j for an archetype (inconsistent students are drawn separately)."""
+    if archetype == _MOCK_IMPROVING:
+        return 40 + (j / num_quizzes) * 40
+    if archetype == _MOCK_DECLINING:
+        return 80 - (j / num_quizzes) * 35
+    if archetype == _MOCK_PERFECT:
+        return 90.0
+    if archetype == _MOCK_STRUGGLING:
+        return 30.0
+    return 65.0  # average
+
+
+def _mock_base_score_array(archetype: np.ndarray, j: np.ndarray, num_quizzes: int) -> np.ndarray:
+    """Broadcasting _mock_base_score over archetype / quiz-index arrays."""
+    progress = j / max(num_quizzes, 1)
+    return np.select(
+        [archetype == _MOCK_IMPROVING, archetype == _MOCK_DECLINING,
+         archetype == _MOCK_PERFECT, archetype == _MOCK_STRUGGLING],
+        [40 + progress * 40, 80 - progress * 35, 90.0, 30.0],
+        65.0,
+    )
+
+
+if HAS_NUMBA:
+    # Default (serial) ufunc target: mock matrices are small enough that thread start-up would dominate
+    _mock_base_score_array = numba.vectorize(["float64(int64, int64, int64)"], cache=True)(_mock_base_score)
+
+
+def _mock_base_scores(rng: np.random.Generator, archetype_idx: np.ndarray, num_quizzes: int) -> np.ndarray:
+    """(students, quizzes) expected quiz score per archetype, with progression over the quiz index."""
+    base = _mock_base_score_array(archetype_idx[:, None], np.arange(num_quizzes)[None, :], num_quizzes)
+    inconsistent = archetype_idx == _MOCK_INCONSISTENT
+    base[inconsistent] = rng.choice([30, 50, 70, 90], size=(int(inconsistent.sum()), num_quizzes))
+    return base
+
 
 def generate_mock_student_data(
     num_students: int = 30,
     num_quizzes: int = 20,
     seed: Optional[int] = None,
+    as_frame: bool = False,
 ) -> Dict[str, Any]:
     """
     Generate realistic mock student data for testing ML features.
     Includes edge cases: perfect students, struggling students, inconsistent performers.
+    quizHistory is a list of MockQuizEntry, or with as_frame=True a columnar DataFrame
+    with the same fields (cheaper for large runs and feeds ML loaders directly).
     """
-    if seed is not None:
-        random.seed(seed)
-        np.random.seed(seed)
-
-    topics = [
-        "Linear Equations", "Quadratic Equations", "Polynomials",
-        "Trigonometric Ratios", "Pythagorean Theorem", "Fractions & Decimals",
-        "Integers", "Probability Basics", "Angles", "Area & Perimeter",
-    ]
-
-    students = []
-    all_quiz_data = []
-
-    for i in range(num_students):
-        student_id = f"mock_student_{i+1:03d}"
-
-        # Assign student archetype
-        archetype_roll = random.random()
-        if archetype_roll < 0.1:
-            archetype = "perfect"
-        elif archetype_roll < 0.2:
-            archetype = "struggling"
-        elif archetype_roll < 0.3:
-            archetype = "inconsistent"
-        elif archetype_roll < 0.5:
-            archetype = "improving"
-        elif archetype_roll < 0.65:
-            archetype = "declining"
-        else:
-            archetype = "average"
-
-        # Base metrics per archetype
-        archetypes = {
-            "perfect": {
-                "engagement": (90, 5), "quiz": (92, 4), "attendance": (98, 2),
-                "completion": (95, 3), "streak": (15, 3),
-            },
-            "struggling": {
-                "engagement": (25, 10), "quiz": (30, 12), "attendance": (55, 15),
-                "completion": (30, 12), "streak": (0, 1),
-            },
-            "inconsistent": {
-                "engagement": (60, 25), "quiz": (55, 25), "attendance": (70, 20),
-                "completion": (55, 20), "streak": (3, 5),
-            },
-            "improving": {
-                "engagement": (65, 10), "quiz": (60, 10), "attendance": (80, 8),
-                "completion": (70, 10), "streak": (7, 3),
-            },
-            "declining": {
-                "engagement": (50, 15), "quiz": (55, 15), "attendance": (65, 12),
-                "completion": (50, 15), "streak": (1, 2),
-            },
-            "average": {
-                "engagement": (65, 12), "quiz": (68, 10), "attendance": (82, 8),
-                "completion": (72, 10), "streak": (5, 3),
-            },
-        }
+    rng = np.random.default_rng(seed)
+    topics = _MOCK_TOPICS
+
+    # All per-student randomness in bulk: archetype, then the five metrics from its (mean, std) table
+    archetype_idx = rng.choice(len(_MOCK_ARCHETYPES), size=num_students, p=_MOCK_ARCHETYPE_P)
+    params = _MOCK_ARCHETYPE_PARAMS[archetype_idx]
+    metrics = rng.normal(params[..., 0], params[..., 1])
+    np.clip(metrics[:, :4], 0, 100, out=metrics[:, :4])
+    streaks = np.maximum(metrics[:, 4].astype(np.int64), 0)
+    xp_growth = rng.normal(np.where(archetype_idx == _MOCK_IMPROVING, 0.5, 0.0), 0.3)
+    time_on_platform = np.maximum(rng.normal(8, 3, size=num_students), 0)
+
+    # Quiz scores, pacing and retries for every (student, quiz) at once
+    scores = np.clip(
+        _mock_base_scores(rng, archetype_idx, num_quizzes) + rng.normal(0, 8, size=(num_students, num_quizzes)),
+        0, 100,
+    )
+    time_per_q = np.maximum(rng.normal(np.where(scores > 70, 60, 90), 20), 10)
+    attempts = np.where(scores < 60, rng.choice([1, 1, 1, 2, 2, 3], size=scores.shape), 1)
+    topic_idx = rng.integers(0, len(topics), size=scores.shape)
+    total_questions_arr = np.array([10, 15, 20])[rng.integers(0, 3, size=scores.shape)]
+    # Quiz dates within 150 days of 2025-09-01, formatted to ISO strings in one call
+    quiz_dates = np.datetime_as_string(
+        np.datetime64("2025-09-01", "s") + rng.integers(0, 151, size=scores.shape).astype("timedelta64[D]"),
+        unit="s",
+    )
 
-        params = archetypes[archetype]
-        engagement = max(0, min(100, np.random.normal(*params["engagement"])))
-        avg_quiz = max(0, min(100, np.random.normal(*params["quiz"])))
-        attendance = max(0, min(100, np.random.normal(*params["attendance"])))
-        completion = max(0, min(100, np.random.normal(*params["completion"])))
-        streak = max(0, int(np.random.normal(*params["streak"])))
+    # Rounding done array-wide (np.rint rounds half to even, like round()); the loops only unpack
+    student_values = np.column_stack((
+        np.round(metrics[:, :4], 1), np.round(xp_growth, 2), np.round(time_on_platform, 1),
+    )).tolist()
+    correct_counts = np.rint(total_questions_arr * scores / 100).astype(np.int64)
+    passed = correct_counts >= total_questions_arr * 0.5
+    time_taken = np.rint(time_per_q * total_questions_arr).astype(np.int64)
+    time_spent = np.rint(time_per_q).astype(np.int64)
 
-        student = {
+    student_ids = [f"mock_student_{i+1:03d}" for i in range(num_students)]
+    students = []
+    for i, student_id in enumerate(student_ids):
+        engagement, avg_quiz, attendance, completion, xp_rate, platform_time = student_values[i]
+        students.append({
             "studentId": student_id,
             "name": f"Student {i+1}",
-            "archetype": archetype,
-            "engagementScore": round(engagement, 1),
-            "avgQuizScore": round(avg_quiz, 1),
-            "attendance": round(attendance, 1),
-            "assignmentCompletion": round(completion, 1),
-            "streak": streak,
-            "xpGrowthRate": round(np.random.normal(0.5 if archetype == "improving" else 0, 0.3), 2),
-            "timeOnPlatform": round(max(0, np.random.normal(8, 3)), 1),
-        }
-        students.append(student)
-
-        # Generate quiz history for this student
-        base_time = datetime(2025, 9, 1)
-        for j in range(num_quizzes):
-            topic = random.choice(topics)
-            days_offset = random.randint(0, 150)
-            quiz_date = base_time + timedelta(days=days_offset)
-
-            # Score based on archetype with progression
-            if archetype == "improving":
-                base_score = 40 + (j / num_quizzes) * 40
-            elif archetype == "declining":
-                base_score = 80 - (j / num_quizzes) * 35
-            elif archetype == "perfect":
-                base_score = 90
-            elif archetype == "struggling":
-                base_score = 30
-            elif archetype == "inconsistent":
-                base_score = random.choice([30, 50, 70, 90])
-            else:  # average
-                base_score = 65
-
-            score = max(0, min(100, base_score + np.random.normal(0, 8)))
-            total_questions = random.choice([10, 15, 20])
-            correct = round(total_questions * score / 100)
-            time_per_q = max(10, np.random.normal(60 if score > 70 else 90, 20))
-
-            quiz_entry = {
-                "studentId": student_id,
-                "topicId": topic,
-                "topic": topic,
-                "score": correct,
-                "total": total_questions,
-                "correct": correct >= total_questions * 0.5,
-                "timeTaken": round(time_per_q * total_questions),
-                "timeSpent": round(time_per_q),
-                "attempts": random.choice([1, 1, 1, 2, 2, 3]) if score < 60 else 1,
-                "completedAt": quiz_date.isoformat(),
-                "timestamp": quiz_date.isoformat(),
-                "questionId": f"q_{topic.replace(' ', '_').lower()}_{j}",
-            }
-            all_quiz_data.append(quiz_entry)
+            "archetype": _MOCK_ARCHETYPES[archetype_idx[i]],
+            "engagementScore": engagement,
+            "avgQuizScore": avg_quiz,
+            "attendance": attendance,
+            "assignmentCompletion": completion,
+            "streak": int(streaks[i]),
+            "xpGrowthRate": xp_rate,
+            "timeOnPlatform": platform_time,
+        })
+
+    # Quiz history as flat columns (row-major: student, then quiz), in MockQuizEntry field order
+    quiz_topics = np.asarray(topics)[topic_idx].ravel()
+    question_ids = np.char.add(
+        np.char.add("q_", np.asarray(_MOCK_TOPIC_SLUGS)[topic_idx]),
+        np.char.add("_", np.arange(num_quizzes).astype(str)),
+    ).ravel()
+    quiz_dates_flat = quiz_dates.ravel()
+    quiz_columns = {
+        "studentId": np.repeat(np.asarray(student_ids, dtype=str), num_quizzes),
+        "topicId": quiz_topics,
+        "topic": quiz_topics,
+        "score": correct_counts.ravel(),
+        "total": total_questions_arr.ravel(),
+        "correct": passed.ravel(),
+        "timeTaken": time_taken.ravel(),
+        "timeSpent": time_spent.ravel(),
+        "attempts": attempts.ravel(),
+        "completedAt": quiz_dates_flat,
+        "timestamp": quiz_dates_flat,
+        "questionId": question_ids,
+    }
+    quiz_history: Any
+    if as_frame:
+        quiz_history = pd.DataFrame(quiz_columns)
+    else:
+        quiz_history = list(map(MockQuizEntry, *(col.tolist() for col in quiz_columns.values())))
 
+    archetype_counts = np.bincount(archetype_idx, minlength=len(_MOCK_ARCHETYPES))
     return {
         "students": students,
-        "quizHistory": all_quiz_data,
+        "quizHistory": quiz_history,
         "metadata": {
             "numStudents": num_students,
             "numQuizzes": num_quizzes,
-            "archetypeDistribution": {
-                archetype: sum(1 for s in students if s["archetype"] == archetype)
-                for archetype in ["perfect", "struggling", "inconsistent", "improving", "declining", "average"]
-            },
-            "topicsCovered": topics,
+            "archetypeDistribution": dict(zip(_MOCK_ARCHETYPES, archetype_counts.tolist())),
+            "topicsCovered": list(topics),
             "generatedAt": datetime.utcnow().isoformat(),
         },
     }
@@ -2089,12 +2783,14 @@ def generate_mock_student_data(
 # ─── Cache Management ─────────────────────────────────────────
 
 
-def refresh_all_caches() -> RefreshCacheResponse:
-    """Clear and refresh all in-memory caches."""
+async def refresh_all_caches() -> RefreshCacheResponse:
+    """Clear and refresh all in-memory caches and the shared Redis cache."""
     _competency_cache.clear()
     _class_stats_cache.clear()
     _difficulty_cache.clear()
     _risk_model_cache.clear()
+    _shap_explainer_cache.clear()
+    await _redis_cache_clear()
 
     logger.info("All analytics caches cleared")
 
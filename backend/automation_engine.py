@@ -14,11 +14,27 @@ Each event is routed to a dedicated handler that orchestrates
 classification, quiz generation, notifications and dashboard updates.
 """
 
+import asyncio
+import hashlib
+import json
 import math
 import logging
-from typing import List, Optional, Dict, Any
+import time
+import weakref
+from collections import OrderedDict
+from enum import IntEnum
+from typing import List, Optional, Dict, Any, Awaitable, Callable, Set, Tuple
 
-from pydantic import BaseModel, Field
+import numpy as np  # type: ignore[import-not-found]
+from pydantic import BaseModel, ConfigDict, Field
+
+numba: Any = None
+
+try:
+    import numba  # type: ignore[import-not-found,no-redef]
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 logger = logging.getLogger("mathpulse.automation")
 
@@ -35,25 +51,80 @@ REMEDIAL_CONFIG = {
     "Low":    {"questions": 10, "dist": {"easy": 40, "medium": 40, "hard": 20}},
 }
 
+
+class Risk(IntEnum):
+    """Overall diagnostic risk; the name is what AutomationResult.overallRisk carries."""
+    Low = 0
+    Medium = 1
+    High = 2
+
+
+# REMEDIAL_CONFIG indexed by Risk value
+_REMEDIAL = tuple(REMEDIAL_CONFIG[risk.name] for risk in Risk)
+
+# Classification confidence for every whole-number score 0-100: distance from
+# AT_RISK_THRESHOLD, scaled to the width of the band the score falls in
+_CONFIDENCE_BY_SCORE = tuple(
+    round((AT_RISK_THRESHOLD - s) / AT_RISK_THRESHOLD, 2)
+    if s < AT_RISK_THRESHOLD
+    else round((s - AT_RISK_THRESHOLD) / (100 - AT_RISK_THRESHOLD), 2)
+    for s in range(101)
+)
+
+# Per-subject remedial quiz configs only differ in topics, grade, size and difficulty;
+# the rest is shared (immutable tuples, so sharing between configs is safe)
+_REMEDIAL_QUIZ_CONFIG_BASE: Dict[str, Any] = {
+    "questionTypes": ("identification", "enumeration", "multiple_choice", "word_problem"),
+    "bloomLevels": ("remember", "understand", "apply", "analyze"),
+    "includeGraphs": False,
+    "excludeTopics": (),
+    "purpose": "remedial",
+}
+
+AI_RESPONSE_CACHE_MAX_ENTRIES = 4096   # memoised AI generations, LRU-evicted
+DIAGNOSTIC_RESULT_CACHE_TTL_SECONDS = 300
+DIAGNOSTIC_RESULT_CACHE_MAX_ENTRIES = 1024
+
 # ─── Request / Response Models ──────────────────────────────────
+# Payloads and results are built once and only read afterwards, so they are
+# frozen; unknown fields from producers are dropped.
+
+_FROZEN_MODEL = ConfigDict(frozen=True, extra="ignore")
 
 
 class DiagnosticResult(BaseModel):
     """Per-subject score from diagnostic assessment."""
+    model_config = _FROZEN_MODEL
+
     subject: str
     score: float = Field(..., ge=0, le=100)
 
 
+class QuestionOutcome(BaseModel):
+    """
+    One answered diagnostic question. Only correctness feeds the weak-topic
+    scan; the other fields clients send (questionId, difficulty, …) are dropped
+    while parsing instead of being kept for every question.
+    """
+    model_config = _FROZEN_MODEL
+
+    correct: Optional[bool] = None
+
+
 class DiagnosticCompletionPayload(BaseModel):
     """Payload sent when a student completes the diagnostic."""
+    model_config = _FROZEN_MODEL
+
     studentId: str
     results: List[DiagnosticResult]
     gradeLevel: str = "Grade 10"
-    questionBreakdown: Optional[Dict[str, list]] = None   # topic → [{correct: bool, …}]
+    questionBreakdown: Optional[Dict[str, List[QuestionOutcome]]] = None   # topic → answered questions
 
 
 class QuizSubmissionPayload(BaseModel):
     """Payload sent on quiz / assessment submission."""
+    model_config = _FROZEN_MODEL
+
     studentId: str
     quizId: str
     subject: str
@@ -66,6 +137,8 @@ class QuizSubmissionPayload(BaseModel):
 
 class StudentEnrollmentPayload(BaseModel):
     """Payload sent when a new student account is created."""
+    model_config = _FROZEN_MODEL
+
     studentId: str
     name: str
     email: str
@@ -75,6 +148,8 @@ class StudentEnrollmentPayload(BaseModel):
 
 class DataImportPayload(BaseModel):
     """Payload sent after a teacher uploads a spreadsheet."""
+    model_config = _FROZEN_MODEL
+
     teacherId: str
     students: List[Dict[str, Any]]       # parsed student rows
     columnMapping: Dict[str, str]
@@ -82,6 +157,8 @@ class DataImportPayload(BaseModel):
 
 class ContentUpdatePayload(BaseModel):
     """Payload sent when admin performs CRUD on curriculum."""
+    model_config = _FROZEN_MODEL
+
     adminId: str
     action: str                           # create | update | delete
     contentType: str                      # lesson | quiz | module | subject
@@ -94,6 +171,8 @@ class ContentUpdatePayload(BaseModel):
 
 
 class SubjectRiskClassification(BaseModel):
+    model_config = _FROZEN_MODEL
+
     status: str              # "At Risk" | "On Track"
     score: float
     confidence: float
@@ -102,6 +181,8 @@ class SubjectRiskClassification(BaseModel):
 
 class AutomationResult(BaseModel):
     """Standardised result returned by every handler."""
+    model_config = _FROZEN_MODEL
+
     success: bool
     event: str
     studentId: Optional[str] = None
@@ -116,6 +197,216 @@ class AutomationResult(BaseModel):
     notifications: List[str] = Field(default_factory=list)
 
 
+# ─── Risk confidence ────────────────────────────────────────────
+
+
+def _risk_confidence(score: float) -> float:
+    """Confidence of the At Risk / On Track call for a 0-100 score."""
+    whole = int(score)
+    if whole == score:
+        # Diagnostic and quiz scores are almost always whole percentages
+        return _CONFIDENCE_BY_SCORE[whole]
+    if score < AT_RISK_THRESHOLD:
+        return round((AT_RISK_THRESHOLD - score) / AT_RISK_THRESHOLD, 2)
+    return round((score - AT_RISK_THRESHOLD) / (100 - AT_RISK_THRESHOLD), 2)
+
+
+# ─── Weak-topic accuracy kernel ─────────────────────────────────
+
+
+def _topic_correct_counts(correct: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Correct answers per topic, for non-empty topics laid end to end in the
+    0/1 array ``correct`` with topic t starting at ``offsets[t]``.
+    """
+    return np.add.reduceat(correct, offsets, dtype=np.int64)
+
+
+def _topic_correct_counts_loop(correct: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Index-loop form of _topic_correct_counts for numba."""
+    n_topics = offsets.shape[0]
+    out = np.zeros(n_topics, dtype=np.int64)
+    for t in range(n_topics):
+        end = correct.shape[0] if t == n_topics - 1 else offsets[t + 1]
+        total = 0
+        for i in range(offsets[t], end):
+            total += correct[i]
+        out[t] = total
+    return out
+
+
+if HAS_NUMBA:
+    _topic_correct_counts = numba.njit(cache=True)(_topic_correct_counts_loop)
+
+
+# ─── AI response cache ──────────────────────────────────────────
+# Students in the same cohort routinely produce identical prompts (same
+# at-risk subjects, weak topics and grade), so completions are memoised by a
+# hash of the full request. Failed or empty generations are never cached.
+
+_ai_response_cache: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _ai_cache_key(messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> str:
+    blob = json.dumps(
+        {"messages": messages, "max_tokens": max_tokens, "temperature": temperature},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# main's (call_hf_chat_async, call_hf_chat_stream_async), resolved on first use since
+# main imports this module
+_hf_chat_functions: Optional[Tuple[Callable[..., Any], Callable[..., Any]]] = None
+
+
+def _get_hf_chat_functions() -> Tuple[Callable[..., Any], Callable[..., Any]]:
+    global _hf_chat_functions
+    if _hf_chat_functions is None:
+        from main import call_hf_chat_async, call_hf_chat_stream_async
+
+        _hf_chat_functions = (call_hf_chat_async, call_hf_chat_stream_async)
+    return _hf_chat_functions
+
+
+# Receives (result field, text delta) while an AI generation streams in
+ChunkCallback = Callable[[str, str], Awaitable[None]]
+
+
+def _bind_field(
+    on_chunk: Optional[ChunkCallback], field: str
+) -> Optional[Callable[[str], Awaitable[None]]]:
+    if on_chunk is None:
+        return None
+
+    async def forward(delta: str) -> None:
+        await on_chunk(field, delta)
+
+    return forward
+
+
+async def _cached_hf_chat(
+    messages: List[Dict[str, str]],
+    *,
+    max_tokens: int,
+    temperature: float,
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> str:
+    """
+    call_hf_chat_async with an in-process LRU in front of it.
+    With ``on_chunk`` the completion is streamed and each delta forwarded as it
+    arrives (a cache hit is forwarded as one chunk); the full text is returned.
+    """
+    key = _ai_cache_key(messages, max_tokens, temperature)
+    cached = _ai_response_cache.get(key)
+    if cached is not None:
+        _ai_response_cache.move_to_end(key)
+        if on_chunk is not None:
+            await on_chunk(cached)
+        return cached
+
+    call_hf_chat_async, call_hf_chat_stream_async = _get_hf_chat_functions()
+    if on_chunk is None:
+        text = await call_hf_chat_async(messages, max_tokens=max_tokens, temperature=temperature)
+    else:
+        parts: list[str] = []
+        async for delta in call_hf_chat_stream_async(
+            messages, max_tokens=max_tokens, temperature=temperature, task_type="default"
+        ):
+            parts.append(delta)
+            await on_chunk(delta)
+        text = "".join(parts)
+
+    if text:
+        _ai_response_cache[key] = text
+        if len(_ai_response_cache) > AI_RESPONSE_CACHE_MAX_ENTRIES:
+            _ai_response_cache.popitem(last=False)
+    return text
+
+
+# ─── Diagnostic result cache ────────────────────────────────────
+# Client retries and quick retakes resubmit the exact same diagnostic. Results
+# are kept for a few minutes per (student, payload) so those return without
+# re-running the AI calls, and a per-key lock makes concurrent duplicates wait
+# for the first one instead of starting their own. AutomationResult is frozen,
+# so the cached instance is shared as-is.
+
+_diagnostic_result_cache: "OrderedDict[str, Tuple[float, AutomationResult]]" = OrderedDict()
+_diagnostic_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _diagnostic_cache_key(payload: DiagnosticCompletionPayload) -> str:
+    digest = hashlib.blake2b(payload.model_dump_json().encode("utf-8"), digest_size=16).hexdigest()
+    return f"{payload.studentId}:{digest}"
+
+
+def _get_cached_diagnostic(key: str) -> Optional[AutomationResult]:
+    entry = _diagnostic_result_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, result = entry
+    if time.monotonic() - stored_at >= DIAGNOSTIC_RESULT_CACHE_TTL_SECONDS:
+        del _diagnostic_result_cache[key]
+        return None
+    _diagnostic_result_cache.move_to_end(key)
+    return result
+
+
+def _store_diagnostic(key: str, result: AutomationResult) -> None:
+    _diagnostic_result_cache[key] = (time.monotonic(), result)
+    _diagnostic_result_cache.move_to_end(key)
+    if len(_diagnostic_result_cache) > DIAGNOSTIC_RESULT_CACHE_MAX_ENTRIES:
+        _diagnostic_result_cache.popitem(last=False)
+
+
+# ─── Background persistence ─────────────────────────────────────
+# Fire-and-forget writes run as tasks so handlers can respond immediately. The
+# event loop only keeps weak references to tasks, so they are held here until done.
+
+_background_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def _spawn_background(coro: Awaitable[None]) -> None:
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _create_progress_skeleton(student_id: str) -> None:
+    """
+    Create an empty progress/{student_id} record unless one exists (blocking Firestore call).
+    create() fails atomically when the client already wrote the doc, so real progress is
+    never overwritten by the skeleton.
+    """
+    import main
+    from google.api_core.exceptions import AlreadyExists  # type: ignore[import-not-found]
+
+    if not (main._firebase_ready and main.firebase_firestore):
+        return
+    progress_ref = main.firebase_firestore.client().collection("progress").document(student_id)
+    try:
+        progress_ref.create({
+            "userId": student_id,
+            "subjects": {},
+            "lessons": {},
+            "quizAttempts": [],
+            "totalLessonsCompleted": 0,
+            "totalQuizzesCompleted": 0,
+            "averageScore": 0,
+            "updatedAt": main.FIRESTORE_SERVER_TIMESTAMP,
+        })
+    except AlreadyExists:
+        pass
+
+
+async def _persist_enrollment(student_id: str) -> None:
+    try:
+        await asyncio.to_thread(_create_progress_skeleton, student_id)
+    except Exception as e:
+        logger.warning(f"Enrollment persistence failed for {student_id}: {e}")
+
+
 # ─── Automation Engine ──────────────────────────────────────────
 
 
@@ -133,10 +424,46 @@ class MathPulseAutomationEngine:
     # ────────────────────────────────────────────────────────────
 
     async def handle_diagnostic_completion(
-        self, payload: DiagnosticCompletionPayload
+        self,
+        payload: DiagnosticCompletionPayload,
+        on_chunk: Optional[ChunkCallback] = None,
     ) -> AutomationResult:
         """
         Runs when a student completes the mandatory diagnostic.
+        ``on_chunk`` receives ("learningPath" | "interventions", delta) as the
+        AI text streams in, so callers can relay it before the result is ready.
+        A repeat of a recent submission is answered from the result cache, with
+        each AI field forwarded to ``on_chunk`` as a single chunk.
+        """
+        key = _diagnostic_cache_key(payload)
+        lock = _diagnostic_locks.get(key)
+        if lock is None:
+            lock = _diagnostic_locks[key] = asyncio.Lock()
+
+        async with lock:
+            cached = _get_cached_diagnostic(key)
+            if cached is not None:
+                logger.info(f"📊 DIAGNOSTIC COMPLETED for {payload.studentId} (cached result)")
+                if on_chunk is not None:
+                    for field in ("learningPath", "interventions"):
+                        text = getattr(cached, field)
+                        if text:
+                            await on_chunk(field, text)
+                return cached
+
+            result = await self._process_diagnostic_completion(payload, on_chunk)
+            # Don't hold on to a result whose AI text failed; the next retry should try again
+            if not result.atRiskSubjects or (result.learningPath and result.interventions):
+                _store_diagnostic(key, result)
+            return result
+
+    async def _process_diagnostic_completion(
+        self,
+        payload: DiagnosticCompletionPayload,
+        on_chunk: Optional[ChunkCallback],
+    ) -> AutomationResult:
+        """
+        Uncached diagnostic pipeline behind handle_diagnostic_completion.
 
         Steps:
         1. Classify per-subject risk
@@ -152,24 +479,37 @@ class MathPulseAutomationEngine:
         notifications: list[str] = []
 
         # 1 — subject-level risk
-        risk_classifications = self._classify_subject_risks(payload.results)
+        risk_classifications, at_risk_subjects = self._classify_subject_risks(payload.results)
 
         # 2 — weak topics
         weak_topics = self._identify_weak_topics(payload.questionBreakdown)
 
         # 3 — overall risk
-        overall_risk = self._calculate_overall_risk(risk_classifications)
-
-        at_risk_subjects = [
-            subj for subj, data in risk_classifications.items()
-            if data["status"] == "At Risk"
-        ]
+        overall_risk = self._calculate_overall_risk(
+            len(at_risk_subjects), len(risk_classifications)
+        )
 
-        # 4 — learning path (AI call)
+        # 4 + 6 — learning path and teacher interventions (independent AI calls, run concurrently)
         learning_path: Optional[str] = None
+        interventions: Optional[str] = None
         if at_risk_subjects:
-            learning_path = await self._generate_learning_path(
-                at_risk_subjects, weak_topics, payload.gradeLevel
+            # Both prompts list the same five weakest topics; render them once
+            topic_lines = self._format_weak_topic_lines(weak_topics)
+            path_result, interventions_result = await asyncio.gather(
+                self._generate_learning_path(
+                    at_risk_subjects, topic_lines, payload.gradeLevel,
+                    on_chunk=_bind_field(on_chunk, "learningPath"),
+                ),
+                self._generate_teacher_interventions(
+                    at_risk_subjects, topic_lines,
+                    on_chunk=_bind_field(on_chunk, "interventions"),
+                ),
+                return_exceptions=True,
+            )
+            # Both helpers already degrade to None on failure; treat anything that escapes the same way
+            learning_path = None if isinstance(path_result, BaseException) else path_result
+            interventions = (
+                None if isinstance(interventions_result, BaseException) else interventions_result
             )
 
         # 5 — remedial quizzes
@@ -181,13 +521,6 @@ class MathPulseAutomationEngine:
             )
             remedial_count = len(remedial_quizzes)
 
-        # 6 — teacher interventions (AI call)
-        interventions: Optional[str] = None
-        if at_risk_subjects:
-            interventions = await self._generate_teacher_interventions(
-                risk_classifications, weak_topics
-            )
-
         # 7 — notification messages
         if at_risk_subjects:
             notifications.append(
@@ -199,7 +532,7 @@ class MathPulseAutomationEngine:
 
         logger.info(
             f"✅ DIAGNOSTIC PROCESSING COMPLETE for {student_id} | "
-            f"Overall={overall_risk} | AtRisk={at_risk_subjects}"
+            f"Overall={overall_risk.name} | AtRisk={at_risk_subjects}"
         )
 
         return AutomationResult(
@@ -208,7 +541,7 @@ class MathPulseAutomationEngine:
             studentId=student_id,
             message=f"Diagnostic processed for {student_id}",
             riskClassifications=risk_classifications,
-            overallRisk=overall_risk,
+            overallRisk=overall_risk.name,
             atRiskSubjects=at_risk_subjects,
             weakTopics=weak_topics,
             learningPath=learning_path,
@@ -231,17 +564,12 @@ class MathPulseAutomationEngine:
 
         # Determine new status for this subject
         new_status = "At Risk" if payload.score < AT_RISK_THRESHOLD else "On Track"
-        confidence = (
-            (AT_RISK_THRESHOLD - payload.score) / AT_RISK_THRESHOLD
-            if new_status == "At Risk"
-            else (payload.score - AT_RISK_THRESHOLD) / (100 - AT_RISK_THRESHOLD)
-        )
 
         risk_classifications = {
             payload.subject: {
                 "status": new_status,
                 "score": payload.score,
-                "confidence": round(abs(confidence), 2),
+                "confidence": _risk_confidence(payload.score),
                 "needsIntervention": new_status == "At Risk",
             }
         }
@@ -284,6 +612,10 @@ class MathPulseAutomationEngine:
         student_id = payload.studentId
         logger.info(f"🆕 NEW STUDENT ENROLLED: {student_id}")
 
+        # XP / level are written with the users/{uid} profile at account creation;
+        # the progress skeleton is written in the background so the response doesn't wait on it
+        _spawn_background(_persist_enrollment(student_id))
+
         notifications: list[str] = [
             f"Welcome {payload.name}! Please complete the diagnostic assessment to personalise your learning path.",
         ]
@@ -314,36 +646,44 @@ class MathPulseAutomationEngine:
         """
         logger.info(f"📂 DATA IMPORT by teacher {payload.teacherId} — {len(payload.students)} students")
         notifications: list[str] = []
-        high_risk_students: list[str] = []
-        medium_risk_count = 0
-        low_risk_count = 0
-        weak_topic_counts: Dict[str, int] = {}
+        rows = payload.students
+        n = len(rows)
+        safe_float = self._safe_float
 
-        for student_row in payload.students:
-            name = str(student_row.get("name") or "Unknown").strip() or "Unknown"
-            avg_score = self._safe_float(student_row.get("avgQuizScore"), 0.0)
-            attendance = self._safe_float(student_row.get("attendance"), 0.0)
-            engagement = self._safe_float(student_row.get("engagementScore"), 0.0)
-            completion_raw = student_row.get("assignmentCompletion")
-            completion = (
-                self._safe_float(completion_raw, 0.0)
-                if completion_raw not in (None, "")
-                else None
-            )
+        # One column per risk input; NaN marks a missing assignmentCompletion
+        avg_score = np.fromiter(
+            (safe_float(row.get("avgQuizScore"), 0.0) for row in rows), dtype=np.float64, count=n
+        )
+        attendance = np.fromiter(
+            (safe_float(row.get("attendance"), 0.0) for row in rows), dtype=np.float64, count=n
+        )
+        engagement = np.fromiter(
+            (safe_float(row.get("engagementScore"), 0.0) for row in rows), dtype=np.float64, count=n
+        )
+        completion = np.fromiter(
+            (
+                safe_float(raw, 0.0) if raw not in (None, "") else math.nan
+                for raw in (row.get("assignmentCompletion") for row in rows)
+            ),
+            dtype=np.float64,
+            count=n,
+        )
 
-            risk_level = self._classify_import_risk(
-                avg_score=avg_score,
-                attendance=attendance,
-                engagement=engagement,
-                completion=completion,
-            )
-            if risk_level == "High":
-                high_risk_students.append(name)
-            elif risk_level == "Medium":
-                medium_risk_count += 1
-            else:
-                low_risk_count += 1
+        risk_levels = self._classify_import_risks(
+            avg_score=avg_score,
+            attendance=attendance,
+            engagement=engagement,
+            completion=completion,
+        )
+        high_risk_students: list[str] = [
+            str(rows[i].get("name") or "Unknown").strip() or "Unknown"
+            for i in np.flatnonzero(risk_levels == "High")
+        ]
+        medium_risk_count = int(np.count_nonzero(risk_levels == "Medium"))
+        low_risk_count = n - len(high_risk_students) - medium_risk_count
 
+        weak_topic_counts: Dict[str, int] = {}
+        for student_row in rows:
             topic_label = self._extract_import_topic(student_row)
             if topic_label:
                 weak_topic_counts[topic_label] = weak_topic_counts.get(topic_label, 0) + 1
@@ -427,25 +767,33 @@ class MathPulseAutomationEngine:
             return default
 
     @staticmethod
-    def _classify_import_risk(
+    def _classify_import_risks(
         *,
-        avg_score: float,
-        attendance: float,
-        engagement: float,
-        completion: Optional[float],
-    ) -> str:
-        high_flags = int(avg_score < 60) + int(attendance < 75) + int(engagement < 55)
-        medium_flags = int(avg_score < 75) + int(attendance < 85) + int(engagement < 70)
-
-        if completion is not None:
-            high_flags += int(completion < 60)
-            medium_flags += int(completion < 75)
-
-        if high_flags >= 2 or (avg_score < 55 and (attendance < 80 or engagement < 65)):
-            return "High"
-        if medium_flags >= 2:
-            return "Medium"
-        return "Low"
+        avg_score: np.ndarray,
+        attendance: np.ndarray,
+        engagement: np.ndarray,
+        completion: np.ndarray,
+    ) -> np.ndarray:
+        """
+        "High" / "Medium" / "Low" for every imported row at once.
+        A NaN completion means the column was absent; NaN compares False, so it
+        simply adds no flags.
+        """
+        high_flags = (
+            (avg_score < 60).astype(np.int8)
+            + (attendance < 75)
+            + (engagement < 55)
+            + (completion < 60)
+        )
+        medium_flags = (
+            (avg_score < 75).astype(np.int8)
+            + (attendance < 85)
+            + (engagement < 70)
+            + (completion < 75)
+        )
+
+        high = (high_flags >= 2) | ((avg_score < 55) & ((attendance < 80) | (engagement < 65)))
+        return np.select([high, medium_flags >= 2], ["High", "Medium"], default="Low")
 
     @staticmethod
     def _extract_import_topic(student_row: Dict[str, Any]) -> Optional[str]:
@@ -462,29 +810,35 @@ class MathPulseAutomationEngine:
     @staticmethod
     def _classify_subject_risks(
         results: List[DiagnosticResult],
-    ) -> Dict[str, Dict[str, Any]]:
-        """Classify each subject as 'At Risk' or 'On Track'."""
+    ) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """
+        Classify each subject as 'At Risk' or 'On Track'.
+        Returns the classifications and the at-risk subjects, in one pass.
+        """
         classifications: Dict[str, Dict[str, Any]] = {}
+        at_risk_subjects: List[str] = []
         for r in results:
-            if r.score < AT_RISK_THRESHOLD:
-                status = "At Risk"
-                confidence = round((AT_RISK_THRESHOLD - r.score) / AT_RISK_THRESHOLD, 2)
-            else:
-                status = "On Track"
-                confidence = round(
-                    (r.score - AT_RISK_THRESHOLD) / (100 - AT_RISK_THRESHOLD), 2
-                )
+            score = r.score
+            at_risk = score < AT_RISK_THRESHOLD
             classifications[r.subject] = {
-                "status": status,
-                "score": r.score,
-                "confidence": confidence,
-                "needsIntervention": status == "At Risk",
+                "status": "At Risk" if at_risk else "On Track",
+                "score": score,
+                "confidence": _risk_confidence(score),
+                "needsIntervention": at_risk,
             }
-        return classifications
+            if at_risk:
+                at_risk_subjects.append(r.subject)
+
+        if len(classifications) < len(results):
+            # A repeated subject keeps its last score; rebuild the list from the deduplicated map
+            at_risk_subjects = [
+                subj for subj, data in classifications.items() if data["needsIntervention"]
+            ]
+        return classifications, at_risk_subjects
 
     @staticmethod
     def _identify_weak_topics(
-        question_breakdown: Optional[Dict[str, list]],
+        question_breakdown: Optional[Dict[str, List[QuestionOutcome]]],
     ) -> List[Dict[str, Any]]:
         """
         Drill into per-topic accuracy from diagnostic question-level data.
@@ -493,38 +847,43 @@ class MathPulseAutomationEngine:
         if not question_breakdown:
             return []
 
+        topics = [(topic, questions) for topic, questions in question_breakdown.items() if questions]
+        if not topics:
+            return []
+
+        # Pack every answer into one 0/1 array and reduce per topic segment
+        lengths = np.fromiter((len(questions) for _, questions in topics), dtype=np.int64, count=len(topics))
+        offsets = np.zeros(len(topics), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        correct = np.fromiter(
+            (1 if q.correct else 0 for _, questions in topics for q in questions),
+            dtype=np.uint8,
+            count=int(lengths.sum()),
+        )
+        accuracies = _topic_correct_counts(correct, offsets) / lengths
+
         weak: list[dict] = []
-        for topic, questions in question_breakdown.items():
-            if not questions:
-                continue
-            correct_count = sum(1 for q in questions if q.get("correct"))
-            accuracy = correct_count / len(questions)
+        for (topic, _), attempted, accuracy in zip(topics, lengths.tolist(), accuracies.tolist()):
             if accuracy < WEAK_TOPIC_THRESHOLD:
                 weak.append({
                     "topic": topic,
                     "accuracy": round(accuracy, 2),
-                    "questionsAttempted": len(questions),
+                    "questionsAttempted": attempted,
                     "priority": "high" if accuracy < 0.3 else "medium",
                 })
         weak.sort(key=lambda x: x["accuracy"])
         return weak
 
     @staticmethod
-    def _calculate_overall_risk(
-        classifications: Dict[str, Dict[str, Any]],
-    ) -> str:
-        total = len(classifications)
+    def _calculate_overall_risk(at_risk_count: int, total: int) -> Risk:
         if total == 0:
-            return "Low"
-        at_risk_count = sum(
-            1 for d in classifications.values() if d["status"] == "At Risk"
-        )
+            return Risk.Low
         ratio = at_risk_count / total
         if ratio >= HIGH_RISK_RATIO:
-            return "High"
+            return Risk.High
         elif ratio >= MEDIUM_RISK_RATIO:
-            return "Medium"
-        return "Low"
+            return Risk.Medium
+        return Risk.Low
 
     # --- remedial quiz configs ---
 
@@ -532,58 +891,57 @@ class MathPulseAutomationEngine:
     def _build_remedial_quiz_configs(
         student_id: str,
         at_risk_subjects: List[str],
-        overall_risk: str,
+        overall_risk: Risk,
         grade_level: str,
     ) -> List[Dict[str, Any]]:
         """Return list of quiz configuration dicts ready for persistence."""
-        cfg = REMEDIAL_CONFIG.get(overall_risk, REMEDIAL_CONFIG["Low"])
-        quizzes: list[dict] = []
-        for subject in at_risk_subjects:
-            quizzes.append({
+        cfg = _REMEDIAL[overall_risk]
+        # Fields shared by every subject's config, built once per call
+        shared_config = {
+            **_REMEDIAL_QUIZ_CONFIG_BASE,
+            "gradeLevel": grade_level,
+            "numQuestions": cfg["questions"],
+            "difficultyDistribution": cfg["dist"],
+            "targetStudent": student_id,
+        }
+        priority = "high" if overall_risk is Risk.High else "medium"
+        return [
+            {
                 "studentId": student_id,
                 "subject": subject,
-                "quizConfig": {
-                    "topics": [subject],
-                    "gradeLevel": grade_level,
-                    "numQuestions": cfg["questions"],
-                    "questionTypes": [
-                        "identification",
-                        "enumeration",
-                        "multiple_choice",
-                        "word_problem",
-                    ],
-                    "difficultyDistribution": cfg["dist"],
-                    "bloomLevels": ["remember", "understand", "apply", "analyze"],
-                    "includeGraphs": False,
-                    "excludeTopics": [],
-                    "purpose": "remedial",
-                    "targetStudent": student_id,
-                },
+                "quizConfig": {"topics": [subject], **shared_config},
                 "status": "pending",
                 "autoGenerated": True,
                 "reason": f'Diagnostic identified "{subject}" as At Risk',
-                "priority": "high" if overall_risk == "High" else "medium",
+                "priority": priority,
                 "dueInDays": 7,
-            })
-        return quizzes
+            }
+            for subject in at_risk_subjects
+        ]
 
     # --- AI helpers (Hugging Face) ---
 
+    @staticmethod
+    def _format_weak_topic_lines(weak_topics: List[Dict[str, Any]]) -> str:
+        """Prompt lines for the five weakest topics (weak_topics is sorted weakest-first)."""
+        return "\n".join(
+            f"- {t['topic']} ({t['accuracy']*100:.0f}% accuracy)"
+            for t in weak_topics[:5]
+        )
+
     async def _generate_learning_path(
         self,
         at_risk_subjects: List[str],
-        weak_topics: List[Dict[str, Any]],
+        topic_lines: str,
         grade_level: str,
+        on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> Optional[str]:
         """Generate a personalised learning path via HF Serverless Inference."""
+        if not at_risk_subjects and not topic_lines:
+            return None
         try:
-            from main import call_hf_chat
-
-            weakness_lines = ", ".join(at_risk_subjects)
-            topic_lines = "\n".join(
-                f"  - {t['topic']} ({t['accuracy']*100:.0f}% accuracy)"
-                for t in weak_topics[:5]
-            )
+            # Sorted so cohorts with the same subjects share a cache entry
+            weakness_lines = ", ".join(sorted(at_risk_subjects))
 
             prompt = (
                 f"Generate a personalised math learning path for a {grade_level} student.\n\n"
@@ -597,7 +955,7 @@ class MathPulseAutomationEngine:
                 "Format as a numbered list. Be specific."
             )
 
-            return call_hf_chat(
+            return await _cached_hf_chat(
                 messages=[
                     {
                         "role": "system",
@@ -610,6 +968,7 @@ class MathPulseAutomationEngine:
                 ],
                 max_tokens=1500,
                 temperature=0.7,
+                on_chunk=on_chunk,
             )
         except Exception as e:
             logger.warning(f"Learning-path AI call failed: {e}")
@@ -617,26 +976,18 @@ class MathPulseAutomationEngine:
 
     async def _generate_teacher_interventions(
         self,
-        risk_classifications: Dict[str, Dict[str, Any]],
-        weak_topics: List[Dict[str, Any]],
+        at_risk_subjects: List[str],
+        topic_lines: str,
+        on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> Optional[str]:
         """Generate teacher intervention recommendations via HF Serverless Inference."""
+        if not at_risk_subjects and not topic_lines:
+            return None
         try:
-            from main import call_hf_chat
-
-            at_risk = [
-                subj for subj, data in risk_classifications.items()
-                if data["status"] == "At Risk"
-            ]
-            topic_lines = "\n".join(
-                f"- {t['topic']} ({t['accuracy']*100:.0f}% accuracy)"
-                for t in weak_topics[:5]
-            )
-
             prompt = (
                 "You are an educational intervention specialist. A student has completed "
                 "their diagnostic assessment with the following results:\n\n"
-                f"At-Risk Subjects: {', '.join(at_risk)}\n\n"
+                f"At-Risk Subjects: {', '.join(sorted(at_risk_subjects))}\n\n"
                 f"Weak Topics Identified:\n{topic_lines}\n\n"
                 "Generate a 'Remedial Path Timeline' with:\n"
                 "1. Prioritised list of topics to address (most critical first)\n"
@@ -647,7 +998,7 @@ class MathPulseAutomationEngine:
                 "Keep response under 300 words, structured with clear sections."
             )
 
-            return call_hf_chat(
+            return await _cached_hf_chat(
                 messages=[
                     {
                         "role": "system",
@@ -660,6 +1011,7 @@ class MathPulseAutomationEngine:
                 ],
                 max_tokens=1000,
                 temperature=0.5,
+                on_chunk=on_chunk,
             )
         except Exception as e:
             logger.warning(f"Teacher-intervention AI call failed: {e}")
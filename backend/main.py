@@ -27,9 +27,10 @@ import random
 import secrets
 import string
 import asyncio
+import functools
 from contextlib import asynccontextmanager
 from typing import List, Optional, Dict, Any, Set, Tuple, Iterator, AsyncIterator, Sequence, cast
-from collections import Counter, defaultdict
+from collections import Counter, OrderedDict, defaultdict
 from threading import Lock
 
 # Lazy import for audit_logger to prevent ModuleNotFoundError during test collection.
@@ -63,10 +64,11 @@ except BaseException as e:
     print("   Continuing startup to avoid restart-loop crash.")
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, Form
+from fastapi.exceptions import RequestValidationError
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, Response, StreamingResponse
-from pydantic import BaseModel, Field, field_validator, model_validator
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
 from starlette.middleware.base import BaseHTTPMiddleware
 import asyncio
 import time
@@ -77,6 +79,8 @@ import tempfile
 import subprocess
 import requests as http_requests
 import httpx
+import numpy as np  # type: ignore[import-not-found]
+import pdfplumber
 import uvicorn
 from services.inference_client import (
     InferenceRequest, create_default_client,
@@ -223,6 +227,7 @@ from analytics import (
     fetch_student_quiz_history,
     fetch_topic_dependencies,
     store_competency_analysis,
+    _rule_based_risk_batch,
     RISK_MODEL_PATH,
     COMPETENCY_THRESHOLDS,
     MIN_QUIZ_ATTEMPTS_FOR_COMPETENCY,
@@ -384,7 +389,10 @@ ROLE_POLICIES: Dict[str, Set[str]] = {
     "/api/predict-risk": TEACHER_OR_ADMIN,
     "/api/predict-risk/batch": TEACHER_OR_ADMIN,
     "/api/learning-path": ALL_APP_ROLES,
+    "/api/learning-path/stream": ALL_APP_ROLES,
     "/api/analytics/daily-insight": TEACHER_OR_ADMIN,
+    "/api/analytics/daily-insight/stream": TEACHER_OR_ADMIN,
+    "/api/analytics/daily-insight/batch": TEACHER_OR_ADMIN,
     "/api/analytics/class/{class_id}": TEACHER_OR_ADMIN,
     "/api/analytics/class/{class_id}/students": TEACHER_OR_ADMIN,
     "/api/analytics/class/{class_id}/topics": TEACHER_OR_ADMIN,
@@ -444,6 +452,7 @@ ROLE_POLICIES: Dict[str, Set[str]] = {
     "/api/analytics/imported-class-overview": TEACHER_OR_ADMIN,
     "/api/analytics/topic-mastery": TEACHER_OR_ADMIN,
     "/api/automation/diagnostic-completed": ADMIN_ONLY,
+    "/api/automation/diagnostic-completed/stream": ADMIN_ONLY,
     "/api/automation/quiz-submitted": ADMIN_ONLY,
     "/api/automation/student-enrolled": ADMIN_ONLY,
     "/api/automation/data-imported": ADMIN_ONLY,
@@ -506,6 +515,15 @@ async def app_lifespan(_app: FastAPI) -> AsyncIterator[None]:
             logger.info("✅ InferenceClient pre-initialized at startup")
         except Exception as e:
             logger.warning(f"⚠️ Failed to pre-initialize InferenceClient: {e}")
+        if not os.getenv("DEEPSEEK_API_KEY"):
+            return
+        # Open the pooled DeepSeek connection now (cheap GET /models) so the first user
+        # request reuses it instead of paying the TCP + TLS handshake.
+        try:
+            await _run_hf_blocking(lambda: get_deepseek_client().models.list())
+            logger.info("✅ DeepSeek connection pre-warmed at startup")
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to pre-warm DeepSeek connection: {e}")
 
     async def _warmup_vectorstore() -> None:
         active_model = os.getenv("HF_MODEL_ID", "deepseek-chat")
@@ -1190,7 +1208,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
             "status": exc.status_code,
             "requestId": request_id,
         },
-        headers={"X-Request-ID": request_id},
+        headers={**(exc.headers or {}), "X-Request-ID": request_id},
     )
 
 
@@ -1399,6 +1417,11 @@ def call_hf_chat_stream(
 HF_BLOCKING_CALL_CONCURRENCY = max(1, int(os.getenv("HF_BLOCKING_CALL_CONCURRENCY", "16")))
 _hf_call_semaphore: Optional[asyncio.Semaphore] = None
 _hf_call_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+# In-flight cap for the LLM-backed endpoints; past it requests get an immediate 503
+# instead of queueing behind a saturated inference backend.
+MAX_INFLIGHT_LLM_REQUESTS = max(1, int(os.getenv("MAX_INFLIGHT_LLM", "32")))
+_llm_inflight_semaphore: Optional[asyncio.Semaphore] = None
+_llm_inflight_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
 HF_ASYNC_MAX_CONNECTIONS = max(4, int(os.getenv("HF_ASYNC_MAX_CONNECTIONS", "64")))
 HF_ASYNC_MAX_KEEPALIVE_CONNECTIONS = max(
     2,
@@ -1407,6 +1430,7 @@ HF_ASYNC_MAX_KEEPALIVE_CONNECTIONS = max(
 HF_ASYNC_CONNECT_TIMEOUT_SEC = float(os.getenv("HF_ASYNC_CONNECT_TIMEOUT_SEC", "10.0"))
 HF_ASYNC_WRITE_TIMEOUT_SEC = float(os.getenv("HF_ASYNC_WRITE_TIMEOUT_SEC", "30.0"))
 HF_ASYNC_POOL_TIMEOUT_SEC = float(os.getenv("HF_ASYNC_POOL_TIMEOUT_SEC", "10.0"))
+HF_ASYNC_KEEPALIVE_EXPIRY_SEC = float(os.getenv("HF_ASYNC_KEEPALIVE_EXPIRY_SEC", "60.0"))
 _hf_async_http_client: Optional[httpx.AsyncClient] = None
 _hf_async_http_client_lock: Optional[asyncio.Lock] = None
 _hf_async_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
@@ -1431,6 +1455,7 @@ async def _get_hf_async_http_client() -> httpx.AsyncClient:
             limits = httpx.Limits(
                 max_connections=HF_ASYNC_MAX_CONNECTIONS,
                 max_keepalive_connections=HF_ASYNC_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HF_ASYNC_KEEPALIVE_EXPIRY_SEC,
             )
             _hf_async_http_client = httpx.AsyncClient(http2=True, limits=limits)
     assert _hf_async_http_client is not None
@@ -1461,6 +1486,71 @@ async def _run_hf_blocking(func, /, *args, **kwargs):
         return await asyncio.to_thread(func, *args, **kwargs)
 
 
+def _get_llm_inflight_semaphore() -> asyncio.Semaphore:
+    global _llm_inflight_semaphore, _llm_inflight_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _llm_inflight_semaphore is None or _llm_inflight_semaphore_loop is not loop:
+        _llm_inflight_semaphore = asyncio.Semaphore(MAX_INFLIGHT_LLM_REQUESTS)
+        _llm_inflight_semaphore_loop = loop
+    return _llm_inflight_semaphore
+
+
+async def _acquire_llm_slot() -> asyncio.Semaphore:
+    """Take an in-flight LLM slot, or raise 503 right away when all are in use."""
+    semaphore = _get_llm_inflight_semaphore()
+    if semaphore.locked():
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+    await semaphore.acquire()  # never waits: a slot is free
+    return semaphore
+
+
+def _limit_llm_inflight(endpoint):
+    """Reject with 503 while MAX_INFLIGHT_LLM_REQUESTS calls of limited endpoints are running."""
+    @functools.wraps(endpoint)
+    async def limited(*args, **kwargs):
+        semaphore = await _acquire_llm_slot()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            semaphore.release()
+
+    return limited
+
+
+async def _release_llm_slot_after(body: AsyncIterator[Any], semaphore: asyncio.Semaphore) -> AsyncIterator[Any]:
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        semaphore.release()
+
+
+def _limit_llm_inflight_stream(endpoint):
+    """
+    _limit_llm_inflight for SSE endpoints: the slot is taken before the StreamingResponse
+    is built and held until its event generator finishes, not just until the handler returns.
+    """
+    @functools.wraps(endpoint)
+    async def limited(*args, **kwargs):
+        semaphore = await _acquire_llm_slot()
+        try:
+            response = await endpoint(*args, **kwargs)
+        except BaseException:
+            semaphore.release()
+            raise
+        if not isinstance(response, StreamingResponse):
+            semaphore.release()
+            return response
+        response.body_iterator = _release_llm_slot_after(response.body_iterator, semaphore)
+        return response
+
+    return limited
+
+
 def _hf_retry_sleep_seconds(backoff_sec: float, attempt: int) -> float:
     jitter_factor = random.uniform(0.9, 1.2)
     return backoff_sec * attempt * jitter_factor
@@ -2230,6 +2320,10 @@ class DailyInsightResponse(BaseModel):
     insight: str
 
 
+class DailyInsightBatchRequest(BaseModel):
+    classes: List[DailyInsightRequest]
+
+
 class VerificationResult(BaseModel):
     verified: bool
     confidence: str
@@ -2295,7 +2389,7 @@ async def health_check():
         "space": "mathpulse-ai",
         "firebase": _firebase_ready,
         "chat_model": CHAT_MODEL,
-        "risk_model": RISK_MODEL,
+        "risk_model": RISK_CLASSIFIER_MODEL,
     }
 
 
@@ -2424,6 +2518,38 @@ Treat all Filipino conversational replies as normal student communication, never
 off-topic or unrecognized input."""
 
 
+def _tutor_system_messages(context_parts: List[str]) -> List[Dict[str, str]]:
+    """
+    System messages for a tutor chat. MATH_TUTOR_SYSTEM_PROMPT always goes first and
+    unchanged, so every conversation shares that prefix and DeepSeek's context cache
+    can reuse it; per-student context (RAG, profile, memory) follows as its own message.
+    """
+    messages = [{"role": "system", "content": MATH_TUTOR_SYSTEM_PROMPT}]
+    if context_parts:
+        messages.append({"role": "system", "content": "\n\n".join(context_parts)})
+    return messages
+
+
+# Tutor history is windowed by estimated tokens (chars/4 plus a few tokens of role framing,
+# as memory_service does) rather than by message count, so ten long turns cannot blow up
+# the prompt and many short ones are not cut off early. The newest turn is always kept.
+CHAT_HISTORY_TOKEN_BUDGET = max(1, int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500")))
+CHAT_HISTORY_MAX_MESSAGES = max(1, int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "40")))
+
+
+def _chat_history_window(history: Optional[List[ChatMessage]]) -> List[ChatMessage]:
+    recent = (history or [])[-CHAT_HISTORY_MAX_MESSAGES:]
+    total = 0
+    start = len(recent)
+    while start > 0:
+        estimated = len(recent[start - 1].content) // 4 + 4
+        if total + estimated > CHAT_HISTORY_TOKEN_BUDGET and total > 0:
+            break
+        total += estimated
+        start -= 1
+    return recent[start:]
+
+
 _STREAM_COMPLETION_MODES: Set[str] = {"auto", "marker", "none"}
 _EXPECTED_END_MARKER_PATTERNS: Tuple[re.Pattern[str], ...] = (
     re.compile(
@@ -2629,6 +2755,7 @@ def _build_stream_continuation_prompt(original_question: str, expected_end_marke
 
 
 @app.post("/api/chat", response_model=ChatResponse)
+@_limit_llm_inflight
 async def chat_tutor(request: ChatRequest):
     """AI Math Tutor powered by Hugging Face Inference routing."""
     _start_ms = int(time.monotonic() * 1000)
@@ -2642,7 +2769,7 @@ async def chat_tutor(request: ChatRequest):
                 _active = get_active_state(request.userId, request.sessionId)
             except Exception:
                 _active = None
-            _history_dicts = [{"role": m.role, "content": m.content} for m in (request.history or [])[-10:]]
+            _history_dicts = [{"role": m.role, "content": m.content} for m in _chat_history_window(request.history)]
             if is_continuation_reply(request.message, _active, _history_dicts):
                 _skip_scope_check = True
         # ─── End Intent Gate ─────────────────────────────────────
@@ -2652,7 +2779,8 @@ async def chat_tutor(request: ChatRequest):
             if boundary_response is not None:
                 return ChatResponse(response=boundary_response)
 
-        system_prompt = MATH_TUTOR_SYSTEM_PROMPT
+        # Per-student context, most specific last; sent after the fixed tutor prompt
+        context_parts: List[str] = []
 
         # ─── Memory Context Injection ────────────────────────────
         _t0 = int(time.monotonic() * 1000)
@@ -2668,7 +2796,7 @@ async def chat_tutor(request: ChatRequest):
             except Exception as mem_err:
                 logger.debug(f"Memory context injection skipped: {mem_err}")
         if memory_context:
-            system_prompt = memory_context + "\n\n" + system_prompt
+            context_parts.insert(0, memory_context)
         logger.info(f"TIMING [memory_context_injection] {int(time.monotonic() * 1000) - _t0}ms")
         # ─── End Memory Context ──────────────────────────────────
         
@@ -2692,7 +2820,7 @@ Weak Domains: {', '.join(risk.get('weak_domains', []))}
 Critical Gaps: {', '.join(risk.get('critical_gaps', []))}
 Overall Risk Level: {risk.get('overall_risk', 'unknown')}
 """
-                            system_prompt = student_context + "\n" + system_prompt
+                            context_parts.insert(0, student_context.strip())
             except Exception as ctx_err:
                 logger.debug(f"Failed to inject student profile into chat: {ctx_err}")
         
@@ -2705,14 +2833,14 @@ Overall Risk Level: {risk.get('overall_risk', 'unknown')}
                 rag_context = "RELEVANT CURRICULUM REFERENCE:\n"
                 for chunk in curriculum_chunks:
                     rag_context += f"[{chunk.get('source_file', '')}] {chunk.get('content', '')[:400]}\n--\n"
-                system_prompt = rag_context + "\n\n" + system_prompt
+                context_parts.insert(0, rag_context)
         except Exception as rag_err:
             logger.debug(f"RAG context injection skipped: {rag_err}")
         
-        messages = [{"role": "system", "content": system_prompt}]
+        messages = _tutor_system_messages(context_parts)
 
         # Add conversation history
-        for msg in request.history[-10:]:  # Keep last 10 messages for context window
+        for msg in _chat_history_window(request.history):
             messages.append({"role": msg.role, "content": msg.content})
 
         # Add current message
@@ -2795,6 +2923,7 @@ async def _update_memory_after_response(
 
 
 @app.post("/api/chat/stream")
+@_limit_llm_inflight_stream
 async def chat_tutor_stream(request: ChatRequest):
     """SSE stream endpoint for AI Math Tutor chat responses."""
     try:
@@ -2805,7 +2934,7 @@ async def chat_tutor_stream(request: ChatRequest):
                 _active = get_active_state(request.userId, request.sessionId)
             except Exception:
                 _active = None
-            _history_dicts = [{"role": m.role, "content": m.content} for m in (request.history or [])[-10:]]
+            _history_dicts = [{"role": m.role, "content": m.content} for m in _chat_history_window(request.history)]
             if is_continuation_reply(request.message, _active, _history_dicts):
                 _skip_scope_check = True
         # ─── End Intent Gate ─────────────────────────────────────
@@ -2824,13 +2953,10 @@ async def chat_tutor_stream(request: ChatRequest):
                 )
             except Exception as mem_err:
                 logger.debug(f"Memory context injection skipped: {mem_err}")
-        prompt_content = MATH_TUTOR_SYSTEM_PROMPT
-        if memory_context:
-            prompt_content = memory_context + "\n\n" + MATH_TUTOR_SYSTEM_PROMPT
         # ─── End Memory Context ──────────────────────────────────
         
-        messages = [{"role": "system", "content": prompt_content}]
-        for msg in request.history[-10:]:
+        messages = _tutor_system_messages([memory_context] if memory_context else [])
+        for msg in _chat_history_window(request.history):
             messages.append({"role": msg.role, "content": msg.content})
         messages.append({"role": "user", "content": request.message})
 
@@ -3516,6 +3642,24 @@ RISK_MAPPING = {
     "low risk academically stable": "Low",
 }
 
+# Risk labels only need a short JSON answer, so the classifier can be pointed at a smaller,
+# faster chat model than the tutor without touching the other AI features.
+RISK_CLASSIFIER_MODEL = os.getenv("RISK_CLASSIFIER_MODEL_ID", "").strip() or CHAT_MODEL
+
+# Risk prompts put the fixed instructions first and the student numbers last, so every
+# request shares the same leading tokens and DeepSeek's prefix (context) cache can
+# reuse them instead of re-processing the label instructions each call.
+RISK_SYSTEM_PROMPT = "You are a student risk analyst. Respond with valid JSON only."
+RISK_SINGLE_INSTRUCTIONS = (
+    f"Classify the student below into exactly one of these risk levels: {', '.join(RISK_LABELS)}. "
+    f"Respond with a JSON object containing only: risk_label, confidence (0-1 float)."
+)
+RISK_GROUP_INSTRUCTIONS = (
+    f"Classify each student below into exactly one of these risk levels: {', '.join(RISK_LABELS)}. "
+    f'Respond with a JSON object {{"students": [...]}} holding one entry per student with: '
+    f"student (its number below), risk_label, confidence (0-1 float). No other fields."
+)
+
 
 def _to_strict_risk_level(level: str) -> str:
     normalized = (level or "").strip().lower()
@@ -3537,6 +3681,97 @@ def _basic_risk_top_factors(student_data: StudentRiskData) -> List[str]:
     return factors[:3]
 
 
+def _risk_student_summary(student_data: StudentRiskData) -> str:
+    return (
+        f"Engagement score is {student_data.engagementScore:.0f}%. "
+        f"Average quiz score is {student_data.avgQuizScore:.0f}%. "
+        f"Assignment completion rate is {student_data.assignmentCompletion:.0f}%."
+    )
+
+
+# The model only sees the whole-percent summary, so every student with the same summary
+# gets the same (temperature 0) answer; remember {risk_label, confidence} per summary.
+PREDICT_RISK_OUTPUT_CACHE_MAX_ENTRIES = max(0, int(os.getenv("PREDICT_RISK_OUTPUT_CACHE_MAX_ENTRIES", "4096")))
+_risk_output_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+
+def _get_cached_risk_output(summary: str) -> Optional[Dict[str, Any]]:
+    output = _risk_output_cache.get(summary)
+    if output is not None:
+        _risk_output_cache.move_to_end(summary)
+    return output
+
+
+def _remember_risk_output(summary: str, parsed: Dict[str, Any]) -> None:
+    if PREDICT_RISK_OUTPUT_CACHE_MAX_ENTRIES == 0:
+        return
+    _risk_output_cache[summary] = {
+        "risk_label": parsed.get("risk_label", "medium academic risk"),
+        "confidence": parsed.get("confidence", 0.5),
+    }
+    _risk_output_cache.move_to_end(summary)
+    if len(_risk_output_cache) > PREDICT_RISK_OUTPUT_CACHE_MAX_ENTRIES:
+        _risk_output_cache.popitem(last=False)
+
+
+def _risk_prediction_from_output(student_data: StudentRiskData, parsed: Dict[str, Any]) -> RiskPrediction:
+    """Build the RiskPrediction for one student from the model's {risk_label, confidence} JSON."""
+    risk_label = str(parsed.get("risk_label", "medium academic risk"))
+    confidence = float(parsed.get("confidence", 0.5))  # type: ignore[arg-type]
+
+    risk_level = RISK_MAPPING.get(risk_label, "Medium")
+    return RiskPrediction(
+        riskLevel=risk_level,
+        confidence=round(confidence, 4),
+        analysis={
+            "labels": [risk_label],
+            "scores": [round(confidence, 4)],
+        },
+        risk_level=_to_strict_risk_level(risk_level),
+        risk_score=round(confidence, 4),
+        top_factors=_basic_risk_top_factors(student_data),
+    )
+
+
+# Students whose weighted rule score (analytics._rule_based_risk_batch: 45 / 70 cut-offs)
+# lands within this many points of a cut-off are "contested" and still go to the model;
+# everyone else is labelled by the rule without a network call.
+PREDICT_RISK_RULE_MARGIN = max(0.0, float(os.getenv("PREDICT_RISK_RULE_MARGIN", "5")))
+_RISK_LEVEL_LABELS = {level: label for label, level in RISK_MAPPING.items()}
+
+
+def _rule_risk_predictions(students: List[StudentRiskData]) -> List[Optional[RiskPrediction]]:
+    """
+    Label every student with the weighted rule in one NumPy pass. Returns one entry per
+    student, None for contested students the caller should send to the model.
+    """
+    if not students:
+        return []
+    features = np.array(
+        [[s.engagementScore, s.avgQuizScore, s.attendance, s.assignmentCompletion] for s in students],
+        dtype=np.float64,
+    )
+    zeros = np.zeros(len(students))
+    scores, levels, probs = _rule_based_risk_batch(*features.T, zeros, zeros, zeros)
+    contested = np.minimum(np.abs(scores - 45), np.abs(scores - 70)) < PREDICT_RISK_RULE_MARGIN
+
+    predictions: List[Optional[RiskPrediction]] = []
+    for student, level, level_probs, is_contested in zip(students, levels.tolist(), probs.max(axis=1).tolist(), contested.tolist()):
+        if is_contested:
+            predictions.append(None)
+            continue
+        confidence = round(level_probs, 4)
+        predictions.append(RiskPrediction(
+            riskLevel=level,
+            confidence=confidence,
+            analysis={"labels": [_RISK_LEVEL_LABELS[level]], "scores": [confidence], "method": "rule"},
+            risk_level=_to_strict_risk_level(level),
+            risk_score=confidence,
+            top_factors=_basic_risk_top_factors(student),
+        ))
+    return predictions
+
+
 def _parse_recommendation_lines(text: str, *, max_items: int = 5) -> List[str]:
     lines: List[str] = []
     for raw_line in (text or "").splitlines():
@@ -3601,25 +3836,39 @@ async def _generate_risk_recommendations_llm(data: EnhancedRiskRequest, result:
 
 
 @app.post("/api/predict-risk", response_model=RiskPrediction)
-async def predict_risk(student_data: StudentRiskData, response: Response):
-    """Student risk prediction using DeepSeek AI classification"""
+async def predict_risk(
+    student_data: StudentRiskData,
+    response: Response,
+    explain: bool = Query(default=False),
+):
+    """
+    Student risk prediction. Clear-cut students are labelled by the weighted rule; contested
+    ones (or any student when explain=true) use DeepSeek AI classification.
+    """
     try:
+        if not explain:
+            rule_prediction = _rule_risk_predictions([student_data])[0]
+            if rule_prediction is not None:
+                return rule_prediction
+
         cache_key = deterministic_response_cache.build_cache_key(
             "predict_risk",
             student_data.model_dump(),
         )
+        summary = _risk_student_summary(student_data)
+        cached_output = _get_cached_risk_output(summary)
+        if cached_output is not None:
+            _set_cache_response_header(response, hit=True)
+            return _risk_prediction_from_output(student_data, cached_output)
+
         _set_cache_response_header(response, hit=False)
         _ensure_deepseek_available()
 
         client = get_deepseek_client()
 
         risk_prompt = (
-            f"Student academic performance summary: "
-            f"Engagement score is {student_data.engagementScore:.0f}%. "
-            f"Average quiz score is {student_data.avgQuizScore:.0f}%. "
-            f"Assignment completion rate is {student_data.assignmentCompletion:.0f}%.\n\n"
-            f"Classify this student into exactly one of these risk levels: {', '.join(RISK_LABELS)}. "
-            f"Respond with a JSON object containing: risk_label, confidence (0-1 float), reasoning (short sentence)."
+            f"{RISK_SINGLE_INSTRUCTIONS}\n\n"
+            f"Student academic performance summary: {summary}"
         )
 
         # Retry DeepSeek inference with backoff
@@ -3627,14 +3876,14 @@ async def predict_risk(student_data: StudentRiskData, response: Response):
         for attempt in range(3):
             try:
                 api_response = await _run_hf_blocking(
-                    lambda model=CHAT_MODEL, prompt=risk_prompt: client.chat.completions.create(  # type: ignore[arg-type]
+                    lambda model=RISK_CLASSIFIER_MODEL, prompt=risk_prompt: client.chat.completions.create(  # type: ignore[arg-type]
                         model=model,
                         messages=[
-                            {"role": "system", "content": "You are a student risk analyst. Respond with valid JSON only."},
+                            {"role": "system", "content": RISK_SYSTEM_PROMPT},
                             {"role": "user", "content": prompt},
                         ],
                         response_format={"type": "json_object"},
-                        max_tokens=256,
+                        max_tokens=96,
                         temperature=0.0,
                     )
                 )
@@ -3656,27 +3905,14 @@ async def predict_risk(student_data: StudentRiskData, response: Response):
         content = api_response.choices[0].message.content or "{}"
         try:
             parsed = json.loads(content)
+            model_answered = True
         except json.JSONDecodeError:
             parsed = {"risk_label": "medium academic risk", "confidence": 0.5}
+            model_answered = False
 
-        risk_label = str(parsed.get("risk_label", "medium academic risk"))
-        confidence = float(parsed.get("confidence", 0.5))  # type: ignore[arg-type]
-
-        risk_level = RISK_MAPPING.get(risk_label, "Medium")
-        strict_risk_level = _to_strict_risk_level(risk_level)
-        top_factors = _basic_risk_top_factors(student_data)
-
-        result = RiskPrediction(
-            riskLevel=risk_level,
-            confidence=round(confidence, 4),
-            analysis={
-                "labels": [risk_label],
-                "scores": [round(confidence, 4)],
-            },
-            risk_level=strict_risk_level,
-            risk_score=round(confidence, 4),
-            top_factors=top_factors,
-        )
+        result = _risk_prediction_from_output(student_data, parsed)
+        if model_answered:
+            _remember_risk_output(summary, parsed)
         await deterministic_response_cache.set(
             cache_key,
             result.model_dump(),
@@ -3691,17 +3927,106 @@ async def predict_risk(student_data: StudentRiskData, response: Response):
         raise HTTPException(status_code=500, detail=f"Risk prediction error: {str(e)}")
 
 
+PREDICT_RISK_BATCH_CONCURRENCY = max(1, int(os.getenv("PREDICT_RISK_BATCH_CONCURRENCY", "16")))
+PREDICT_RISK_BATCH_GROUP_SIZE = max(1, int(os.getenv("PREDICT_RISK_BATCH_GROUP_SIZE", "20")))
+
+
+async def _predict_risk_group(students: List[StudentRiskData]) -> List[Optional[RiskPrediction]]:
+    """
+    Classify several students with one DeepSeek completion. Returns one entry per
+    student, None where the model's answer was missing or unusable. Students whose
+    summary is already in the risk output cache are not sent to the model.
+    """
+    predictions: List[Optional[RiskPrediction]] = [None] * len(students)
+    uncached: List[int] = []
+    for position, student in enumerate(students):
+        cached_output = _get_cached_risk_output(_risk_student_summary(student))
+        if cached_output is None:
+            uncached.append(position)
+        else:
+            predictions[position] = _risk_prediction_from_output(student, cached_output)
+    if not uncached:
+        return predictions
+
+    _ensure_deepseek_available()
+    client = get_deepseek_client()
+
+    summaries = "\n".join(
+        f"{number}. {_risk_student_summary(students[position])}"
+        for number, position in enumerate(uncached, start=1)
+    )
+    prompt = (
+        f"{RISK_GROUP_INSTRUCTIONS}\n\n"
+        f"Academic performance summaries for {len(uncached)} students:\n{summaries}"
+    )
+    api_response = await _run_hf_blocking(
+        lambda: client.chat.completions.create(  # type: ignore[arg-type]
+            model=str(RISK_CLASSIFIER_MODEL),
+            messages=[
+                {"role": "system", "content": RISK_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=64 + 48 * len(uncached),
+            temperature=0.0,
+        )
+    )
+
+    parsed = json.loads(api_response.choices[0].message.content or "{}")
+    entries = parsed.get("students") if isinstance(parsed, dict) else None
+    answered: Set[int] = set()
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            number = int(entry.get("student"))  # type: ignore[arg-type]
+            if not 1 <= number <= len(uncached) or number in answered:
+                continue
+            student = students[uncached[number - 1]]
+            prediction = _risk_prediction_from_output(student, entry)
+        except (TypeError, ValueError):
+            continue
+        answered.add(number)
+        predictions[uncached[number - 1]] = prediction
+        _remember_risk_output(_risk_student_summary(student), entry)
+        await deterministic_response_cache.set(
+            deterministic_response_cache.build_cache_key("predict_risk", student.model_dump()),
+            prediction.model_dump(),
+            PREDICT_RISK_CACHE_TTL_SECONDS,
+        )
+    return predictions
+
+
 @app.post("/api/predict-risk/batch")
-async def predict_risk_batch(request: BatchRiskRequest):
+async def predict_risk_batch(request: BatchRiskRequest, explain: bool = Query(default=False)):
     """Batch risk prediction for multiple students"""
-    results = []
-    for student in request.students:
-        try:
-            result = await predict_risk(student, Response())
-            results.append(result)
-        except Exception:
-            results.append(
-                RiskPrediction(
+    # The weighted rule labels the whole batch in one NumPy pass; only contested students
+    # (all of them with explain=true) reach the model. Those are classified
+    # PREDICT_RISK_BATCH_GROUP_SIZE per completion, groups running concurrently (at most
+    # PREDICT_RISK_BATCH_CONCURRENCY at a time per batch). Anyone the grouped answer left
+    # out goes through the single-student predict_risk path. Results keep the request order.
+    semaphore = asyncio.Semaphore(PREDICT_RISK_BATCH_CONCURRENCY)
+    results: List[Optional[RiskPrediction]] = (
+        [None] * len(request.students) if explain else _rule_risk_predictions(request.students)
+    )
+    contested = [index for index, result in enumerate(results) if result is None]
+    students = [request.students[index] for index in contested]
+    model_results: List[Optional[RiskPrediction]] = [None] * len(students)
+
+    async def _predict_group(start: int) -> None:
+        group = students[start:start + PREDICT_RISK_BATCH_GROUP_SIZE]
+        async with semaphore:
+            try:
+                model_results[start:start + len(group)] = await _predict_risk_group(group)
+            except Exception as e:
+                logger.warning(f"Grouped risk prediction failed for {len(group)} student(s): {e}")
+
+    async def _predict_one(student: StudentRiskData) -> RiskPrediction:
+        async with semaphore:
+            try:
+                return await predict_risk(student, Response(), explain=True)
+            except Exception:
+                return RiskPrediction(
                     riskLevel="Medium",
                     confidence=0.0,
                     analysis={"labels": [], "scores": []},
@@ -3709,48 +4034,102 @@ async def predict_risk_batch(request: BatchRiskRequest):
                     risk_score=0.0,
                     top_factors=["Fallback risk response due to prediction error"],
                 )
-            )
+
+    await asyncio.gather(*(_predict_group(start) for start in range(0, len(students), PREDICT_RISK_BATCH_GROUP_SIZE)))
+    missing = [index for index, result in enumerate(model_results) if result is None]
+    for index, result in zip(missing, await asyncio.gather(*(_predict_one(students[i]) for i in missing))):
+        model_results[index] = result
+    for index, result in zip(contested, model_results):
+        results[index] = result
     return results
 
 
 # ─── Learning Path Generation ──────────────────────────────────
 
 
-@app.post("/api/learning-path", response_model=LearningPathResponse)
-async def generate_ai_learning_path(request: LearningPathRequest, response: Response):
-    """Generate AI-powered personalized learning path"""
-    try:
-        cache_key = deterministic_response_cache.build_cache_key(
-            "learning_path",
-            request.model_dump(),
-        )
-        cached_payload = await deterministic_response_cache.get(cache_key)
-        if isinstance(cached_payload, dict):
-            _set_cache_response_header(response, hit=True)
-            return LearningPathResponse(**cached_payload)
+def _sse_event(event: str, data: str) -> str:
+    lines = str(data).replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join([f"event: {event}"] + [f"data: {line}" for line in lines]) + "\n\n"
 
-        _set_cache_response_header(response, hit=False)
-        rag_context_block = ""
-        if ENABLE_RAG_ANALYSIS_CONTEXT:
-            try:
-                subject_for_context = (request.subject or "general_math").strip() or "general_math"
-                competency_chunks = build_analysis_curriculum_context(request.weaknesses, subject_for_context)
-                if competency_chunks:
-                    lines = []
-                    for idx, row in enumerate(competency_chunks[:8], start=1):
-                        lines.append(
-                            f"{idx}. {row.get('content')} (Source: {row.get('source_file')} p.{row.get('page')}, "
-                            f"Q{row.get('quarter')}, {row.get('content_domain')})"
-                        )
-                    rag_context_block = (
-                        "RELEVANT DEPED LEARNING COMPETENCIES FOR WEAK TOPICS:\n"
-                        + "\n".join(lines)
-                        + "\n\n"
+
+def _stream_cached_completion(
+    messages: Optional[List[Dict[str, str]]],
+    *,
+    cache_key: str,
+    cache_field: str,
+    cache_ttl: int,
+    cached_text: Optional[str],
+    max_tokens: int,
+    temperature: float,
+    task_type: str,
+    error_detail: str,
+) -> StreamingResponse:
+    """
+    SSE counterpart of the cached single-completion endpoints (learning path, daily
+    insight): ``chunk`` events ({"chunk": ...}) as the text is generated, then ``end``.
+    A cached text is sent as one chunk; a completed stream is written to the same
+    cache entry the buffered endpoint reads, under ``cache_field``.
+    """
+
+    async def event_generator():
+        if cached_text is not None or messages is None:
+            yield _sse_event("chunk", json.dumps({"chunk": cached_text or ""}, ensure_ascii=False))
+            yield _sse_event("end", "done")
+            return
+
+        parts: List[str] = []
+        try:
+            async for delta in call_hf_chat_stream_async(
+                messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                task_type=task_type,
+            ):
+                parts.append(delta)
+                yield _sse_event("chunk", json.dumps({"chunk": delta}, ensure_ascii=False))
+        except Exception as hf_err:
+            logger.error(f"HF {task_type} stream failed: {hf_err}")
+            yield _sse_event("error", json.dumps({"detail": error_detail}))
+        else:
+            text = _strip_repetition("".join(parts))
+            if text:
+                await deterministic_response_cache.set(cache_key, {cache_field: text}, cache_ttl)
+        yield _sse_event("end", "done")
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "X-Cache": "HIT" if cached_text is not None else "MISS",
+        },
+    )
+
+
+def _learning_path_messages(request: LearningPathRequest) -> List[Dict[str, str]]:
+    rag_context_block = ""
+    if ENABLE_RAG_ANALYSIS_CONTEXT:
+        try:
+            subject_for_context = (request.subject or "general_math").strip() or "general_math"
+            competency_chunks = build_analysis_curriculum_context(request.weaknesses, subject_for_context)
+            if competency_chunks:
+                lines = []
+                for idx, row in enumerate(competency_chunks[:8], start=1):
+                    lines.append(
+                        f"{idx}. {row.get('content')} (Source: {row.get('source_file')} p.{row.get('page')}, "
+                        f"Q{row.get('quarter')}, {row.get('content_domain')})"
                     )
-            except Exception as rag_err:
-                logger.warning(f"RAG analysis context skipped: {rag_err}")
+                rag_context_block = (
+                    "RELEVANT DEPED LEARNING COMPETENCIES FOR WEAK TOPICS:\n"
+                    + "\n".join(lines)
+                    + "\n\n"
+                )
+        except Exception as rag_err:
+            logger.warning(f"RAG analysis context skipped: {rag_err}")
 
-        prompt = f"""Generate a personalized math learning path for a student with these details:
+    prompt = f"""Generate a personalized math learning path for a student with these details:
 {rag_context_block}STUDENT PERFORMANCE DATA:
 - Weak Topics: {', '.join(request.weaknesses)}
 - Grade Level: {request.gradeLevel}
@@ -3764,13 +4143,31 @@ Create a structured learning path with 5-7 specific activities. For each activit
 
 Format as a numbered list. Be specific to the math topics mentioned."""
 
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an educational curriculum expert specializing in mathematics. Create clear, actionable learning paths.",
-            },
-            {"role": "user", "content": prompt},
-        ]
+    return [
+        {
+            "role": "system",
+            "content": "You are an educational curriculum expert specializing in mathematics. Create clear, actionable learning paths.",
+        },
+        {"role": "user", "content": prompt},
+    ]
+
+
+@app.post("/api/learning-path", response_model=LearningPathResponse)
+@_limit_llm_inflight
+async def generate_ai_learning_path(request: LearningPathRequest, response: Response):
+    """Generate AI-powered personalized learning path"""
+    try:
+        cache_key = deterministic_response_cache.build_cache_key(
+            "learning_path",
+            request.model_dump(),
+        )
+        cached_payload = await deterministic_response_cache.get(cache_key)
+        if isinstance(cached_payload, dict):
+            _set_cache_response_header(response, hit=True)
+            return LearningPathResponse(**cached_payload)
+
+        _set_cache_response_header(response, hit=False)
+        messages = _learning_path_messages(request)
 
         try:
             content = await call_hf_chat_async(
@@ -3801,10 +4198,70 @@ Format as a numbered list. Be specific to the math topics mentioned."""
         raise HTTPException(status_code=500, detail=f"Learning path error: {str(e)}")
 
 
+@app.post("/api/learning-path/stream")
+@_limit_llm_inflight_stream
+async def generate_ai_learning_path_stream(request: LearningPathRequest):
+    """SSE variant of /api/learning-path that relays the learning path as it is generated."""
+    cache_key = deterministic_response_cache.build_cache_key("learning_path", request.model_dump())
+    cached_payload = await deterministic_response_cache.get(cache_key)
+    cached_text = cached_payload.get("learningPath") if isinstance(cached_payload, dict) else None
+    return _stream_cached_completion(
+        None if cached_text is not None else _learning_path_messages(request),
+        cache_key=cache_key,
+        cache_field="learningPath",
+        cache_ttl=LEARNING_PATH_CACHE_TTL_SECONDS,
+        cached_text=cached_text,
+        max_tokens=1500,
+        temperature=0.7,
+        task_type="learning_path",
+        error_detail="Learning path generation is temporarily unavailable.",
+    )
+
+
 # ─── Daily AI Insights ─────────────────────────────────────────
 
 
+def _daily_insight_messages(students: List[StudentInsightData]) -> List[Dict[str, str]]:
+    total = len(students)
+    # One pass over the roster: a (students × 3) score matrix and the risk-level counts
+    scores = np.array(
+        [(s.engagementScore, s.avgQuizScore, s.attendance) for s in students],
+        dtype=np.float64,
+    )
+    avg_engagement, avg_quiz, avg_attendance = scores.mean(axis=0).tolist()
+    risk_counts = Counter(s.riskLevel for s in students)
+    high_risk = risk_counts["High"]
+    medium_risk = risk_counts["Medium"]
+
+    prompt = f"""Analyze this classroom data and provide actionable insights for a math teacher:
+
+Classroom Summary:
+- Total Students: {total}
+- Average Engagement: {avg_engagement:.1f}%
+- Average Quiz Score: {avg_quiz:.1f}%
+- Average Attendance: {avg_attendance:.1f}%
+- High-Risk Students: {high_risk}
+- Medium-Risk Students: {medium_risk}
+- Low-Risk Students: {total - high_risk - medium_risk}
+
+Provide:
+1. A brief overall assessment (2-3 sentences)
+2. 3-4 specific, actionable recommendations for the teacher
+3. One positive observation to highlight
+
+Keep the response under 200 words. Be specific and practical."""
+
+    return [
+        {
+            "role": "system",
+            "content": "You are an educational data analyst providing insights to math teachers. Be specific, actionable, and encouraging.",
+        },
+        {"role": "user", "content": prompt},
+    ]
+
+
 @app.post("/api/analytics/daily-insight", response_model=DailyInsightResponse)
+@_limit_llm_inflight
 async def daily_insight(request: DailyInsightRequest, response: Response):
     """Generate daily AI insights for teacher dashboard"""
     try:
@@ -3829,37 +4286,7 @@ async def daily_insight(request: DailyInsightRequest, response: Response):
             )
             return empty_result
 
-        avg_engagement = sum(s.engagementScore for s in students) / total
-        avg_quiz = sum(s.avgQuizScore for s in students) / total
-        avg_attendance = sum(s.attendance for s in students) / total
-        high_risk = sum(1 for s in students if s.riskLevel == "High")
-        medium_risk = sum(1 for s in students if s.riskLevel == "Medium")
-
-        prompt = f"""Analyze this classroom data and provide actionable insights for a math teacher:
-
-Classroom Summary:
-- Total Students: {total}
-- Average Engagement: {avg_engagement:.1f}%
-- Average Quiz Score: {avg_quiz:.1f}%
-- Average Attendance: {avg_attendance:.1f}%
-- High-Risk Students: {high_risk}
-- Medium-Risk Students: {medium_risk}
-- Low-Risk Students: {total - high_risk - medium_risk}
-
-Provide:
-1. A brief overall assessment (2-3 sentences)
-2. 3-4 specific, actionable recommendations for the teacher
-3. One positive observation to highlight
-
-Keep the response under 200 words. Be specific and practical."""
-
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an educational data analyst providing insights to math teachers. Be specific, actionable, and encouraging.",
-            },
-            {"role": "user", "content": prompt},
-        ]
+        messages = _daily_insight_messages(students)
 
         try:
             content = await call_hf_chat_async(
@@ -3890,6 +4317,49 @@ Keep the response under 200 words. Be specific and practical."""
         raise HTTPException(status_code=500, detail=f"Daily insight error: {str(e)}")
 
 
+DAILY_INSIGHT_BATCH_CONCURRENCY = max(1, int(os.getenv("DAILY_INSIGHT_BATCH_CONCURRENCY", "8")))
+
+
+@app.post("/api/analytics/daily-insight/batch", response_model=List[DailyInsightResponse])
+async def daily_insight_batch(request: DailyInsightBatchRequest):
+    """Daily insights for several classes in one request (e.g. a school-wide dashboard)"""
+    # Classes are generated concurrently, at most DAILY_INSIGHT_BATCH_CONCURRENCY at a
+    # time per batch; each goes through daily_insight, so cached classes return at once.
+    # Results keep the request order.
+    semaphore = asyncio.Semaphore(DAILY_INSIGHT_BATCH_CONCURRENCY)
+
+    async def _insight_for(class_request: DailyInsightRequest) -> DailyInsightResponse:
+        async with semaphore:
+            try:
+                return await daily_insight(class_request, Response())
+            except Exception:
+                return DailyInsightResponse(insight="AI insight generation is temporarily unavailable.")
+
+    return list(await asyncio.gather(*(_insight_for(class_request) for class_request in request.classes)))
+
+
+@app.post("/api/analytics/daily-insight/stream")
+@_limit_llm_inflight_stream
+async def daily_insight_stream(request: DailyInsightRequest):
+    """SSE variant of /api/analytics/daily-insight that relays the insight as it is generated."""
+    cache_key = deterministic_response_cache.build_cache_key("daily_insight", request.model_dump())
+    cached_payload = await deterministic_response_cache.get(cache_key)
+    cached_text = cached_payload.get("insight") if isinstance(cached_payload, dict) else None
+    if cached_text is None and not request.students:
+        cached_text = "No student data available for analysis."
+    return _stream_cached_completion(
+        None if cached_text is not None else _daily_insight_messages(request.students),
+        cache_key=cache_key,
+        cache_field="insight",
+        cache_ttl=DAILY_INSIGHT_CACHE_TTL_SECONDS,
+        cached_text=cached_text,
+        max_tokens=800,
+        temperature=0.7,
+        task_type="daily_insight",
+        error_detail="AI insight generation is temporarily unavailable.",
+    )
+
+
 # ─── Smart Document Upload ────────────────────────────────────
 
 
@@ -3949,6 +4419,27 @@ CLASS_RECORD_FIELD_ALIASES: Dict[str, List[str]] = {
 }
 
 
+# Header spellings that name a field outright (compared after _normalize_column_text).
+# Columns matching one of these are mapped without asking the AI mapper.
+CLASS_RECORD_EXACT_HEADERS: Dict[str, str] = {
+    **dict.fromkeys(["name", "student", "student name", "full name", "fullname", "learner", "learner name"], "name"),
+    **dict.fromkeys(["lrn", "learner reference number", "learner reference no", "student id", "studentid", "learner id"], "lrn"),
+    **dict.fromkeys(["email", "e mail", "email address", "student email"], "email"),
+    **dict.fromkeys(["engagement", "engagement score", "engagementscore", "participation"], "engagementScore"),
+    **dict.fromkeys(
+        ["quiz score", "quiz average", "average quiz score", "avg quiz score", "avgquizscore", "quiz"],
+        "avgQuizScore",
+    ),
+    **dict.fromkeys(["attendance", "attendance rate", "attendance percentage"], "attendance"),
+    **dict.fromkeys(
+        ["assignment completion", "assignmentcompletion", "completion", "completion rate", "homework completion"],
+        "assignmentCompletion",
+    ),
+    **dict.fromkeys(["term", "quarter", "semester", "grading period"], "term"),
+    **dict.fromkeys(["assessment name", "assessmentname", "quiz name", "test name"], "assessmentName"),
+}
+
+
 def _is_empty_cell(value: Any) -> bool:
     if value is None:
         return True
@@ -4092,6 +4583,33 @@ def _fallback_column_mapping(columns: List[str]) -> Dict[str, str]:
     return mapping
 
 
+def _first_pdf_table(contents: bytes) -> Optional[List[List[Any]]]:
+    """
+    First table in the PDF with a header and at least one data row, or None. Pages are
+    parsed in order and parsing stops at that table; blocking, run it in a worker thread.
+    """
+    with pdfplumber.open(io.BytesIO(contents)) as pdf:
+        if len(pdf.pages) > UPLOAD_MAX_PDF_PAGES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"PDF has too many pages. Max allowed pages: {UPLOAD_MAX_PDF_PAGES}",
+            )
+        for page in pdf.pages:
+            for table in page.extract_tables():
+                if len(table) > 1:
+                    return table
+    return None
+
+
+def _exact_column_mapping(columns: List[str]) -> Dict[str, str]:
+    mapping: Dict[str, str] = {}
+    for col in columns:
+        field = CLASS_RECORD_EXACT_HEADERS.get(_normalize_column_text(col))
+        if field is not None:
+            mapping[col] = field
+    return mapping
+
+
 def _sanitize_column_mapping(raw_mapping: Any) -> Dict[str, str]:
     """Keep only non-empty string->known-field entries from AI mapping output."""
     if not isinstance(raw_mapping, dict):
@@ -4292,20 +4810,29 @@ def _normalize_class_records(
     inferred_rows = 0
     fallback_inference_rows = 0
 
-    for idx, row in df.iterrows():
+    # Stringify column by column from df.values (the same cells iterrows() yields, without
+    # building a Series per row); the per-column target is resolved once as well.
+    cells = df.values
+    column_plan: List[Tuple[Optional[str], str, List[str]]] = []
+    for position, col in enumerate(df.columns):
+        mapped_field = column_mapping.get(col)
+        column_plan.append((
+            mapped_field if mapped_field in CLASS_RECORD_REQUIRED_FIELDS else None,
+            _normalize_unknown_key(col),
+            [_stringify_cell(value) for value in cells[:, position]],
+        ))
+
+    for row_position, idx in enumerate(df.index.tolist()):
         student: Dict[str, Any] = {}
         unknown_fields: Dict[str, Any] = {}
         warnings_for_row: List[str] = []
 
-        for col in df.columns:
-            raw_value = row[col]
-            mapped_field = column_mapping.get(col)
-            if mapped_field in CLASS_RECORD_REQUIRED_FIELDS:
-                student[mapped_field] = _stringify_cell(raw_value)
-            else:
-                text_val = _stringify_cell(raw_value)
-                if text_val:
-                    unknown_fields[_normalize_unknown_key(col)] = text_val
+        for mapped_field, unknown_key, texts in column_plan:
+            text_val = texts[row_position]
+            if mapped_field is not None:
+                student[mapped_field] = text_val
+            elif text_val:
+                unknown_fields[unknown_key] = text_val
 
         student_name = str(student.get("name", "")).strip()
         if not student_name:
@@ -4724,6 +5251,7 @@ def _sync_imported_students_to_teacher_dashboard(
         updated_students = 0
         risk_high_count = 0
         total_score = 0.0
+        student_writes: List[Tuple[Any, Dict[str, Any]]] = []
 
         for identity, aggregate in by_identity.items():
             scores = aggregate.get("scores") or [0.0]
@@ -4753,7 +5281,6 @@ def _sync_imported_students_to_teacher_dashboard(
             avatar_seed = urllib.parse.quote(fallback_name)
             student_doc_id = hashlib.sha1(f"{user.uid}|{identity}".encode("utf-8")).hexdigest()[:36]
             student_ref = students_ref.document(student_doc_id)
-            student_snapshot = cast(Any, student_ref.get())
 
             payload: Dict[str, Any] = {
                 "teacherId": user.uid,
@@ -4791,14 +5318,33 @@ def _sync_imported_students_to_teacher_dashboard(
                 "lastActive": FIRESTORE_SERVER_TIMESTAMP,
                 "updatedAt": FIRESTORE_SERVER_TIMESTAMP,
             }
-
-            if _snapshot_exists(student_snapshot):
+            student_writes.append((student_ref, payload))
+
+        # Look up which students already exist in one round-trip, then write in batches,
+        # instead of a get + set per student.
+        existing_ids = {
+            snapshot.id
+            for snapshot in client.get_all([student_ref for student_ref, _ in student_writes])
+            if _snapshot_exists(snapshot)
+        }
+        batch = client.batch()
+        batch_count = 0
+        for student_ref, payload in student_writes:
+            if student_ref.id in existing_ids:
                 updated_students += 1
             else:
                 created_students += 1
                 payload["createdAt"] = FIRESTORE_SERVER_TIMESTAMP
 
-            student_ref.set(payload, merge=True)
+            batch.set(student_ref, payload, merge=True)
+            batch_count += 1
+            if batch_count >= 400:
+                batch.commit()
+                batch = client.batch()
+                batch_count = 0
+
+        if batch_count > 0:
+            batch.commit()
 
         student_count = len(by_identity)
         class_average = round(total_score / max(student_count, 1), 1)
@@ -5078,7 +5624,9 @@ def _queue_post_import_risk_refresh(
     refresh_id = hashlib.sha1(refresh_seed.encode("utf-8")).hexdigest()[:24]
 
     sanitized_mapping = _sanitize_column_mapping(column_mapping)
-    payload = DataImportPayload(
+    # Every field is built above (uid, compacted row dicts, sanitized str->str mapping),
+    # so skip re-validating the whole student list.
+    payload = DataImportPayload.model_construct(
         teacherId=user.uid,
         students=compact_students,
         columnMapping=sanitized_mapping,
@@ -7620,22 +8168,10 @@ async def upload_class_records(
                 elif ext in {".xlsx", ".xls"}:
                     df = pd.read_excel(io.BytesIO(contents))
                 elif ext == ".pdf":
-                    import pdfplumber
-                    with pdfplumber.open(io.BytesIO(contents)) as pdf:
-                        if len(pdf.pages) > UPLOAD_MAX_PDF_PAGES:
-                            raise HTTPException(
-                                status_code=413,
-                                detail=f"PDF has too many pages. Max allowed pages: {UPLOAD_MAX_PDF_PAGES}",
-                            )
-                        tables = []
-                        for page in pdf.pages:
-                            page_tables = page.extract_tables()
-                            if page_tables:
-                                tables.extend(page_tables)
-                        if tables and len(tables[0]) > 1:
-                            df = pd.DataFrame(tables[0][1:], columns=tables[0][0])
-                        else:
-                            raise HTTPException(status_code=400, detail="No tables found in PDF")
+                    table = await asyncio.to_thread(_first_pdf_table, contents)
+                    if table is None:
+                        raise HTTPException(status_code=400, detail="No tables found in PDF")
+                    df = pd.DataFrame(table[1:], columns=table[0])
                 else:
                     raise HTTPException(
                         status_code=400,
@@ -7659,8 +8195,11 @@ async def upload_class_records(
 
                 file_hash = hashlib.sha256(contents).hexdigest()
 
-                # AI-powered column mapping
-                columns_text = ", ".join(df.columns.tolist())
+                # Headers with a well-known spelling are mapped directly; only the rest go to
+                # the AI mapper, which is skipped entirely when every column is recognized.
+                exact_mapping = _exact_column_mapping(df.columns.tolist())
+                unresolved_columns = [col for col in df.columns.tolist() if col not in exact_mapping]
+                columns_text = ", ".join(unresolved_columns)
 
                 prompt = f"""I have a spreadsheet with these columns: {columns_text}
 
@@ -7674,25 +8213,28 @@ Map each column to one of these standard fields (respond as JSON only):
 
 If a column doesn't match any field, skip it. Respond ONLY with a JSON object mapping original column names to field names. Example: {{\"Student Name\": \"name\", \"LRN\": \"lrn\"}}"""
 
-                mapping_text = ""
-                try:
-                    mapping_text = await call_hf_chat_async(
-                        messages=[{"role": "user", "content": prompt}],
-                        max_tokens=300,
-                        temperature=0.1,
-                    )
-                    json_start = mapping_text.find("{")
-                    json_end = mapping_text.rfind("}") + 1
-                    if json_start >= 0 and json_end > json_start:
-                        ai_mapping = _sanitize_column_mapping(json.loads(mapping_text[json_start:json_end]))
-                        file_column_mapping = dict(ai_mapping)
-                        file_column_mapping_source = {col: "ai" for col in ai_mapping.keys()}
-                    else:
-                        file_column_mapping = {}
-                        file_warnings.append("AI mapper returned no JSON; fallback mapper was used.")
-                except Exception:
-                    file_column_mapping = {}
-                    file_warnings.append("AI mapper failed; fallback mapper was used.")
+                file_column_mapping = dict(exact_mapping)
+                file_column_mapping_source = {col: "fallback" for col in exact_mapping}
+                if unresolved_columns:
+                    mapping_text = ""
+                    try:
+                        mapping_text = await call_hf_chat_async(
+                            messages=[{"role": "user", "content": prompt}],
+                            max_tokens=300,
+                            temperature=0.1,
+                        )
+                        json_start = mapping_text.find("{")
+                        json_end = mapping_text.rfind("}") + 1
+                        if json_start >= 0 and json_end > json_start:
+                            ai_mapping = _sanitize_column_mapping(json.loads(mapping_text[json_start:json_end]))
+                            for col, field in ai_mapping.items():
+                                if col not in file_column_mapping:
+                                    file_column_mapping[col] = field
+                                    file_column_mapping_source[col] = "ai"
+                        else:
+                            file_warnings.append("AI mapper returned no JSON; fallback mapper was used.")
+                    except Exception:
+                        file_warnings.append("AI mapper failed; fallback mapper was used.")
 
                 fallback_mapping = _fallback_column_mapping(df.columns.tolist())
                 for col, field in fallback_mapping.items():
@@ -8401,8 +8943,6 @@ async def upload_course_materials(
                 file_hash = hashlib.sha256(contents).hexdigest()
 
                 if ext == ".pdf":
-                    import pdfplumber
-
                     with pdfplumber.open(io.BytesIO(contents)) as pdf:
                         if len(pdf.pages) > UPLOAD_MAX_PDF_PAGES:
                             raise HTTPException(
@@ -11788,11 +12328,13 @@ async def get_hf_monitoring(http_request: Request):
     try:
         client = get_deepseek_client()
         latency_start = time.time()
-        probe_response = client.chat.completions.create(
-            model=str(CHAT_MODEL),
-            messages=[{"role": "user", "content": "Hi"}],
-            max_tokens=1,
-            temperature=0.0,
+        await _run_hf_blocking(
+            lambda: client.chat.completions.create(
+                model=str(CHAT_MODEL),
+                messages=[{"role": "user", "content": "Hi"}],
+                max_tokens=1,
+                temperature=0.0,
+            )
         )
         latency_ms = int((time.time() - latency_start) * 1000)
         result["avgResponseTimeMs"] = latency_ms
@@ -12259,7 +12801,7 @@ async def refresh_analytics_cache():
     Use when student data has been updated and fresh analysis is needed.
     """
     try:
-        result = refresh_all_caches()
+        result = await refresh_all_caches()
         logger.info("Analytics caches refreshed")
         return result
     except Exception as e:
@@ -12615,7 +13157,7 @@ async def get_analytics_config():
         "competencyThresholds": COMPETENCY_THRESHOLDS,
         "minQuizAttemptsForCompetency": MIN_QUIZ_ATTEMPTS_FOR_COMPETENCY,
         "cacheTTLSeconds": 3600,
-        "topicPrerequisites": fetch_topic_dependencies(),
+        "topicPrerequisites": dict(fetch_topic_dependencies()),
     }
 
 
@@ -13171,6 +13713,50 @@ async def automation_diagnostic_completed(payload: DiagnosticCompletionPayload):
         raise HTTPException(status_code=500, detail=f"Automation error: {str(e)}")
 
 
+@app.post("/api/automation/diagnostic-completed/stream")
+@_limit_llm_inflight_stream
+async def automation_diagnostic_completed_stream(payload: DiagnosticCompletionPayload):
+    """
+    Server-sent-events variant of /api/automation/diagnostic-completed.
+    Emits ``chunk`` events ({"field": "learningPath" | "interventions", "chunk": ...})
+    while the AI text is generated, then one ``result`` event with the AutomationResult.
+    """
+    logger.info(f"Automation trigger: diagnostic_completed (stream) for {payload.studentId}")
+    events: "asyncio.Queue[Optional[Tuple[str, str]]]" = asyncio.Queue()
+
+    async def on_chunk(field: str, delta: str) -> None:
+        await events.put(("chunk", json.dumps({"field": field, "chunk": delta}, ensure_ascii=False)))
+
+    async def run_pipeline() -> None:
+        try:
+            result = await automation_engine.handle_diagnostic_completion(payload, on_chunk=on_chunk)
+            await events.put(("result", result.model_dump_json()))
+        except Exception as e:
+            logger.error(f"Automation diagnostic stream error: {e}\n{traceback.format_exc()}")
+            await events.put(("error", json.dumps({"detail": f"Automation error: {str(e)}"})))
+        finally:
+            await events.put(None)
+
+    async def event_generator():
+        pipeline = asyncio.create_task(run_pipeline())
+        try:
+            while (item := await events.get()) is not None:
+                yield _sse_event(*item)
+        finally:
+            if not pipeline.done():
+                pipeline.cancel()
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @app.post("/api/automation/quiz-submitted", response_model=AutomationResult)
 async def automation_quiz_submitted(payload: QuizSubmissionPayload):
     """
@@ -13201,12 +13787,30 @@ async def automation_student_enrolled(payload: StudentEnrollmentPayload):
         raise HTTPException(status_code=500, detail=f"Automation error: {str(e)}")
 
 
-@app.post("/api/automation/data-imported", response_model=AutomationResult)
-async def automation_data_imported(payload: DataImportPayload):
+@app.post(
+    "/api/automation/data-imported",
+    response_model=AutomationResult,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": DataImportPayload.model_json_schema()}},
+        }
+    },
+)
+async def automation_data_imported(request: Request):
     """
     Trigger automation after a teacher uploads external data.
     Recalculates risk for all affected students and flags status changes.
     """
+    # Import bodies carry every student row; parse and validate them in one pass with
+    # pydantic-core's JSON parser instead of json.loads followed by model validation.
+    try:
+        payload = DataImportPayload.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        )
+
     try:
         logger.info(f"Automation trigger: data_imported by teacher {payload.teacherId}")
         result = await automation_engine.handle_data_import(payload)
@@ -14369,7 +14973,7 @@ Return as JSON with fields: topic, sections (array of title/content), suggested_
             top_p=0.9,
             enable_thinking=True,
         )
-        response_text = get_inference_client().generate_from_messages(req)
+        response_text = await _run_hf_blocking(get_inference_client().generate_from_messages, req)
 
         # Parse JSON response
         try:
@@ -1,7 +1,13 @@
 import os
-from openai import OpenAI, APIError, RateLimitError, APITimeoutError
+from openai import OpenAI, APIError, RateLimitError, APITimeoutError, DefaultHttpxClient
 from functools import lru_cache
 
+# openai builds its client on httpx2 in recent releases and on httpx before that
+try:
+    from httpx2 import Limits
+except ImportError:
+    from httpx import Limits  # type: ignore[assignment]
+
 __all__ = [
     "get_deepseek_client",
     "CHAT_MODEL",
@@ -15,6 +21,12 @@ __all__ = [
 DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 CHAT_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
 REASONER_MODEL = os.getenv("DEEPSEEK_REASONER_MODEL", "deepseek-reasoner")
+# The SDK's HTTP pool drops idle connections after 5s by default, so a request arriving after
+# a short lull pays a fresh TCP + TLS handshake; keep pooled connections around for longer.
+DEEPSEEK_KEEPALIVE_EXPIRY_SEC = float(os.getenv("DEEPSEEK_KEEPALIVE_EXPIRY_SEC", "60"))
+# Pool sizes match the SDK defaults
+DEEPSEEK_MAX_CONNECTIONS = int(os.getenv("DEEPSEEK_MAX_CONNECTIONS", "1000"))
+DEEPSEEK_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("DEEPSEEK_MAX_KEEPALIVE_CONNECTIONS", "100"))
 
 
 @lru_cache(maxsize=1)
@@ -25,4 +37,11 @@ def get_deepseek_client() -> OpenAI:
     return OpenAI(
         api_key=api_key,
         base_url=DEEPSEEK_BASE_URL,
+        http_client=DefaultHttpxClient(
+            limits=Limits(
+                max_connections=DEEPSEEK_MAX_CONNECTIONS,
+                max_keepalive_connections=DEEPSEEK_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=DEEPSEEK_KEEPALIVE_EXPIRY_SEC,
+            ),
+        ),
     )
@@ -16,6 +16,9 @@ import os
 
 import pytest
 
+# Fully validate analytics responses that production builds with model_construct
+os.environ.setdefault("ANALYTICS_VALIDATE_RESPONSES", "1")
+
 # ─── Firebase Auth Mock ────────────────────────────────────────────────────────
 # Intercept firebase_admin.auth.verify_id_token so that test tokens like
 # "Bearer mock_token_<uid>" work without real Firebase credentials.
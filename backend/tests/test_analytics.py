@@ -0,0 +1,650 @@
+# backend/tests/test_analytics.py
+"""Tests for analytics.py IRT and statistical helpers."""
+import asyncio
+import sys
+import os
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import _calculate_learning_velocity, _estimate_theta
+
+
+class TestEstimateTheta:
+    """Tests for the 3PL maximum-likelihood ability estimate."""
+
+    def test_empty_responses_return_zero(self):
+        assert _estimate_theta([], {}) == 0.0
+
+    def test_more_correct_answers_raise_theta(self):
+        params = {f"q{i}": {"a": 1.0, "b": 0.0, "c": 0.25} for i in range(6)}
+        strong = [{"questionId": f"q{i}", "correct": i != 0} for i in range(6)]
+        weak = [{"questionId": f"q{i}", "correct": i == 0} for i in range(6)]
+        assert _estimate_theta(strong, params) > _estimate_theta(weak, params)
+
+    def test_estimate_stays_within_bounds(self):
+        responses = [{"questionId": "q1", "correct": True}] * 10
+        theta = _estimate_theta(responses, {})
+        assert -4.0 <= theta <= 4.0
+        assert theta > 3.0
+
+    def test_newton_matches_bounded_brent(self):
+        import numpy as np
+        from scipy.optimize import minimize_scalar
+        from scipy.special import expit
+
+        params = {
+            "q0": {"a": 1.2, "b": -1.0, "c": 0.2},
+            "q1": {"a": 0.8, "b": 0.5, "c": 0.25},
+            "q2": {"a": 1.5, "b": 1.0, "c": 0.25},
+            "q3": {"a": 1.0, "b": 0.0, "c": 0.25},
+        }
+        responses = [
+            {"questionId": "q0", "correct": True},
+            {"questionId": "q1", "correct": True},
+            {"questionId": "q2", "correct": False},
+            {"questionId": "q3", "correct": True},
+            {"questionId": "q2", "correct": False},
+        ]
+        a = np.array([params[r["questionId"]]["a"] for r in responses])
+        b = np.array([params[r["questionId"]]["b"] for r in responses])
+        c = np.array([params[r["questionId"]]["c"] for r in responses])
+        y = np.array([r["correct"] for r in responses])
+
+        def nll(theta):
+            p = c + (1 - c) * expit(a * (theta - b))
+            return -float(np.where(y, np.log(p), np.log1p(-p)).sum())
+
+        brent = minimize_scalar(nll, bounds=(-4, 4), method="bounded").x
+        assert abs(_estimate_theta(responses, params) - brent) < 1e-2
+
+
+    def test_compiled_kernels_match_numpy_path(self, monkeypatch):
+        import numpy as np
+        import analytics
+
+        if analytics._theta_newton_kernel is None:
+            pytest.skip("neither _irt_kernels_aot nor numba available")
+
+        rng = np.random.default_rng(7)
+        for _ in range(50):
+            n = int(rng.integers(1, 30))
+            arrays = (rng.uniform(0.5, 2, n), rng.uniform(-2, 2, n), rng.uniform(0.1, 0.3, n), rng.random(n) < 0.6)
+            compiled = analytics._estimate_theta_arrays(*arrays)
+            with monkeypatch.context() as m:
+                m.setattr(analytics, "_theta_newton_kernel", None)
+                m.setattr(analytics, "_theta_nll_kernel", None)
+                assert abs(analytics._estimate_theta_arrays(*arrays) - compiled) < 1e-3
+
+    def test_aot_extension_serves_array_probabilities(self):
+        import numpy as np
+        import analytics
+
+        if not analytics.HAS_IRT_AOT:
+            pytest.skip("_irt_kernels_aot not built")
+        assert analytics._irt_3pl_array is analytics._irt_kernels_aot.irt_3pl_probs
+        b = np.linspace(-2, 2, 9)
+        np.testing.assert_allclose(
+            analytics._irt_3pl_array(0.4, np.ones_like(b), b, np.full_like(b, 0.25)),
+            [analytics._irt_3pl_probability(0.4, 1.0, v, 0.25) for v in b],
+        )
+
+    def test_plain_python_kernels_match_numpy_path(self):
+        import numpy as np
+        import _irt_kernels
+        import analytics
+
+        a, b, c = np.array([1.2, 0.8, 1.5]), np.array([-1.0, 0.5, 1.0]), np.full(3, 0.25)
+        y = np.array([True, True, False])
+        np.testing.assert_allclose(_irt_kernels.irt_3pl_probs(0.3, a, b, c), analytics._irt_3pl_array(0.3, a, b, c))
+        low, high = analytics.THETA_BOUNDS
+        theta = _irt_kernels.theta_newton(a, b, c, y, low, high, analytics.THETA_NEWTON_MAX_ITER, analytics.THETA_NEWTON_TOL)
+        assert abs(theta - analytics._estimate_theta_arrays(a, b, c, y)) < 1e-3
+
+
+class TestAdaptiveQuizSelection:
+    def test_predictions_follow_3pl_curve(self):
+        import asyncio
+        from unittest.mock import AsyncMock, patch
+        from analytics import AdaptiveQuizRequest, _irt_3pl_probability, select_adaptive_quiz
+
+        request = AdaptiveQuizRequest(studentId="s1", topicId="Algebra", numQuestions=6)
+        with patch("analytics.fetch_student_quiz_history", AsyncMock(return_value=[])):
+            result = asyncio.run(select_adaptive_quiz(request))
+        assert len(result.selectedQuestions) == 6
+        for q in result.selectedQuestions:
+            expected = _irt_3pl_probability(0.0, 1.0, q.estimatedDifficulty, 0.25)
+            assert abs(q.predictedSuccessProbability - expected) < 1e-3
+
+
+class _FakeDoc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class _FakeQuery:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def where(self, *args, **kwargs):
+        return self
+
+    order_by = select = limit = where
+
+    def stream(self):
+        return iter(self._docs)
+
+
+class _FakeDb:
+    def __init__(self, collections):
+        self._collections = collections
+
+    def collection(self, name):
+        return _FakeQuery(self._collections.get(name, []))
+
+
+class TestFetchQuizHistory:
+    def test_merges_both_collections(self, monkeypatch):
+        import asyncio
+        import analytics
+
+        db = _FakeDb({
+            "progress": [_FakeDoc("p1", {"topic": "Algebra", "score": 7}), _FakeDoc("p2", {})],
+            "quizAttempts": [_FakeDoc("q1", {"topic": "Geometry", "score": 5})],
+        })
+        monkeypatch.setattr(analytics, "_get_firestore_db", lambda: db)
+        history = asyncio.run(analytics.fetch_student_quiz_history("s1"))
+        assert [h["id"] for h in history] == ["p1", "q1"]
+        assert history[1]["source"] == "quizAttempts"
+        assert "source" not in history[0]
+
+
+class TestFetchEngagementMetrics:
+    def test_counts_activity_per_day_and_hour(self, monkeypatch):
+        import asyncio
+        from datetime import datetime
+        import analytics
+
+        db = _FakeDb({"xpActivities": [
+            _FakeDoc("x1", {"xpAmount": 10, "timestamp": datetime(2025, 9, 1, 8)}),
+            _FakeDoc("x2", {"xpAmount": 5, "timestamp": datetime(2025, 9, 1, 20)}),
+            _FakeDoc("x3", {"xpAmount": 7, "timestamp": datetime(2025, 9, 2, 8)}),
+            _FakeDoc("x4", {"xpAmount": 3}),
+        ]})
+        monkeypatch.setattr(analytics, "_get_firestore_db", lambda: db)
+        metrics = asyncio.run(analytics.fetch_student_engagement_metrics("s1"))
+        assert metrics["totalXP"] == 25
+        assert metrics["activityCount"] == 4
+        assert metrics["dailyActivity"] == {"2025-09-01": 2, "2025-09-02": 1}
+        assert metrics["hourlyActivity"] == {8: 2, 20: 1}
+        assert metrics["avgActivitiesPerDay"] == 2.0
+
+
+class TestStudentSummary:
+    def test_predicted_score_extrapolates_recent_trend(self, monkeypatch):
+        import asyncio
+        import analytics
+
+        history = [
+            {"topic": "Algebra", "score": s, "total": 10, "completedAt": f"2025-09-0{i + 1}T00:00:00Z"}
+            for i, s in enumerate([4, 5, 6, 7])
+        ]
+        fetches = []
+
+        async def fake_history(sid):
+            fetches.append(sid)
+            return history
+
+        async def fake_engagement(_sid):
+            return {"dailyActivity": {}, "hourlyActivity": {}}
+
+        monkeypatch.setattr(analytics, "fetch_student_quiz_history", fake_history)
+        monkeypatch.setattr(analytics, "fetch_student_engagement_metrics", fake_engagement)
+        monkeypatch.setattr(analytics, "_get_firestore_db", lambda: None)
+        analytics._competency_cache.clear()
+        try:
+            summary = asyncio.run(analytics.get_student_summary("s-trend"))
+        finally:
+            analytics._competency_cache.clear()
+        assert summary.predictedNextQuizScore == 80.0
+        assert summary.recommendedTopics
+        assert fetches == ["s-trend"]  # recommendations reuse the summary's quiz history
+
+
+def _run_class_insights(monkeypatch, teacher_id):
+    import asyncio
+    import analytics
+
+    db = _FakeDb({"users": [_FakeDoc(f"s{i}", {"role": "student"}) for i in range(5)]})
+
+    async def fake_summary(sid):
+        if sid == "s4":
+            raise RuntimeError("boom")
+        return analytics.StudentSummaryResponse(
+            studentId=sid,
+            competencyDistribution={"beginner": 2 if sid == "s0" else 0},
+            riskAssessment={"riskLevel": "High" if sid == "s0" else "Low"},
+            recommendedTopics=[],
+            learningVelocityTrend=[{"topic": "Algebra", "velocity": -0.5}],
+            efficiencyScores={},
+            engagementPatterns={"hourlyActivity": {"9": 1}},
+            status="success",
+        )
+
+    monkeypatch.setattr(analytics, "_get_firestore_db", lambda: db)
+    monkeypatch.setattr(analytics, "get_student_summary", fake_summary)
+    analytics._class_stats_cache.clear()
+    try:
+        return asyncio.run(analytics.get_class_insights(analytics.ClassInsightsRequest(teacherId=teacher_id)))
+    finally:
+        analytics._class_stats_cache.clear()
+
+
+class TestClassInsights:
+    def test_aggregates_concurrent_summaries(self, monkeypatch):
+        result = _run_class_insights(monkeypatch, "t-gather")
+        assert result.riskDistribution == {"High": 1, "Medium": 0, "Low": 3}
+        assert result.commonWeakTopics[0]["studentsStruggling"] == 4
+        assert result.engagementPatterns == {"hourlyDistribution": {9: 4}}
+        assert [i["studentId"] for i in result.interventionRecommendations] == ["s0"]
+
+    def test_unvalidated_response_serializes_like_validated(self, monkeypatch):
+        import analytics
+
+        monkeypatch.setattr(analytics, "ANALYTICS_VALIDATE_RESPONSES", True)
+        validated = _run_class_insights(monkeypatch, "t-validated")
+        monkeypatch.setattr(analytics, "ANALYTICS_VALIDATE_RESPONSES", False)
+        constructed = _run_class_insights(monkeypatch, "t-validated")
+        assert constructed.model_dump_json() == validated.model_dump_json()
+
+
+class TestClassifyStudents:
+    def test_loop_kernel_matches_numpy(self):
+        import numpy as np
+        import analytics
+
+        rng = np.random.default_rng(0)
+        velocities = rng.choice([-0.5, -0.01, 0.0, 0.01, 0.02, 0.3], size=40).astype(np.float32)
+        predicted = rng.choice([0.0, 30.0, 49.9, 50.0, 80.0], size=25)
+        beginner = rng.integers(0, 4, size=25)
+
+        improving, declining = int((velocities > 0.01).sum()), int((velocities < -0.01).sum())
+        help_idx = [i for i in range(25) if beginner[i] >= 2 or (predicted[i] and predicted[i] < 50)]
+
+        # Whichever implementation is active (numba or NumPy), plus the plain-python loop
+        for kernel in (analytics._classify_students, analytics._classify_students_loop):
+            got = kernel(velocities, predicted, beginner)
+            assert got[:3] == (improving, declining, len(velocities) - improving - declining)
+            assert list(got[3]) == help_idx
+
+
+class TestLearningVelocity:
+    def test_single_point_has_no_velocity(self):
+        assert _calculate_learning_velocity([(20000.0, 50.0)]) == 0.0
+
+    def test_linear_improvement_recovers_slope(self):
+        points = [(20000.0 + d, 40.0 + 2.0 * d) for d in range(10)]
+        assert _calculate_learning_velocity(points) == 2.0
+
+    def test_same_day_attempts_are_flat(self):
+        assert _calculate_learning_velocity([(20000.0, 30.0), (20000.0, 90.0)]) == 0.0
+
+
+class TestCompetencyLevel:
+    def test_lookup_matches_threshold_walk(self):
+        from analytics import _classify_competency, _get_competency_level
+
+        for score in [-5, 0, 39.99, 40, 64.5, 65, 84.999, 85, 99.5, 100, 120, float("nan")]:
+            assert _get_competency_level(score) == _classify_competency(score)
+
+
+class TestTopicPrerequisites:
+    def test_matrix_matches_graph(self):
+        from analytics import TOPIC_PREREQUISITES, _PREREQ_BITS, _PREREQ_TOPIC_INDEX, _PREREQ_TOPICS
+
+        for topic, prereqs in TOPIC_PREREQUISITES.items():
+            row = _PREREQ_BITS[_PREREQ_TOPIC_INDEX[topic]]
+            assert sorted(_PREREQ_TOPICS[i] for i in row.nonzero()[0]) == sorted(prereqs)
+
+    def test_dependencies_are_read_only(self):
+        import pytest
+        from analytics import fetch_topic_dependencies
+
+        deps = fetch_topic_dependencies()
+        assert deps["Derivatives"] == ("Limits", "Functions")
+        with pytest.raises(TypeError):
+            deps["Derivatives"] = ()
+
+
+class TestCompetencyAnalysis:
+    HISTORY = [
+        {"topic": "Algebra", "score": 9, "total": 10, "attempts": 1, "timeTaken": 200, "completedAt": "2025-09-01T00:00:00Z"},
+        {"topic": "Algebra", "score": 8, "total": 10, "attempts": 1, "timeTaken": 250, "completedAt": "2025-09-03T00:00:00Z"},
+        {"topic": "Geometry", "score": 3, "total": 10, "attempts": 2, "timeTaken": 500, "completedAt": "2025-09-02T00:00:00Z"},
+        {"topic": "Geometry", "score": 6, "total": 10, "attempts": 1, "timeTaken": 400},
+    ]
+
+    def _run(self, history, topic_filter=None):
+        import asyncio
+        from analytics import compute_competency_analysis
+
+        return asyncio.run(compute_competency_analysis("s1", history, topic_filter))
+
+    def test_insufficient_history(self):
+        assert self._run(self.HISTORY[:2]).status == "insufficient_data"
+
+    def test_per_topic_stats(self):
+        result = self._run(self.HISTORY)
+        assert result.status == "success"
+        by_topic = {a.topicId: a for a in result.analyses}
+        assert by_topic["Algebra"].averageAccuracy == 100.0
+        assert by_topic["Algebra"].lastAttemptDate == "2025-09-03T00:00:00"
+        assert by_topic["Geometry"].totalAttempts == 2
+        assert by_topic["Geometry"].averageAccuracy == 50.0
+        assert by_topic["Geometry"].masteryPercentage == 50.0
+        assert result.analyses[0].topicId == "Geometry"
+
+    def test_topic_filter(self):
+        result = self._run(self.HISTORY, topic_filter="Geometry")
+        assert [a.topicId for a in result.analyses] == ["Geometry"]
+
+    def test_repeat_call_is_served_from_cache(self):
+        first = self._run(self.HISTORY)
+        assert self._run(self.HISTORY) is first
+        assert self._run(self.HISTORY + [dict(self.HISTORY[0], completedAt="2025-09-05T00:00:00Z")]) is not first
+
+
+class TestDaysSinceAttempt:
+    def test_batch_parse_matches_per_topic_days(self):
+        from datetime import datetime, timedelta
+        from analytics import CompetencyAnalysis, _days_since_attempt
+
+        def analysis(topic, last):
+            return CompetencyAnalysis(
+                topicId=topic, topicName=topic, efficiencyScore=50, competencyLevel="developing",
+                masteryPercentage=50, learningVelocity=0, totalAttempts=3, averageAccuracy=50,
+                lastAttemptDate=last,
+            )
+
+        recent = (datetime.utcnow() - timedelta(days=3, hours=2)).isoformat()
+        days = _days_since_attempt([
+            analysis("Fractions", recent),
+            analysis("Integers", "2020-01-01T00:00:00Z"),
+            analysis("Ratios", "not a date"),
+            analysis("Angles", None),
+        ])
+        expected_old = (datetime.utcnow() - datetime(2020, 1, 1)).days
+        assert days["Fractions"] == 3
+        assert days["Integers"] == expected_old
+        assert "Ratios" not in days and "Angles" not in days
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.store = {}
+        self.expiry = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+        self.expiry[key] = ex
+
+    async def ttl(self, key):
+        return self.expiry.get(key, -2)
+
+    async def scan_iter(self, match="*", count=None):
+        prefix = match.rstrip("*")
+        for k in list(self.store):
+            if k.startswith(prefix):
+                yield k
+
+    async def delete(self, *keys):
+        return sum(self.store.pop(k, None) is not None for k in keys)
+
+
+class TestSharedCache:
+    def test_workers_share_results_through_redis(self, monkeypatch):
+        import analytics
+
+        fake = _FakeRedis()
+        monkeypatch.setattr(analytics, "_redis_client", lambda: fake)
+        try:
+            asyncio.run(analytics._cache_set(analytics._competency_cache, "summary_s1", {"score": 1}))
+            assert fake.store == {"mathpulse:analytics:competency:summary_s1": '{"score": 1}'}
+            assert fake.expiry == {"mathpulse:analytics:competency:summary_s1": analytics.IRT_DIFFICULTY_CACHE_TTL}
+
+            # Another worker starts with an empty local cache
+            analytics._competency_cache.clear()
+            assert asyncio.run(analytics._cache_get(analytics._competency_cache, "summary_s1", 60)) == {"score": 1}
+            assert "summary_s1" in analytics._competency_cache
+
+            asyncio.run(analytics.refresh_all_caches())
+            assert fake.store == {}
+            assert asyncio.run(analytics._cache_get(analytics._competency_cache, "summary_s1", 60)) is None
+        finally:
+            analytics._competency_cache.clear()
+
+    def test_redis_hit_rebuilds_model_and_keeps_remaining_ttl(self, monkeypatch):
+        import analytics
+
+        fake = _FakeRedis()
+        monkeypatch.setattr(analytics, "_redis_client", lambda: fake)
+        response = analytics.RefreshCacheResponse(status="ok", cachedItems=3, timestamp="t")
+        try:
+            asyncio.run(analytics._cache_set(analytics._class_stats_cache, "class_t_c", response))
+            analytics._class_stats_cache.clear()
+            # Shared entry is 10s from expiry
+            fake.expiry["mathpulse:analytics:class_stats:class_t_c"] = 10
+
+            cached = asyncio.run(analytics._cache_get(
+                analytics._class_stats_cache, "class_t_c", analytics.IRT_DIFFICULTY_CACHE_TTL,
+                analytics.RefreshCacheResponse,
+            ))
+            assert cached == response
+            stored_at, _ = analytics._class_stats_cache["class_t_c"]
+            assert analytics.IRT_DIFFICULTY_CACHE_TTL - 11 <= time.time() - stored_at <= analytics.IRT_DIFFICULTY_CACHE_TTL - 9
+        finally:
+            analytics._class_stats_cache.clear()
+
+    def test_local_cache_evicts_oldest(self, monkeypatch):
+        import analytics
+
+        monkeypatch.setattr(analytics, "ANALYTICS_CACHE_MAX_ENTRIES", 2)
+        try:
+            for key in ("a", "b", "a", "c"):
+                asyncio.run(analytics._cache_set(analytics._difficulty_cache, key, key))
+            assert list(analytics._difficulty_cache) == ["a", "c"]
+        finally:
+            analytics._difficulty_cache.clear()
+
+
+class TestRuleBasedRiskBatch:
+    def test_batch_matches_scalar_rules(self):
+        from analytics import EnhancedRiskRequest, _rule_based_risk, _rule_based_risk_batch
+
+        requests = [
+            EnhancedRiskRequest(studentId="a", engagementScore=90, avgQuizScore=85, attendance=95, assignmentCompletion=90),
+            EnhancedRiskRequest(studentId="b", engagementScore=60, avgQuizScore=55, attendance=70, assignmentCompletion=50,
+                                engagementTrend7d=2.0),
+            EnhancedRiskRequest(studentId="c", engagementScore=30, avgQuizScore=40, attendance=50, assignmentCompletion=20,
+                                consecutiveAbsences=4, daysSinceLastActivity=10),
+            EnhancedRiskRequest(studentId="d", engagementScore=75, avgQuizScore=70, attendance=75, assignmentCompletion=70,
+                                daysSinceLastActivity=7),
+        ]
+        _, levels, probs = _rule_based_risk_batch(
+            [r.engagementScore for r in requests],
+            [r.avgQuizScore for r in requests],
+            [r.attendance for r in requests],
+            [r.assignmentCompletion for r in requests],
+            [r.consecutiveAbsences or 0 for r in requests],
+            [r.daysSinceLastActivity or 0 for r in requests],
+            [r.engagementTrend7d or 0 for r in requests],
+        )
+        for req, level, row in zip(requests, levels, probs):
+            scalar = _rule_based_risk(req)
+            assert scalar.riskLevel == level
+            assert [scalar.probabilities[k] for k in ("High", "Medium", "Low")] == row.tolist()
+
+
+class TestRiskFeatures:
+    def test_each_call_returns_its_own_row(self):
+        import numpy as np
+        from analytics import EnhancedRiskRequest, _build_risk_features
+
+        first = _build_risk_features(EnhancedRiskRequest(
+            studentId="a", engagementScore=90, avgQuizScore=85, attendance=95, assignmentCompletion=90))
+        second = _build_risk_features(EnhancedRiskRequest(
+            studentId="b", engagementScore=30, avgQuizScore=40, attendance=50, assignmentCompletion=20))
+        assert first.dtype == np.float32 and first.shape == (1, 11)
+        assert first[0, 0] == 90 and second[0, 0] == 30
+
+
+class TestTopKIndices:
+    def test_matches_stable_descending_sort(self):
+        import numpy as np
+        from analytics import _top_k_indices
+
+        values = np.array([3.0, 0.0, 1.0, 4.0, 2.0, 0.0, 3.0, 3.0, 4.0])
+        assert _top_k_indices(values, 3).tolist() == [3, 8, 0]
+        assert _top_k_indices(np.array([0.5]), 3).tolist() == [0]
+
+
+class TestSyntheticRiskData:
+    def test_shape_bounds_and_determinism(self):
+        import numpy as np
+        from analytics import RISK_FEATURE_NAMES, _generate_synthetic_risk_data
+
+        X, y = _generate_synthetic_risk_data(300)
+        assert X.shape == (300, len(RISK_FEATURE_NAMES))
+        assert set(np.unique(y)) <= {0, 1, 2}
+        assert X[:, :4].min() >= 0 and X[:, :4].max() <= 100
+        assert (X[:, 9:] >= 0).all() and (X[:, 9:] == np.trunc(X[:, 9:])).all()
+        assert (X[y == 2, 9] == 0).all()  # low-risk students have no absences
+        np.testing.assert_array_equal(_generate_synthetic_risk_data(300)[0], X)
+
+
+class TestMockStudentData:
+    def test_seeded_generation_is_reproducible_and_bounded(self):
+        from analytics import generate_mock_student_data
+
+        data = generate_mock_student_data(num_students=40, num_quizzes=12, seed=5)
+        again = generate_mock_student_data(num_students=40, num_quizzes=12, seed=5)
+        assert data["students"] == again["students"]
+        assert data["quizHistory"] == again["quizHistory"]
+
+        assert len(data["students"]) == 40 and len(data["quizHistory"]) == 40 * 12
+        assert sum(data["metadata"]["archetypeDistribution"].values()) == 40
+        for s in data["students"]:
+            assert 0 <= s["avgQuizScore"] <= 100 and s["streak"] >= 0
+        for q in data["quizHistory"]:
+            assert 0 <= q.score <= q.total and q.attempts in (1, 2, 3)
+
+        from fastapi.encoders import jsonable_encoder
+        assert jsonable_encoder(data["quizHistory"][0])["questionId"] == data["quizHistory"][0].questionId
+
+    def test_frame_matches_records(self):
+        from dataclasses import asdict
+        from analytics import generate_mock_student_data
+
+        records = generate_mock_student_data(num_students=6, num_quizzes=4, seed=9)["quizHistory"]
+        frame = generate_mock_student_data(num_students=6, num_quizzes=4, seed=9, as_frame=True)["quizHistory"]
+        assert frame.to_dict("records") == [asdict(q) for q in records]
+
+    def test_base_score_array_matches_scalar_kernel(self):
+        import numpy as np
+        import analytics
+
+        archetypes = np.repeat(np.arange(len(analytics._MOCK_ARCHETYPES)), 2)
+        quiz_idx = np.arange(9)
+        expected = [[analytics._mock_base_score(a, j, 9) for j in quiz_idx] for a in archetypes]
+        np.testing.assert_allclose(
+            analytics._mock_base_score_array(archetypes[:, None], quiz_idx[None, :], 9), expected,
+        )
+
+
+class TestTrainRiskModel:
+    def test_firestore_rows_fill_feature_matrix(self, tmp_path, monkeypatch):
+        import asyncio
+        import analytics
+
+        if not analytics.HAS_JOBLIB:
+            pytest.skip("joblib not installed")
+
+        levels = ["High", "Medium", "Low", ""]
+        users = [
+            _FakeDoc(f"u{i}", {
+                "engagementScore": 20 + i % 60, "avgQuizScore": 30 + i % 50, "attendance": 60 + i % 40,
+                "assignmentCompletion": 40 + i % 50, "riskLevel": levels[i % 4],
+            })
+            for i in range(80)
+        ]
+        monkeypatch.setattr(analytics, "RISK_MODEL_PATH", str(tmp_path / "risk.joblib"))
+        monkeypatch.setattr(analytics, "RISK_ONNX_MODEL_PATH", str(tmp_path / "risk.onnx"))
+        monkeypatch.setattr(analytics, "_get_firestore_db", lambda: _FakeDb({"users": users}))
+        monkeypatch.setattr(analytics, "HAS_XGBOOST", False)
+        try:
+            result = asyncio.run(analytics.train_risk_model(force_retrain=True))
+        finally:
+            analytics._risk_model_cache.clear()
+            analytics._shap_explainer_cache.clear()
+        assert result.status == "trained"
+        assert result.samplesUsed == 80
+
+
+class TestRiskModelOnnx:
+    @pytest.mark.parametrize("use_xgboost", [False, True])
+    def test_trained_model_is_served_through_onnx_runtime(self, tmp_path, monkeypatch, use_xgboost):
+        import asyncio
+        import numpy as np
+        import analytics
+
+        if not (analytics.HAS_SKL2ONNX and analytics.HAS_ONNXRUNTIME and analytics.HAS_JOBLIB):
+            pytest.skip("skl2onnx / onnxruntime not installed")
+        if use_xgboost and not (analytics.HAS_XGBOOST and analytics.HAS_ONNXMLTOOLS):
+            pytest.skip("xgboost / onnxmltools not installed")
+
+        monkeypatch.setattr(analytics, "RISK_MODEL_PATH", str(tmp_path / "risk.joblib"))
+        monkeypatch.setattr(analytics, "RISK_ONNX_MODEL_PATH", str(tmp_path / "risk.onnx"))
+        monkeypatch.setattr(analytics, "_get_firestore_db", lambda: None)
+        monkeypatch.setattr(analytics, "HAS_XGBOOST", use_xgboost)
+        analytics._risk_model_cache.clear()
+        try:
+            asyncio.run(analytics.train_risk_model(force_retrain=True))
+            model = analytics._load_risk_model()
+            assert isinstance(model, analytics._OnnxRiskModel)
+
+            X, _ = analytics._generate_synthetic_risk_data(20)
+            expected = analytics.joblib.load(analytics.RISK_MODEL_PATH).predict_proba(X)
+            np.testing.assert_allclose(model.predict_proba(X), expected, atol=1e-4)
+            labels, proba = model.predict_with_proba(X)
+            np.testing.assert_array_equal(labels, model.predict(X))
+            np.testing.assert_array_equal(proba, model.predict_proba(X))
+
+            request = analytics.EnhancedRiskRequest(
+                studentId="s1", engagementScore=30, avgQuizScore=35, attendance=50, assignmentCompletion=30,
+            )
+            assert asyncio.run(analytics.predict_risk_enhanced(request)).modelUsed == "ml_model"
+
+            # Low predictions skip SHAP and report global feature importances
+            analytics._shap_explainer_cache.clear()
+            low_request = analytics.EnhancedRiskRequest(
+                studentId="s2", engagementScore=95, avgQuizScore=95, attendance=98, assignmentCompletion=95,
+            )
+            low = asyncio.run(analytics.predict_risk_enhanced(low_request))
+            assert low.riskLevel == "Low"
+            assert low.contributingFactors and all("importance" in f["detail"] for f in low.contributingFactors)
+            assert not analytics._shap_explainer_cache
+            if analytics.HAS_SHAP:
+                explainer = analytics._get_shap_explainer(model)
+                assert analytics._get_shap_explainer(model) is explainer
+        finally:
+            analytics._risk_model_cache.clear()
+            analytics._shap_explainer_cache.clear()
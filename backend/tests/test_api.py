@@ -82,6 +82,7 @@ mock_ae.StudentEnrollmentPayload = _StudentEnrollmentPayload
 mock_ae.DataImportPayload = _DataImportPayload
 mock_ae.ContentUpdatePayload = _ContentUpdatePayload
 mock_ae.AutomationResult = _AutomationResult
+_real_automation_engine = sys.modules.get("automation_engine")
 sys.modules["automation_engine"] = mock_ae
 
 # Override tokens so client init doesn't fail
@@ -91,6 +92,13 @@ os.environ["DEEPSEEK_API_KEY"] = "test-ds-key-for-testing"
 # analytics.py is importable directly (its heavy deps are guarded)
 import main as main_module  # noqa: E402
 
+# main has bound the mock now; put the real entry back so other test modules (and numba's
+# on-disk cache, which resolves kernels through sys.modules) still see automation_engine.
+if _real_automation_engine is None:
+    del sys.modules["automation_engine"]
+else:
+    sys.modules["automation_engine"] = _real_automation_engine
+
 app = main_module.app
 
 # Mock auth verification so protected endpoints can run in tests without Firebase credentials.
@@ -357,6 +365,17 @@ class TestChatEndpoint:
         assert "x = 2" in data
         assert "x = 3" in data
 
+    def test_chat_history_window_is_token_budgeted(self):
+        msg = main_module.ChatMessage
+        long_turns = [msg(role="user", content="x" * 2000) for _ in range(10)]
+        short_turns = [msg(role="assistant", content="ok") for _ in range(30)]
+
+        # 10 long turns no longer all fit; 30 one-word turns no longer get cut to 10
+        assert len(main_module._chat_history_window(long_turns)) == 2
+        assert main_module._chat_history_window(long_turns + short_turns)[-30:] == short_turns
+        # The newest turn is kept even when it alone is over budget
+        assert len(main_module._chat_history_window([msg(role="user", content="y" * 99999)])) == 1
+
     @patch("main.call_hf_chat_stream")
     def test_chat_stream_success(self, mock_stream):
         mock_stream.return_value = iter(["Hello", " world"])
@@ -625,10 +644,15 @@ class TestInferenceRouting:
 
 
 class TestRiskPrediction:
+    @pytest.fixture(autouse=True)
+    def _fresh_risk_output_cache(self, monkeypatch):
+        monkeypatch.setattr(main_module, "_risk_output_cache", main_module.OrderedDict())
+
     @patch("main.get_deepseek_client")
     def test_predict_risk_success(self, mock_ds_fn):
         mock_ds_fn.return_value = make_deepseek_risk_mock()
-        response = client.post("/api/predict-risk", json={
+        # explain=true sends even this clear-cut (rule score 82) student to the model
+        response = client.post("/api/predict-risk?explain=true", json={
             "engagementScore": 80,
             "avgQuizScore": 75,
             "attendance": 90,
@@ -636,8 +660,10 @@ class TestRiskPrediction:
         })
         assert response.status_code == 200
         data = response.json()
-        assert data["riskLevel"] in ("High", "Medium", "Low")
-        assert 0 <= data["confidence"] <= 1
+        assert data["riskLevel"] == "Low"
+        assert data["confidence"] == 0.85
+        assert "method" not in data["analysis"]
+        assert mock_ds_fn.return_value.chat.completions.create.call_count == 1
 
     def test_predict_risk_invalid_score_range(self):
         response = client.post("/api/predict-risk", json={
@@ -668,7 +694,7 @@ class TestRiskPrediction:
         mock_client = MagicMock()
         mock_client.chat.completions.create.side_effect = Exception("AI down")
         mock_ds_fn.return_value = mock_client
-        response = client.post("/api/predict-risk", json={
+        response = client.post("/api/predict-risk?explain=true", json={
             "engagementScore": 80,
             "avgQuizScore": 75,
             "attendance": 90,
@@ -688,6 +714,72 @@ class TestRiskPrediction:
         assert response.status_code == 200
         assert len(response.json()) == 2
 
+    @patch("main.get_deepseek_client")
+    def test_batch_risk_prediction_classifies_group_in_one_call(self, mock_ds_fn):
+        mock_ds = MagicMock()
+        mock_choice = MagicMock()
+        # Student 3 is missing from the grouped answer and falls back to a single-student call
+        mock_choice.message.content = json.dumps({
+            "students": [
+                {"student": 2, "risk_label": "high risk of failing", "confidence": 0.9},
+                {"student": 1, "risk_label": "low risk academically stable", "confidence": 0.8},
+            ]
+        })
+        single_choice = MagicMock()
+        single_choice.message.content = json.dumps({"risk_label": "medium academic risk", "confidence": 0.6})
+        mock_ds.chat.completions.create.side_effect = [
+            MagicMock(choices=[mock_choice]),
+            MagicMock(choices=[single_choice]),
+        ]
+        mock_ds_fn.return_value = mock_ds
+        response = client.post("/api/predict-risk/batch?explain=true", json={
+            "students": [
+                {"engagementScore": 80, "avgQuizScore": 75, "attendance": 90, "assignmentCompletion": 85},
+                {"engagementScore": 30, "avgQuizScore": 40, "attendance": 50, "assignmentCompletion": 35},
+                {"engagementScore": 60, "avgQuizScore": 58, "attendance": 70, "assignmentCompletion": 60},
+            ],
+        })
+        assert response.status_code == 200
+        assert [r["riskLevel"] for r in response.json()] == ["Low", "High", "Medium"]
+        assert mock_ds.chat.completions.create.call_count == 2
+
+    @patch("main.get_deepseek_client")
+    def test_repeated_summary_is_answered_from_cache(self, mock_ds_fn):
+        mock_ds_fn.return_value = make_deepseek_risk_mock(risk_label="high risk of failing", confidence=0.9)
+        first = client.post("/api/predict-risk?explain=true", json={
+            "engagementScore": 30, "avgQuizScore": 40, "attendance": 50, "assignmentCompletion": 35,
+        })
+        # Same whole-percent summary (attendance is not part of the prompt)
+        second = client.post("/api/predict-risk?explain=true", json={
+            "engagementScore": 30.2, "avgQuizScore": 40, "attendance": 95, "assignmentCompletion": 35,
+        })
+        assert first.headers["X-Cache"] == "MISS"
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.json()["riskLevel"] == "High"
+        assert mock_ds_fn.return_value.chat.completions.create.call_count == 1
+
+    @patch("main.get_deepseek_client")
+    def test_clear_cut_students_skip_the_model(self, mock_ds_fn):
+        mock_ds_fn.return_value = make_deepseek_risk_mock(risk_label="low risk academically stable", confidence=0.7)
+        response = client.post("/api/predict-risk/batch", json={
+            "students": [
+                {"engagementScore": 80, "avgQuizScore": 75, "attendance": 90, "assignmentCompletion": 85},
+                # Rule score 69.9, right at the Low/Medium cut-off, so the model decides
+                {"engagementScore": 70, "avgQuizScore": 68, "attendance": 72, "assignmentCompletion": 70},
+                {"engagementScore": 30, "avgQuizScore": 40, "attendance": 50, "assignmentCompletion": 35},
+            ],
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert [r["riskLevel"] for r in data] == ["Low", "Low", "High"]
+        assert data[0]["analysis"]["method"] == "rule"
+        assert "method" not in data[1]["analysis"]
+        # Only the contested student is sent: the grouped call, then the single-student
+        # fallback (the mock answers in the single-student shape)
+        calls = mock_ds_fn.return_value.chat.completions.create.call_args_list
+        assert len(calls) == 2
+        assert "summaries for 1 students" in calls[0].kwargs["messages"][1]["content"]
+
 
 # ─── Learning Path ────────────────────────────────────────────
 
@@ -724,6 +816,69 @@ class TestLearningPath:
         })
         assert response.status_code == 502
 
+    @patch("main.call_hf_chat")
+    def test_learning_path_rejected_when_llm_slots_are_full(self, mock_chat):
+        with patch("main._get_llm_inflight_semaphore", return_value=asyncio.Semaphore(0)):
+            response = client.post("/api/learning-path", json={
+                "weaknesses": ["algebra"],
+                "gradeLevel": "Grade 11",
+            })
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        mock_chat.assert_not_called()
+
+    @patch("main.ENABLE_RAG_ANALYSIS_CONTEXT", False)
+    @patch("main.call_hf_chat_stream")
+    def test_learning_path_stream_holds_llm_slot_until_done(self, mock_stream):
+        mock_stream.return_value = iter(["1. Review ", "slot tables"])
+        body = {"weaknesses": ["slot tables (stream test)"], "gradeLevel": "Grade 11"}
+
+        with patch("main._get_llm_inflight_semaphore", return_value=asyncio.Semaphore(0)):
+            busy = client.post("/api/learning-path/stream", json=body)
+        assert busy.status_code == 503
+        mock_stream.assert_not_called()
+
+        slots = asyncio.Semaphore(1)
+        with patch("main._get_llm_inflight_semaphore", return_value=slots):
+            with client.stream("POST", "/api/learning-path/stream", json=body) as response:
+                assert response.status_code == 200
+                content = "".join(response.iter_text())
+        assert "event: end" in content
+        assert not slots.locked()
+
+    @patch("main.ENABLE_RAG_ANALYSIS_CONTEXT", False)
+    @patch("main.call_hf_chat_stream")
+    def test_learning_path_stream_relays_chunks_and_fills_cache(self, mock_stream):
+        mock_stream.return_value = iter(["1. Review ", "ratio tables"])
+        body = {"weaknesses": ["ratio tables (stream test)"], "gradeLevel": "Grade 11"}
+
+        with client.stream("POST", "/api/learning-path/stream", json=body) as response:
+            assert response.status_code == 200
+            content = "".join(response.iter_text())
+
+        assert '"chunk": "1. Review "' in content
+        assert "event: end" in content
+
+        # The buffered endpoint now serves the streamed text from the shared cache
+        cached = client.post("/api/learning-path", json=body)
+        assert cached.headers["X-Cache"] == "HIT"
+        assert cached.json()["learningPath"] == "1. Review ratio tables"
+
+    @patch("main.ENABLE_RAG_ANALYSIS_CONTEXT", False)
+    @patch("main.call_hf_chat_stream")
+    def test_learning_path_stream_emits_error_event(self, mock_stream):
+        mock_stream.side_effect = Exception("HF stream down")
+
+        with client.stream("POST", "/api/learning-path/stream", json={
+            "weaknesses": ["stream failure topic"],
+            "gradeLevel": "Grade 11",
+        }) as response:
+            assert response.status_code == 200
+            content = "".join(response.iter_text())
+
+        assert "event: error" in content
+        assert "event: end" in content
+
 
 # ─── Daily Insight ─────────────────────────────────────────────
 
@@ -747,6 +902,33 @@ class TestDailyInsight:
         assert response.status_code == 200
         assert "No student data" in response.json()["insight"]
 
+    @patch("main.call_hf_chat")
+    def test_daily_insight_batch_keeps_class_order(self, mock_chat):
+        def _chat(messages, **kwargs):
+            # Classes run concurrently, so answer by content rather than call order
+            if "High-Risk Students: 1" in messages[-1]["content"]:
+                raise Exception("AI down")
+            return "Section A is improving."
+
+        mock_chat.side_effect = _chat
+        response = client.post("/api/analytics/daily-insight/batch", json={
+            "classes": [
+                {"students": [
+                    {"name": "Ana", "engagementScore": 61, "avgQuizScore": 72, "attendance": 93, "riskLevel": "Low"},
+                ]},
+                {"students": []},
+                {"students": [
+                    {"name": "Ben", "engagementScore": 38, "avgQuizScore": 47, "attendance": 71, "riskLevel": "High"},
+                ]},
+            ],
+        })
+        assert response.status_code == 200
+        assert [item["insight"] for item in response.json()] == [
+            "Section A is improving.",
+            "No student data available for analysis.",
+            "AI insight generation is temporarily unavailable.",
+        ]
+
 
 # ─── Quiz Topics ───────────────────────────────────────────────
 
@@ -1006,6 +1188,42 @@ class TestUploadClassRecordsGuardrails:
         assert class_metadata.get("gradeLevel") == "Grade 11"
         assert class_metadata.get("classification") == "Senior High School"
 
+    @patch("main.call_hf_chat")
+    def test_upload_class_records_skips_ai_mapper_for_known_headers(self, mock_chat):
+        files = {
+            "files": (
+                "records.csv",
+                (
+                    b"Student Name,LRN,Email Address,Quiz Score,Attendance,Engagement Score\n"
+                    b"Ana Cruz,1001,ana@example.com,81,92,88\n"
+                ),
+                "text/csv",
+            ),
+        }
+
+        response = client.post(
+            "/api/upload/class-records",
+            files=files,
+            data={"datasetIntent": "synthetic_student_records"},
+        )
+
+        assert response.status_code == 200
+        payload = response.json()
+        mock_chat.assert_not_called()
+        assert payload["columnMapping"] == {
+            "Student Name": "name",
+            "LRN": "lrn",
+            "Email Address": "email",
+            "Quiz Score": "avgQuizScore",
+            "Attendance": "attendance",
+            "Engagement Score": "engagementScore",
+        }
+        assert {item["mappingSource"] for item in payload["columnInterpretations"]} == {"fallback"}
+
+    def test_ambiguous_headers_are_left_for_the_ai_mapper(self):
+        # "Assessment" can be a score column or the assessment's name
+        assert main_module._exact_column_mapping(["Assessment", "Quiz Score"]) == {"Quiz Score": "avgQuizScore"}
+
     @patch("main.call_hf_chat", side_effect=Exception("mapper unavailable"))
     def test_upload_class_records_reports_explicit_row_rejections(self, _mock_chat):
         files = {
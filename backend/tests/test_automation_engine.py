@@ -0,0 +1,303 @@
+# backend/tests/test_automation_engine.py
+"""Tests for automation_engine.py event handlers."""
+import sys
+import os
+import asyncio
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import automation_engine
+from automation_engine import (
+    DataImportPayload,
+    DiagnosticCompletionPayload,
+    MathPulseAutomationEngine,
+    StudentEnrollmentPayload,
+)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_diagnostic_cache(monkeypatch):
+    monkeypatch.setattr(automation_engine, "_diagnostic_result_cache", automation_engine.OrderedDict())
+
+
+def _at_risk_payload() -> DiagnosticCompletionPayload:
+    return DiagnosticCompletionPayload(
+        studentId="s1",
+        results=[
+            {"subject": "Algebra", "score": 40},
+            {"subject": "Geometry", "score": 55},
+            {"subject": "Statistics", "score": 80},
+        ],
+        questionBreakdown={
+            "Linear Equations": [{"correct": False}, {"correct": False}, {"correct": True}],
+            "Triangles": [{"correct": True}, {"correct": True}],
+        },
+    )
+
+
+class TestDiagnosticCompletion:
+    def test_ai_calls_run_concurrently(self, monkeypatch):
+        engine = MathPulseAutomationEngine()
+        started: list[str] = []
+
+        async def fake_path(*args, **kwargs):
+            started.append("path")
+            await asyncio.sleep(0.01)
+            assert "interventions" in started
+            return "path"
+
+        async def fake_interventions(*args, **kwargs):
+            started.append("interventions")
+            await asyncio.sleep(0.01)
+            assert "path" in started
+            return "interventions"
+
+        monkeypatch.setattr(engine, "_generate_learning_path", fake_path)
+        monkeypatch.setattr(engine, "_generate_teacher_interventions", fake_interventions)
+
+        result = asyncio.run(engine.handle_diagnostic_completion(_at_risk_payload()))
+        assert result.learningPath == "path"
+        assert result.interventions == "interventions"
+        assert result.atRiskSubjects == ["Algebra", "Geometry"]
+        assert result.overallRisk == "Medium"
+        assert result.remedialQuizzesCreated == 2
+        assert [t["topic"] for t in result.weakTopics] == ["Linear Equations"]
+
+    def test_failed_ai_call_becomes_none(self, monkeypatch):
+        engine = MathPulseAutomationEngine()
+
+        async def failing(*args, **kwargs):
+            raise RuntimeError("inference down")
+
+        async def fake_interventions(*args, **kwargs):
+            return "interventions"
+
+        monkeypatch.setattr(engine, "_generate_learning_path", failing)
+        monkeypatch.setattr(engine, "_generate_teacher_interventions", fake_interventions)
+
+        result = asyncio.run(engine.handle_diagnostic_completion(_at_risk_payload()))
+        assert result.learningPath is None
+        assert result.interventions == "interventions"
+        # A degraded result is not cached, so a retry runs the pipeline again
+        assert not automation_engine._diagnostic_result_cache
+
+    def test_duplicate_submissions_share_one_run(self, monkeypatch):
+        engine = MathPulseAutomationEngine()
+        calls: list[str] = []
+
+        async def fake_path(*args, **kwargs):
+            calls.append("path")
+            await asyncio.sleep(0.01)
+            return "path"
+
+        async def fake_interventions(*args, **kwargs):
+            return "interventions"
+
+        monkeypatch.setattr(engine, "_generate_learning_path", fake_path)
+        monkeypatch.setattr(engine, "_generate_teacher_interventions", fake_interventions)
+
+        async def submit_twice_then_retry():
+            first, second = await asyncio.gather(
+                engine.handle_diagnostic_completion(_at_risk_payload()),
+                engine.handle_diagnostic_completion(_at_risk_payload()),
+            )
+            retry = await engine.handle_diagnostic_completion(_at_risk_payload())
+            return first, second, retry
+
+        first, second, retry = asyncio.run(submit_twice_then_retry())
+        assert first is second is retry
+        assert calls == ["path"]
+
+        # A different submission, or the same one after the TTL, is processed again
+        other = _at_risk_payload().model_copy(update={"gradeLevel": "Grade 9"})
+        asyncio.run(engine.handle_diagnostic_completion(other))
+        monkeypatch.setattr(automation_engine, "DIAGNOSTIC_RESULT_CACHE_TTL_SECONDS", 0)
+        asyncio.run(engine.handle_diagnostic_completion(_at_risk_payload()))
+        assert calls == ["path", "path", "path"]
+
+
+class TestWeakTopics:
+    def test_topics_sorted_weakest_first(self):
+        breakdown = {
+            "Fractions": [{"correct": True}, {"correct": False}, {"correct": False}],
+            "Empty": [],
+            "Ratios": [{"correct": False}, {"questionId": "q7"}, {"correct": False}, {"correct": True}],
+            "Angles": [{"correct": True}, {"correct": True}],
+        }
+        weak = MathPulseAutomationEngine._identify_weak_topics(
+            DiagnosticCompletionPayload(studentId="s1", results=[], questionBreakdown=breakdown).questionBreakdown
+        )
+        assert weak == [
+            {"topic": "Ratios", "accuracy": 0.25, "questionsAttempted": 4, "priority": "high"},
+            {"topic": "Fractions", "accuracy": 0.33, "questionsAttempted": 3, "priority": "medium"},
+        ]
+
+    def test_count_kernel_matches_loop(self):
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+        lengths = rng.integers(1, 20, size=15)
+        offsets = np.concatenate(([0], np.cumsum(lengths[:-1]))).astype(np.int64)
+        correct = (rng.random(int(lengths.sum())) < 0.5).astype(np.uint8)
+
+        expected = [int(correct[o:o + n].sum()) for o, n in zip(offsets, lengths)]
+        # Whichever implementation is active (numba or NumPy), plus the plain-python loop
+        for kernel in (automation_engine._topic_correct_counts, automation_engine._topic_correct_counts_loop):
+            assert kernel(correct, offsets).tolist() == expected
+
+
+class TestDataImport:
+    def test_risk_summary_counts_each_level(self):
+        rows = [
+            {"name": "Ana", "avgQuizScore": 50, "attendance": 70, "engagementScore": 90},
+            {"name": "Ben", "avgQuizScore": 54, "attendance": 95, "engagementScore": 60},
+            {"name": "Cy", "avgQuizScore": 70, "attendance": 80, "engagementScore": 90},
+            # Missing completion adds no flags; a non-numeric one counts as 0
+            {"name": "Di", "avgQuizScore": 80, "attendance": 90, "engagementScore": 80, "assignmentCompletion": ""},
+            {"name": " ", "avgQuizScore": "n/a", "attendance": 90, "engagementScore": 80, "assignmentCompletion": "x"},
+        ]
+        result = asyncio.run(
+            MathPulseAutomationEngine().handle_data_import(
+                DataImportPayload(teacherId="t1", students=rows, columnMapping={})
+            )
+        )
+        assert result.notifications[0] == "Data import flagged 3 high-risk student(s): Ana, Ben, Unknown"
+        assert result.notifications[1] == "Risk interpretation summary — High: 3, Medium: 1, Low: 1."
+
+    def test_empty_import(self):
+        result = asyncio.run(
+            MathPulseAutomationEngine().handle_data_import(
+                DataImportPayload(teacherId="t1", students=[], columnMapping={})
+            )
+        )
+        assert result.notifications == [
+            "Risk interpretation summary — High: 0, Medium: 0, Low: 0.",
+            "Data import complete — 0 student records processed.",
+        ]
+
+
+class TestStudentEnrollment:
+    def test_progress_skeleton_written_in_background(self, monkeypatch):
+        created: list[str] = []
+        monkeypatch.setattr(automation_engine, "_create_progress_skeleton", created.append)
+        payload = StudentEnrollmentPayload(studentId="s9", name="Ana", email="ana@example.com", teacherId="t1")
+
+        async def enroll():
+            result = await MathPulseAutomationEngine().handle_student_enrollment(payload)
+            # Responds before the write has run, and keeps the task referenced until it finishes
+            assert created == []
+            assert len(automation_engine._background_tasks) == 1
+            await asyncio.gather(*automation_engine._background_tasks)
+            return result
+
+        result = asyncio.run(enroll())
+        assert created == ["s9"]
+        assert not automation_engine._background_tasks
+        assert result.notifications[1] == "New student Ana enrolled — diagnostic pending."
+
+    def test_existing_progress_is_left_alone(self, monkeypatch):
+        from unittest.mock import MagicMock
+        from google.api_core.exceptions import AlreadyExists
+
+        progress_ref = MagicMock()
+        progress_ref.create.side_effect = AlreadyExists("progress/s9")
+        firestore = MagicMock()
+        firestore.client.return_value.collection.return_value.document.return_value = progress_ref
+        monkeypatch.setitem(sys.modules, "main", types.SimpleNamespace(
+            _firebase_ready=True, firebase_firestore=firestore, FIRESTORE_SERVER_TIMESTAMP="ts",
+        ))
+
+        automation_engine._create_progress_skeleton("s9")
+        progress_ref.create.assert_called_once()
+        progress_ref.set.assert_not_called()
+        progress_ref.get.assert_not_called()
+
+    def test_persistence_failure_is_logged_not_raised(self, monkeypatch):
+        def failing(student_id):
+            raise RuntimeError("firestore down")
+
+        monkeypatch.setattr(automation_engine, "_create_progress_skeleton", failing)
+        asyncio.run(automation_engine._persist_enrollment("s9"))
+
+
+class TestAIResponseCache:
+    def test_identical_prompts_reuse_completion(self, monkeypatch):
+        calls: list[int] = []
+
+        async def fake_chat(messages, *, max_tokens, temperature):
+            calls.append(max_tokens)
+            return f"completion-{len(calls)}"
+
+        monkeypatch.setattr(automation_engine, "_hf_chat_functions", (fake_chat, None))
+        monkeypatch.setattr(automation_engine, "_ai_response_cache", automation_engine.OrderedDict())
+        engine = MathPulseAutomationEngine()
+        topics = MathPulseAutomationEngine._format_weak_topic_lines([{"topic": "Linear Equations", "accuracy": 0.33}])
+        assert topics == "- Linear Equations (33% accuracy)"
+
+        first = asyncio.run(engine._generate_learning_path(["Algebra", "Geometry"], topics, "Grade 10"))
+        # Same subjects in a different order hit the same entry
+        second = asyncio.run(engine._generate_learning_path(["Geometry", "Algebra"], topics, "Grade 10"))
+        other_grade = asyncio.run(engine._generate_learning_path(["Algebra"], topics, "Grade 9"))
+
+        assert first == second == "completion-1"
+        assert other_grade == "completion-2"
+        assert len(calls) == 2
+
+    def test_failures_are_not_cached(self, monkeypatch):
+        outcomes = iter([RuntimeError("inference down"), "recovered"])
+
+        async def flaky_chat(messages, *, max_tokens, temperature):
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        monkeypatch.setattr(automation_engine, "_hf_chat_functions", (flaky_chat, None))
+        monkeypatch.setattr(automation_engine, "_ai_response_cache", automation_engine.OrderedDict())
+        engine = MathPulseAutomationEngine()
+        assert asyncio.run(engine._generate_teacher_interventions(["Algebra"], "")) is None
+        assert asyncio.run(engine._generate_teacher_interventions(["Algebra"], "")) == "recovered"
+
+    def test_nothing_to_report_skips_the_call(self, monkeypatch):
+        calls: list[int] = []
+
+        async def fake_chat(messages, *, max_tokens, temperature):
+            calls.append(max_tokens)
+            return "unexpected"
+
+        monkeypatch.setattr(automation_engine, "_hf_chat_functions", (fake_chat, None))
+        engine = MathPulseAutomationEngine()
+
+        assert asyncio.run(engine._generate_learning_path([], "", "Grade 10")) is None
+        assert asyncio.run(engine._generate_teacher_interventions([], "")) is None
+        assert calls == []
+
+    def test_streamed_chunks_are_forwarded_per_field(self, monkeypatch):
+        async def fake_stream(messages, *, max_tokens, temperature, task_type):
+            for delta in (f"{max_tokens}-a", f"{max_tokens}-b"):
+                yield delta
+
+        monkeypatch.setattr(automation_engine, "_hf_chat_functions", (None, fake_stream))
+        monkeypatch.setattr(automation_engine, "_ai_response_cache", automation_engine.OrderedDict())
+        received: list[tuple[str, str]] = []
+
+        async def on_chunk(field, delta):
+            received.append((field, delta))
+
+        engine = MathPulseAutomationEngine()
+        result = asyncio.run(engine.handle_diagnostic_completion(_at_risk_payload(), on_chunk=on_chunk))
+
+        assert result.learningPath == "1500-a1500-b"
+        assert result.interventions == "1000-a1000-b"
+        assert sorted(received) == [
+            ("interventions", "1000-a"), ("interventions", "1000-b"),
+            ("learningPath", "1500-a"), ("learningPath", "1500-b"),
+        ]
+
+        # A repeat is served from the cache as a single chunk per field
+        received.clear()
+        asyncio.run(engine.handle_diagnostic_completion(_at_risk_payload(), on_chunk=on_chunk))
+        assert sorted(received) == [("interventions", "1000-a1000-b"), ("learningPath", "1500-a1500-b")]